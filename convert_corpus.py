@@ -0,0 +1,24 @@
+import argparse
+
+from popbot_src.binary_corpus import is_binary_corpus, write_binary_corpus
+from popbot_src.indexing_common import load_sections
+
+argparser = argparse.ArgumentParser(description='Convert a parsed csv edition into a binary corpus'
+        ' directory (that can be read faster and memory-mapped), or a binary corpus back into csv.')
+argparser.add_argument('input_path', help='The csv file or the binary corpus directory.')
+argparser.add_argument('output_path', help='The binary corpus directory to write, for a csv'
+        ' input, or the csv file, for a binary corpus input.')
+argparser.add_argument('--lexicon', help='The lexicon directory giving the ids of forms, lemmas'
+        ' and tags to a new binary corpus (it will be created or extended). Corpora sharing a'
+        ' lexicon are joined faster.')
+
+args = argparser.parse_args()
+
+edition_sections = load_sections(args.input_path)
+if is_binary_corpus(args.input_path):
+    with open(args.output_path, 'w') as output_file:
+        for section in edition_sections:
+            for row in section.row_strings():
+                print(row, file=output_file)
+else:
+    write_binary_corpus(edition_sections, args.output_path, lexicon_path=args.lexicon)
@@ -1,8 +1,8 @@
 import argparse
-import re
 import enchant
 
-from popbot_src.indexing_common import load_indexed
+from popbot_src.indexing_common import load_sections
+from popbot_src.token_store import sections_store
 
 argparser = argparse.ArgumentParser(description='Correct a parsed (with Morfeusz&Conraft) csv file, using a dictionary generated with extract_dictionary.py and PyLucene spellchecking.')
 argparser.add_argument('indexed_file_path')
@@ -12,27 +12,6 @@ argparser.add_argument('--use_lemmas', action='store_true')
 
 args = argparser.parse_args()
 
-class Token():
-    def __init__(self, parsed_edition_str):
-        semantic_fields = parsed_edition_str.split('_')
-        self.proper_name = 'PN' in semantic_fields
-        self.unknown_form = '??' in semantic_fields
-        self.corrected = False
-        self.interp = '_'.join([f for f in semantic_fields if not f in ['PN', '??']]).split(':')
-        self.form = self.interp[0]
-        self.lemma = self.interp[1]
-        self.interp = ':'.join(self.interp[2:])
-
-    def __repr__(self):
-        repr_str = '{}:{}:{}'.format(self.form, self.lemma, self.interp)
-        if self.unknown_form:
-            repr_str = '??_' + repr_str
-        elif self.corrected:
-            repr_str = '!!_' + repr_str
-        if self.proper_name:
-            repr_str = 'PN_' + repr_str
-        return repr_str
-
 #
 # Load the dictionary of correct forms.
 #
@@ -89,29 +68,38 @@ def correct_word_with_lemma(word, tag):
                 pass
     return False, False
 
-with open(args.indexed_file_path) as sections_file:
-    edition_sections = load_indexed(sections_file)
+edition_sections = load_sections(args.indexed_file_path)
+store, _ = sections_store([section for section in edition_sections
+    if section.section_type == 'document'])
 
+# (form id, tag id) -> the correction and the new lemma, or False, for each unknown form checked.
+corrections = dict()
 for section in edition_sections:
     if section.section_type == 'document':
         new_pages_paragraphs = []
-        for (pg, par) in section.pages_paragraphs:
-            tokens = list(re.split('\\s', par))
-            tokens = [Token(t_str) for t_str in tokens if t_str.strip() != '']
-            new_pages_paragraphs.append((pg, ''))
-            for token in tokens:
+        for paragraph_n in store.section_paragraphs(section.store_section_n):
+            new_pages_paragraphs.append((int(store.paragraph_pages[paragraph_n]), ''))
+            for token_n in range(store.paragraph_offsets[paragraph_n],
+                    store.paragraph_offsets[paragraph_n+1]):
+                token = store.token(token_n)
                 if token.form.strip() != '' and token.unknown_form:
-                    if args.use_lemmas:
-                        correction, new_lemma = correct_word_with_lemma(token.form, token.interp)
-                    else:
-                        correction = correct_word(token.form, token.interp)
+                    key = (store.form_ids[token_n], store.tag_ids[token_n])
+                    if not key in corrections:
+                        if args.use_lemmas:
+                            corrections[key] = correct_word_with_lemma(token.form,
+                                    token.interp_str())
+                        else:
+                            corrections[key] = (correct_word(token.form, token.interp_str()),
+                                    False)
+                    correction, new_lemma = corrections[key]
                     if correction:
                         token.form = correction
                         if args.use_lemmas:
                             token.lemma = new_lemma
                         token.unknown_form = False
                         token.corrected = True
-                new_pages_paragraphs[-1] = (pg, new_pages_paragraphs[-1][1] + ' ' + repr(token))
+                new_pages_paragraphs[-1] = (new_pages_paragraphs[-1][0],
+                        new_pages_paragraphs[-1][1] + ' ' + repr(token))
         section.pages_paragraphs = new_pages_paragraphs
     # Print the section.
     for row in section.row_strings():
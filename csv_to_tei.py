@@ -6,7 +6,10 @@ import sys
 
 from popbot_src.load_helpers import join_linebreaks
 from popbot_src.indexing_common import load_indexed
-from popbot_src.parsing import pathed_sections
+from popbot_src.parse_cache import ParseCache
+from popbot_src.parsing import (
+        CHUNK_SIZE, init_analyzers, pathed_sections, read_base_config, release_analyzers
+        )
 from popbot_src.tei import write_tei_corpus
 
 logging.basicConfig(
@@ -29,6 +32,15 @@ argparser.add_argument('--leave_hyphens', action='store_true',
 argparser.add_argument('--dont_parse', action='store_true',
         help="Don't parse the edition with Morfeusz and Concraft, skip printing segmentation and "
         "morphosyntactic information.")
+argparser.add_argument('--workers', type=int, default=1,
+        help='The number of processes parsing the paragraphs in parallel, each with its own'
+        ' Morfeusz.')
+argparser.add_argument('--parse_cache',
+        help='Path to a cache file with results of parsing, so only the paragraphs not found there'
+        ' will be parsed.')
+argparser.add_argument('--parse_cache_mb', type=int, default=2048,
+        help='The size (in megabytes) above which the least recently used cache entries are'
+        ' evicted.')
 
 args = argparser.parse_args()
 
@@ -59,7 +71,18 @@ if not args.leave_hyphens:
 # Parse the edition unless this is turned off.
 pathed_edition_sections = False
 if not args.dont_parse:
-    pathed_edition_sections = pathed_sections(edition_sections)
+    if args.workers <= 1:
+        init_analyzers(with_paths=True)
+    parse_cache = False
+    if args.parse_cache:
+        parse_cache = ParseCache(args.parse_cache, read_base_config(), CHUNK_SIZE,
+                max_size=args.parse_cache_mb*1024**2)
+    pathed_edition_sections = pathed_sections(edition_sections, workers=args.workers,
+            cache=parse_cache)
+    release_analyzers()
+    if parse_cache:
+        print(parse_cache.stats())
+        parse_cache.close()
 
 # Print the TEI corpus.
 write_tei_corpus(args.output_tei_path, config['tei_code'], edition_sections,
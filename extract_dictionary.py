@@ -1,9 +1,8 @@
-import re
-from itertools import chain
 import argparse
+import numpy as np
 
-from popbot_src.indexing_common import load_indexed
-from popbot_src.parsed_token import ParsedToken
+from popbot_src.indexing_common import load_document_sections
+from popbot_src.token_store import UNKNOWN_FORM, sections_store
 
 argparser = argparse.ArgumentParser(description='Extract a dictionary of correct forms and morphosyntactical tags from a list of csv edition files, parsed with Morfeusz & Concraft.')
 argparser.add_argument('file_list_path')
@@ -16,25 +15,38 @@ sections = []
 with open(args.file_list_path) as list_file:
     for file_path in list_file.readlines():
         file_path = file_path.strip()
-        with open(file_path) as indexed_file:
-            sections += [sec for sec in load_indexed(indexed_file) if sec.section_type == 'document']
+        sections += load_document_sections(file_path)
 
-# token str -> a list of Concraft-approved interps
+store, section_ns = sections_store(sections)
+token_ns = store.token_indices(section_ns)
+form_ids, lemma_ids, tag_ids = (store.form_ids[token_ns], store.lemma_ids[token_ns],
+        store.tag_ids[token_ns])
 # Interps are useful because Concraft assigns them also to non-dictionary words.
+kept_tokens = np.array([form.strip() != '' for form in store.forms], dtype=bool)[form_ids]
+if not args.assume_all_correct:
+    kept_tokens &= (store.flags[token_ns] & UNKNOWN_FORM) == 0
+if args.store_lemmas:
+    # Number the distinct lemma:interp pairs.
+    interp_keys, interp_ids = np.unique(np.stack([lemma_ids, tag_ids], axis=1),
+            axis=0, return_inverse=True)
+    interp_strings = ['{}:{}'.format(store.lemmas[lemma_id], store.tags[tag_id])
+            for (lemma_id, tag_id) in interp_keys.tolist()]
+    interp_ids = interp_ids.ravel()
+else:
+    interp_strings, interp_ids = store.tags, tag_ids
+# Count the distinct (form, interp) pairs, noting where each form and pair first occurs.
+pairs, first_indices, pair_counts = np.unique(
+        np.stack([form_ids[kept_tokens], interp_ids[kept_tokens]], axis=1),
+        axis=0, return_index=True, return_counts=True)
+form_first_indices = dict()
+for (form_id, interp_id), first_index in zip(pairs.tolist(), first_indices.tolist()):
+    form_first_indices[form_id] = min(first_index, form_first_indices.get(form_id, first_index))
+# Dump the collected dictionary, with the forms in the order of appearance and the interps of
+# each form from the most frequent.
 interps_dictionary = dict()
-for section in sections:
-    tokens = chain.from_iterable([re.split('\\s', par) for (pg, par) in section.pages_paragraphs])
-    tokens = [ParsedToken.from_str(t_str) for t_str in tokens if t_str.strip() != '']
-    for t in tokens:
-        if t.form.strip() == '' or (t.unknown_form and not args.assume_all_correct):
-            continue
-        if not t.form in interps_dictionary:
-            interps_dictionary[t.form] = [ ((t.lemma+':') if args.store_lemmas else '')
-                    +':'.join(t.interp) ]
-        else:
-            interps_dictionary[t.form] += [ ((t.lemma+':') if args.store_lemmas else '')
-                    +':'.join(t.interp) ]
-
-# Dump the collected dictionary.
+for pair_n in sorted(range(len(pairs)), key=lambda pair_n: (form_first_indices[pairs[pair_n][0]],
+        -pair_counts[pair_n], first_indices[pair_n])):
+    form_id, interp_id = pairs[pair_n].tolist()
+    interps_dictionary.setdefault(store.forms[form_id], []).append(interp_strings[interp_id])
 for (form, interps) in interps_dictionary.items():
-    print('{} : {}'.format(form, list(set(interps))))
+    print('{} : {}'.format(form, interps))
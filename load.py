@@ -1,15 +1,30 @@
 import argparse
 import json
+import sys
 
+from popbot_src.heuristic_cache import CachedHeuristics, HeuristicCache
 from popbot_src.indexing_common import load_edition
 
 argparser = argparse.ArgumentParser(description='Load and index an edition of sejmik resolutions from scanned pages.')
 argparser.add_argument('config_file_path')
 argparser.add_argument('--manual_decisions_file', '-m', default=False)
+argparser.add_argument('--heuristic_cache',
+        help='Path to a cache file with results of the loading heuristics on paragraphs, so they'
+        ' are computed only for the paragraphs not found there.')
 
 args = argparser.parse_args()
 
-# keep the config and section variables for easier debugging in interactive mode
+# keep the config and section variables for easier debugging in interactive mode (otherwise the
+# sections are only streamed to the output)
 with open(args.config_file_path) as config_file:
     config = json.load(config_file)
-sections = load_edition(args.config_file_path, args.manual_decisions_file)
+heuristic_cache = False
+heuristics = None
+if args.heuristic_cache:
+    heuristic_cache = HeuristicCache(args.heuristic_cache)
+    heuristics = CachedHeuristics(config, heuristic_cache)
+sections = load_edition(args.config_file_path, args.manual_decisions_file,
+        keep_sections=bool(sys.flags.interactive), heuristics=heuristics)
+if heuristic_cache:
+    print(heuristic_cache.stats(), file=sys.stderr)
+    heuristic_cache.close()
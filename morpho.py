@@ -1,8 +1,16 @@
 import argparse
+import json
+import os
+import sys
 
-from popbot_src.indexing_common import load_indexed
-from popbot_src.parsing import parse_sentences
+from popbot_src.indexing_common import iter_indexed
+from popbot_src.parse_cache import ParseCache, model_identifier
+from popbot_src.parsing import (
+        CHUNK_SIZE, form_cache_stats, init_analyzers, parse_paragraphs, read_base_config,
+        release_analyzers, sentence_dedup_stats, stage_stats
+        )
 from popbot_src.load_helpers import join_linebreaks
+from popbot_src.perceptron import model_file_path
 
 argparser = argparse.ArgumentParser(description='Tag an indexed edition file with Morfeusz. You need to have morfeusz_analyzer and an appropriate Morfeusz dictionary.')
 argparser.add_argument('indexed_file_path')
@@ -10,32 +18,151 @@ argparser.add_argument('--strip_meta', action='store_true')
 argparser.add_argument('--leave_hyphens', action='store_true',
         help="Don't join the word broken by lines with hyphens")
 argparser.add_argument('--start_section', type=int, default=-1)
+argparser.add_argument('--concraft_server', action='store_true',
+        help='Keep one Concraft server running for the whole edition instead of running Concraft'
+        ' for each chunk of text.')
+argparser.add_argument('--workers', type=int, default=1,
+        help='The number of processes tagging the paragraphs in parallel, each with its own'
+        ' Morfeusz and Concraft.')
+argparser.add_argument('--parse_cache',
+        help='Path to a cache file with results of tagging, so only the paragraphs not found there'
+        ' will be tagged.')
+argparser.add_argument('--parse_cache_mb', type=int, default=2048,
+        help='The size (in megabytes) above which the least recently used cache entries are'
+        ' evicted.')
+argparser.add_argument('--tagger_batch', type=int, default=0,
+        help='Pack paragraphs, split at sentence boundaries, into Concraft requests of about this'
+        ' many characters of DAG, instead of tagging each paragraph in chunks of its own.')
+argparser.add_argument('--form_cache', type=int, default=0,
+        help='Remember the Morfeusz analyses of up to this many word forms, so the repeated forms'
+        ' are analysed only once.')
+argparser.add_argument('--fast_tagger',
+        help='Instead of Concraft, choose the interpretations most frequent in this dictionary file'
+        ' (made by extract_dictionary.py from tagged editions). This is much faster, but less'
+        ' accurate.')
+argparser.add_argument('--perceptron_model',
+        help='Instead of Concraft, tag with the perceptron model trained with train_tagger.py.')
+argparser.add_argument('--output',
+        help='Write the tagged edition to this file instead of the standard output, section by'
+        ' section, with a checkpoint file next to it. If the checkpoint is there, the tagging'
+        ' resumes after the last section written.')
 
 args = argparser.parse_args()
-start_section = False
 
-with open(args.indexed_file_path) as indexed_file:
-    sections = load_indexed(indexed_file)
+def edition_sections():
+    "Read the sections from the indexed file lazily, so the whole edition is never in memory."
+    with open(args.indexed_file_path) as indexed_file:
+        yield from iter_indexed(indexed_file)
+
+def read_checkpoint(checkpoint_path):
+    "Return the number of sections already written and the output size after them."
+    if not os.path.isfile(checkpoint_path):
+        return 0, 0
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    return checkpoint['sections'], checkpoint['offset']
+
+def write_checkpoint(checkpoint_path, sections_count, offset):
+    # Replace the checkpoint atomically, so a crash cannot leave it half-written.
+    with open(checkpoint_path + '.tmp', 'w') as checkpoint_file:
+        json.dump({ 'sections': sections_count, 'offset': offset }, checkpoint_file)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+# With an output file, resume after the sections recorded in its checkpoint.
+start_section = args.start_section
+if args.output:
+    checkpoint_path = args.output + '.checkpoint'
+    committed_sections, committed_offset = read_checkpoint(checkpoint_path)
+    if committed_sections > 0 and (not os.path.isfile(args.output)
+            or os.path.getsize(args.output) < committed_offset):
+        print('The output file does not match its checkpoint, tagging from the start.',
+                file=sys.stderr)
+        committed_sections = 0
+    if committed_sections > 0:
+        print('Resuming after {} sections already tagged.'.format(committed_sections),
+                file=sys.stderr)
+        output_file = open(args.output, 'r+b')
+        output_file.truncate(committed_offset) # drop anything written after the checkpoint
+        output_file.seek(committed_offset)
+    else:
+        output_file = open(args.output, 'wb')
+    start_section = max(start_section, committed_sections)
+
+def tagged_paragraphs(sections):
+    "Yield the document paragraphs that will be tagged, in their order in the edition."
+    for section_counter, section in enumerate(sections):
+        if section_counter < start_section or section.section_type != 'document':
+            continue
+        for (page, paragraph) in section.pages_paragraphs:
+            if len(paragraph.strip()) == 0:
+                continue
+            if not args.leave_hyphens:
+                paragraph = join_linebreaks(paragraph)
+            yield paragraph
+
+# Load the Morfeusz dictionary (and possibly the Concraft model) once for all the paragraphs.
+# Parallel workers load their own.
+if args.workers <= 1:
+    init_analyzers(with_concraft_server=args.concraft_server, form_cache_size=args.form_cache,
+            fast_tagger_table=args.fast_tagger, perceptron_model=args.perceptron_model)
+parse_cache = False
+if args.parse_cache:
+    # Paragraphs tagged in batches are never cut in chunks, only split into sentences.
+    tagging_settings = 'sentences' if args.tagger_batch else CHUNK_SIZE
+    # (the in-process taggers always tag in chunks)
+    if args.fast_tagger:
+        tagging_settings = '{}:fast_tagger:{}'.format(CHUNK_SIZE, model_identifier(args.fast_tagger))
+    elif args.perceptron_model:
+        tagging_settings = '{}:perceptron:{}'.format(CHUNK_SIZE,
+                model_identifier(model_file_path(args.perceptron_model)))
+    parse_cache = ParseCache(args.parse_cache, read_base_config(), tagging_settings,
+            max_size=args.parse_cache_mb*1024**2)
+# The paragraphs are read from the file separately from the sections written below, so neither
+# needs to keep the edition in memory.
+parsed_paragraphs = parse_paragraphs(tagged_paragraphs(edition_sections()),
+        workers=args.workers, with_concraft_server=args.concraft_server, cache=parse_cache,
+        tagger_batch_chars=args.tagger_batch, form_cache_size=args.form_cache,
+        fast_tagger_table=args.fast_tagger, perceptron_model=args.perceptron_model)
 
 section_counter = -1
-for section in sections:
+for section in edition_sections():
     section_counter += 1
-    if section_counter < args.start_section:
+    if section_counter < start_section:
         continue
     if section.section_type == 'document':
         new_pages_paragraphs = []
         for (page, paragraph) in section.pages_paragraphs:
             if len(paragraph.strip()) == 0:
                 continue
-            if not args.leave_hyphens:
-                paragraph = join_linebreaks(paragraph)
-            parsed_sentences = parse_sentences(paragraph)
+            parsed_sentences = next(parsed_paragraphs)
             parsed_paragraph = ''
             for sent in parsed_sentences:
                 parsed_paragraph += ' '.join([repr(token) for token in sent]) + '\n'
             new_pages_paragraphs.append((page, parsed_paragraph))
         section.pages_paragraphs = new_pages_paragraphs
-    if args.strip_meta and section.section_type == 'meta':
-        continue
-    for row in section.row_strings():
-        print(row)
+    if not (args.strip_meta and section.section_type == 'meta'):
+        for row in section.row_strings():
+            if args.output:
+                output_file.write((row + '\n').encode('utf-8'))
+            else:
+                print(row)
+    if args.output:
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        write_checkpoint(checkpoint_path, section_counter + 1, output_file.tell())
+
+for stats in form_cache_stats():
+    print(stats, file=sys.stderr)
+if args.workers <= 1:
+    print(stage_stats(), file=sys.stderr)
+    if args.tagger_batch:
+        print(sentence_dedup_stats(), file=sys.stderr)
+release_analyzers()
+if parse_cache:
+    print(parse_cache.stats(), file=sys.stderr)
+    parse_cache.close()
+if args.output:
+    output_file.close()
+    # The edition is complete, so another run should start from scratch.
+    if os.path.isfile(checkpoint_path):
+        os.remove(checkpoint_path)
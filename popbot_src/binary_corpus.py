@@ -0,0 +1,84 @@
+import json
+import os
+import numpy as np
+
+from popbot_src.lexicon import Lexicon, open_lexicon
+from popbot_src.section import Section, tuple_to_datetime
+from popbot_src.token_store import TokenStore
+
+# The arrays of TokenStore kept in the .npy files of a binary corpus.
+ARRAY_NAMES = ['form_ids', 'lemma_ids', 'tag_ids', 'flags', 'sentence_offsets',
+        'paragraph_offsets', 'section_offsets', 'paragraph_pages']
+# The Section attributes saved in sections.json.
+SECTION_ATTRIBUTES = ['book_title', 'inbook_section_id', 'inbook_document_id', 'section_type',
+        'palatinate', 'convent_location', 'created_location', 'author', 'pertinence']
+
+class StoredSection(Section):
+    """
+    A section read from a binary corpus. Its paragraph strings are made from the token store only
+    when they are needed.
+    """
+    @property
+    def pages_paragraphs(self):
+        if self.stored_pages_paragraphs is None:
+            store = self.token_store
+            self.stored_pages_paragraphs = [
+                    (int(store.paragraph_pages[paragraph_n]), store.paragraph_text(paragraph_n))
+                    for paragraph_n in store.section_paragraphs(self.store_section_n)]
+        return self.stored_pages_paragraphs
+
+    @pages_paragraphs.setter
+    def pages_paragraphs(self, pages_paragraphs):
+        self.stored_pages_paragraphs = pages_paragraphs
+
+def is_binary_corpus(path):
+    return os.path.isfile(os.path.join(path, 'sections.json'))
+
+def write_binary_corpus(sections, path, lexicon_path=False):
+    """
+    Write the sections to the path as a binary corpus: a directory with the token and offset
+    arrays of their TokenStore in .npy files and the section attributes in sections.json. The ids
+    are those of the lexicon saved at lexicon_path, if given (so the corpora written with it can
+    be joined without translating them), or of a lexicon saved in the directory.
+    """
+    lexicon = open_lexicon(lexicon_path) if lexicon_path else Lexicon()
+    store = TokenStore.from_sections(sections, keep_texts=True, lexicon=lexicon)
+    os.makedirs(path, exist_ok=True)
+    lexicon.save(lexicon_path or path)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(path, name + '.npy'), getattr(store, name))
+    sections_data = []
+    for section in sections:
+        section_data = dict([(name, getattr(section, name)) for name in SECTION_ATTRIBUTES])
+        section_data['date'] = ((section.date.day, section.date.month, section.date.year)
+                if section.date else False)
+        sections_data.append(section_data)
+    with open(os.path.join(path, 'sections.json'), 'w') as sections_file:
+        json.dump({ 'sections': sections_data,
+            'paragraph_texts': sorted(store.paragraph_texts.items()),
+            'lexicon': os.path.abspath(lexicon_path) if lexicon_path else False }, sections_file)
+
+def load_binary_corpus(path):
+    """
+    Load the sections of the binary corpus from the path. The token arrays of their TokenStore are
+    memory-mapped, so they are read from disk only when used and shared between processes.
+    """
+    with open(os.path.join(path, 'sections.json')) as sections_file:
+        sections_data = json.load(sections_file)
+    store = TokenStore(open_lexicon(sections_data['lexicon']) if sections_data['lexicon']
+            else Lexicon(path))
+    for name in ARRAY_NAMES:
+        setattr(store, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+    store.paragraph_texts = dict([(paragraph_n, paragraph)
+        for (paragraph_n, paragraph) in sections_data['paragraph_texts']])
+    for section_n, section_data in enumerate(sections_data['sections']):
+        section = StoredSection()
+        for name in SECTION_ATTRIBUTES:
+            setattr(section, name, section_data[name])
+        section.date = (tuple_to_datetime(section_data['date']) if section_data['date']
+                else False)
+        section.pages_paragraphs = None
+        section.token_store = store
+        section.store_section_n = section_n
+        store.sections.append(section)
+    return list(store.sections)
@@ -0,0 +1,142 @@
+import json
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from popbot_src.parsed_token import ParsedToken
+
+def linked_sentence(to_map, from_map, sent_start_index):
+    "Set the forward paths and sentence starts of the tokens of a sentence, and return them."
+    for token, to_index in to_map:
+        # (tokens at the end of sentence have no forward paths)
+        if to_index in from_map:
+            token.forward_paths = from_map[to_index]
+        token.sentence_starting = token.position == sent_start_index
+    return [token for (token, to_index) in to_map]
+
+def concraft_sentences(lines):
+    """
+    Read the lines of Concraft output (the tagged DAG) from any iterable, such as a stream, and
+    yield the sentences as lists of ParsedToken objects as soon as they end, with their
+    forward_paths set to the tokens that can follow them.
+    """
+    to_map, from_map = [], dict() # pairs (token, to_position), (from position) -> (tokens there)
+    sent_start_index = None # the lowest node number in the current sentence
+    # Store the already disambiguated paths to avoid repetitions in output.
+    decided_paths = set()
+    # Empty sentences are held back, because the last one is dropped.
+    empty_sents_count = 0
+    for line in lines:
+        if len(line.strip()) == 0: # end of sentence
+            if len(to_map) == 0:
+                empty_sents_count += 1
+            else:
+                for empty_sent_n in range(empty_sents_count):
+                    yield []
+                empty_sents_count = 0
+                yield linked_sentence(to_map, from_map, sent_start_index)
+            to_map, from_map, sent_start_index, decided_paths = [], dict(), None, set()
+            continue
+
+        # (the lines end with \r when read from a pexpect terminal)
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) != 12:
+            raise RuntimeError('Incorrect number of columns in Concraft output - {}, not 12:'
+                    ' {}'.format(len(fields), line))
+        from_index, to_index = int(fields[0]), int(fields[1])
+        if sent_start_index is None or from_index < sent_start_index:
+            sent_start_index = from_index
+        if fields[11] != 'disamb' or (from_index, to_index) in decided_paths:
+            continue
+        decided_paths.add((from_index, to_index))
+        token = ParsedToken(fields[2], fields[3], fields[4], position=from_index)
+        to_map.append((token, to_index))
+        if not from_index in from_map:
+            from_map[from_index] = []
+        from_map[from_index].append(token)
+
+    for empty_sent_n in range(empty_sents_count - (0 if to_map else 1)):
+        yield []
+    if to_map: # the output ended without an empty line
+        yield linked_sentence(to_map, from_map, sent_start_index)
+
+def parse_concraft_output(concraft_interp):
+    """
+    Given the text output of Concraft (the tagged DAG), return the sentences as lists of
+    ParsedToken objects, with their forward_paths set to the tokens that can follow them.
+    """
+    return list(concraft_sentences(concraft_interp.split('\n')))
+
+class ConcraftServer():
+    """
+    A long-lived Concraft process (started with concraft-pl server), which keeps its model loaded
+    and tags DAGs sent to it over a local HTTP socket. With spawn=False, it connects to a server
+    that is already running on the port.
+    """
+    def __init__(self, model_path, port=3000, host='localhost', spawn=True, startup_timeout=600):
+        self.model_path = model_path
+        self.port = port
+        self.host = host
+        self.spawn = spawn
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.stderr_file = None
+
+    def start(self):
+        if self.spawn and self.process is None:
+            # The server logs to stderr for as long as it runs, so a pipe (read only when it
+            # fails) could fill up and block it; the log goes to a temporary file instead.
+            self.stderr_file = tempfile.TemporaryFile()
+            self.process = subprocess.Popen(['concraft-pl', 'server', '--port', str(self.port),
+                '-i', self.model_path], stdout=subprocess.DEVNULL, stderr=self.stderr_file)
+        # Wait until the model is loaded and the server accepts connections.
+        start_time = time.time()
+        while True:
+            if self.process is not None and self.process.poll() is not None:
+                self.stderr_file.seek(0)
+                error_message = self.stderr_file.read().decode()
+                self.stop()
+                raise RuntimeError('the Concraft server has exited: {}'.format(error_message))
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() - start_time > self.startup_timeout:
+                    self.stop()
+                    raise RuntimeError('the Concraft server has not started in {} seconds'.format(
+                        self.startup_timeout))
+                time.sleep(0.5)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        if self.stderr_file is not None:
+            self.stderr_file.close()
+            self.stderr_file = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def tag(self, dag_str):
+        "Send the DAG string to the server and return the tagged DAG string."
+        request = urllib.request.Request('http://{}:{}/parse'.format(self.host, self.port),
+                data=json.dumps({'dag': dag_str}).encode('utf-8'),
+                headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read().decode('utf-8'))['dag']
+        except urllib.error.URLError as err:
+            raise RuntimeError('there was a Concraft server error: {}'.format(err))
+
+    def parse(self, dag_str):
+        "Tag the DAG string and return the sentences as lists of ParsedToken objects."
+        return parse_concraft_output(self.tag(dag_str))
@@ -0,0 +1,73 @@
+import ast
+
+from popbot_src.parsed_token import ParsedToken
+
+def read_interp_table(dictionary_path):
+    """
+    Read the dictionary made by extract_dictionary.py, as form -> the list of interps (possibly
+    preceded by lemmas), the most frequent first.
+    """
+    interp_table = dict()
+    with open(dictionary_path) as dict_file:
+        for row in dict_file:
+            row = row.strip()
+            if len(row) == 0:
+                continue
+            # The form is separated with ' : ' from the list, and can contain colons itself.
+            form, interps = row.split(' : ', 1)
+            interp_table[form] = ast.literal_eval(interps)
+    return interp_table
+
+class FastTagger():
+    """
+    A replacement for Concraft for quick, preliminary tagging. For each node in the Morfeusz DAG,
+    the tagger takes the position and variant that is ranked highest in the interp table for its
+    form. The variants of forms not found in the table are taken in the Morfeusz order.
+    """
+    def __init__(self, interp_table):
+        self.interp_table = interp_table
+
+    def variant_rank(self, morfeusz_dag, var_n):
+        "Return the rank of the variant in the interp table (lower is better), or None."
+        ranked_interps = self.interp_table.get(morfeusz_dag.forms[var_n])
+        if ranked_interps is None:
+            return None
+        tag = morfeusz_dag.tags[var_n]
+        lemma_tag = morfeusz_dag.lemmas[var_n] + ':' + tag
+        for rank, interp in enumerate(ranked_interps):
+            if interp == tag or interp == lemma_tag:
+                return rank
+        return None
+
+    def sentence(self, morfeusz_dag, first, end):
+        "Return the tokens chosen on one path through the sentence from first to end position."
+        tokens = []
+        pos_n = first
+        while pos_n < end:
+            # Choose among the positions starting at this node, and their variants.
+            node = morfeusz_dag.starts[pos_n]
+            best_var_n, best_pos_n, best_rank = None, None, None
+            while pos_n < end and morfeusz_dag.starts[pos_n] == node:
+                for var_n in range(morfeusz_dag.variant_offsets[pos_n],
+                        morfeusz_dag.variant_offsets[pos_n+1]):
+                    rank = self.variant_rank(morfeusz_dag, var_n)
+                    if best_var_n is None or (rank is not None
+                            and (best_rank is None or rank < best_rank)):
+                        best_var_n, best_pos_n, best_rank = var_n, pos_n, rank
+                pos_n += 1
+            token = ParsedToken(morfeusz_dag.forms[best_var_n], morfeusz_dag.lemmas[best_var_n],
+                    morfeusz_dag.tags[best_var_n], position=node)
+            if tokens:
+                tokens[-1].forward_paths = [token]
+            else:
+                token.sentence_starting = True
+            tokens.append(token)
+            # Skip the positions that the chosen one goes over.
+            while pos_n < end and morfeusz_dag.starts[pos_n] < morfeusz_dag.ends[best_pos_n]:
+                pos_n += 1
+        return tokens
+
+    def tag(self, morfeusz_dag, sentence_bounds):
+        """Return the sentences, given as position ranges of the MorfeuszDAG, as lists of
+        ParsedToken objects (like parse_concraft_output)."""
+        return [self.sentence(morfeusz_dag, first, end) for (first, end) in sentence_bounds]
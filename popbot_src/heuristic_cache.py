@@ -0,0 +1,119 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import time
+
+from popbot_src import load_helpers
+from popbot_src.load_helpers import ParagraphHeuristics
+
+# The config keys that the results of each cached heuristic depend on.
+HEURISTIC_CONFIG_KEYS = {
+        'ocr_corrected': [],
+        'is_meta_fragment': ['max_nonmeta_line_len'],
+        'heading_score': ['max_heading_len', 'heading_length_discount'],
+        'extract_dates': []
+        }
+
+def load_helpers_identifier():
+    """
+    Identify the version of load_helpers by the hash of its source, so any change to its pattern
+    tables (or the heuristics themselves) makes the cached results invalid.
+    """
+    with open(load_helpers.__file__, 'rb') as source_file:
+        return hashlib.sha256(source_file.read()).hexdigest()
+
+class HeuristicCache():
+    """
+    An on-disk (SQLite) cache of the results of the loader heuristics (OCR corrections, meta
+    fragment and heading detection, date extraction) on paragraphs, keyed by the hash of the
+    function name, the config values that it uses and the exact paragraph. The entries are
+    removed when the cache is opened with a changed load_helpers. The new entries are committed
+    every commit_every entries or commit_interval seconds, so they are kept also when the run is
+    interrupted.
+    """
+    def __init__(self, path, commit_every=1000, commit_interval=10.0):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.last_commit = time.time()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY,'
+                ' value BLOB)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY,'
+                ' value TEXT)')
+        identifier = load_helpers_identifier()
+        row = self.connection.execute("SELECT value FROM settings WHERE name = 'load_helpers'"
+                ).fetchone()
+        if row is None or row[0] != identifier:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.execute("INSERT OR REPLACE INTO settings VALUES ('load_helpers', ?)",
+                    (identifier,))
+            self.connection.commit()
+
+    def key(self, function_name, paragraph, config):
+        key_str = '|'.join([function_name,
+            json.dumps([config.get(key) for key in HEURISTIC_CONFIG_KEYS[function_name]]),
+            paragraph])
+        return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM entries WHERE key = ?',
+                (key,)).fetchone() is not None
+
+    def through(self, function_name, paragraph, config, compute):
+        """
+        Return the result of the heuristic for the paragraph, from the cache or from compute
+        (called with the paragraph), storing it in the latter case.
+        """
+        key = self.key(function_name, paragraph, config)
+        row = self.connection.execute('SELECT value FROM entries WHERE key = ?',
+                (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            return pickle.loads(row[0])
+        self.misses += 1
+        result = compute(paragraph)
+        self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                (key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.uncommitted += 1
+        if (self.uncommitted >= self.commit_every
+                or time.time() - self.last_commit >= self.commit_interval):
+            self.commit()
+        return result
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+        self.last_commit = time.time()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return 'Heuristic cache: {} hits, {} misses ({:.1f}% hit rate).'.format(self.hits,
+                self.misses, (100 * self.hits / lookups) if lookups else 0.0)
+
+class CachedHeuristics(ParagraphHeuristics):
+    "The loader heuristics for the edition config, taken from the cache when possible."
+    def __init__(self, config, cache):
+        super().__init__(config)
+        self.cache = cache
+
+    def ocr_corrected(self, paragraph):
+        return self.cache.through('ocr_corrected', paragraph, self.config, super().ocr_corrected)
+
+    def is_meta_fragment(self, paragraph):
+        return self.cache.through('is_meta_fragment', paragraph, self.config,
+                super().is_meta_fragment)
+
+    def heading_score(self, paragraph):
+        return self.cache.through('heading_score', paragraph, self.config, super().heading_score)
+
+    def extract_dates(self, string):
+        return self.cache.through('extract_dates', string, self.config, super().extract_dates)
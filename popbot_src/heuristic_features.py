@@ -0,0 +1,88 @@
+import numpy as np
+
+from popbot_src.indexing_common import edition_page_paths, iter_edition_paragraphs
+from popbot_src.load_helpers import (
+        ParagraphHeuristics, doc_beginning_score, heading_score, is_meta_fragment
+        )
+
+class HeuristicFeatures():
+    """
+    The features of the distinct paragraphs of an edition, as NumPy arrays with one value for each
+    paragraph (in the order of the paragraphs list). They hold everything that the meta fragment
+    and heading heuristics take from the paragraphs, so these can be computed for many settings of
+    the edition config at once, as rows of matrices. The settings are dicts with the config values
+    that are changed from the edition config.
+    """
+    def __init__(self, paragraphs, config):
+        self.paragraphs = paragraphs
+        self.paragraph_ns = dict([(paragraph, paragraph_n)
+            for (paragraph_n, paragraph) in enumerate(paragraphs)])
+        self.config = config
+        self.lengths = np.array([len(paragraph) for paragraph in paragraphs], dtype=np.int32)
+        self.max_line_lengths = np.array([max([len(line) for line in paragraph.split('\n')])
+            for paragraph in paragraphs], dtype=np.int32)
+        # (the heading heuristic sees the paragraphs without hyphens)
+        self.heading_lengths = np.array([len(paragraph.replace('-', ''))
+            for paragraph in paragraphs], dtype=np.int32)
+        # The parts of the heuristics that don't depend on the settings: the heading score before
+        # the length discount, and being meta regardless of the line lengths.
+        unbounded_config = dict(config, max_heading_len=np.inf, max_nonmeta_line_len=np.inf)
+        self.heading_signs = np.array([heading_score(paragraph, unbounded_config,
+            length_discount=np.inf) for paragraph in paragraphs])
+        self.meta_otherwise = np.array([is_meta_fragment(paragraph, unbounded_config)
+            for paragraph in paragraphs])
+        self.doc_beginning_scores = np.array([doc_beginning_score(paragraph, config)
+            for paragraph in paragraphs])
+
+    @classmethod
+    def from_config(cls, config):
+        "Compute the features of the paragraphs that the loader reads from the edition."
+        paragraphs = [paragraph for (page_n, paragraph)
+                in iter_edition_paragraphs(config, edition_page_paths(config)) if paragraph]
+        return cls(list(dict.fromkeys(paragraphs)), config)
+
+    def setting_values(self, settings, key, default=None):
+        "Return an array of the values of the config key in the settings."
+        return np.array([setting[key] if key in setting
+            else (self.config[key] if default is None else self.config.get(key, default))
+            for setting in settings])
+
+    def meta_matrix(self, settings):
+        "Return the boolean matrix telling which paragraphs are meta fragments in the settings."
+        max_line_lengths = self.setting_values(settings, 'max_nonmeta_line_len')
+        return (self.meta_otherwise[np.newaxis, :]
+                | (self.max_line_lengths[np.newaxis, :] > max_line_lengths[:, np.newaxis]))
+
+    def heading_matrix(self, settings):
+        "Return the matrix of the heading scores of the paragraphs in the settings."
+        max_heading_lengths = self.setting_values(settings, 'max_heading_len')
+        length_discounts = self.setting_values(settings, 'heading_length_discount', default=70)
+        return np.where((self.lengths[np.newaxis, :] < 15)
+                | (self.lengths[np.newaxis, :] > max_heading_lengths[:, np.newaxis]),
+                -1.5,
+                self.heading_signs[np.newaxis, :]
+                - self.heading_lengths[np.newaxis, :] / length_discounts[:, np.newaxis])
+
+    def heuristics(self, meta_fragments, heading_scores):
+        """
+        Return the heuristics for the loader (see iter_edition) from the rows of the meta and
+        heading matrices for one setting.
+        """
+        return FeatureHeuristics(self, meta_fragments, heading_scores)
+
+class FeatureHeuristics(ParagraphHeuristics):
+    "The loader heuristics looked up in the precomputed scores of the paragraphs."
+    def __init__(self, features, meta_fragments, heading_scores):
+        super().__init__(features.config)
+        self.features = features
+        self.meta_fragments = meta_fragments
+        self.heading_scores = heading_scores
+
+    def is_meta_fragment(self, paragraph):
+        return bool(self.meta_fragments[self.features.paragraph_ns[paragraph]])
+
+    def heading_score(self, paragraph):
+        return float(self.heading_scores[self.features.paragraph_ns[paragraph]])
+
+    def doc_beginning_score(self, paragraph):
+        return float(self.features.doc_beginning_scores[self.features.paragraph_ns[paragraph]])
@@ -1,33 +1,41 @@
 import csv, os, re, sys
-from collections import defaultdict
 
 csv.field_size_limit(100000000)
 
+from popbot_src.binary_corpus import is_binary_corpus, load_binary_corpus
 from popbot_src.section import Section
-from popbot_src.load_helpers import (
-        heading_score, doc_beginning_score, is_meta_fragment, fuzzy_match, ocr_corrected
-        )
+from popbot_src.load_helpers import ParagraphHeuristics, normalized_key
 from popbot_src.indexing_helpers import (
-        read_config_file, read_manual_decisions, commit_doc_with_decisions
+        DecisionIndex, read_config_file, read_manual_decisions, commit_doc_with_decisions
         )
 
-def load_indexed(csv_file):
-    "Load all sections from a file stream."
-    edition_sections = []
+def iter_indexed(csv_file):
+    "Yield sections from a file stream one by one, as soon as each of them is read completely."
+    section = None
     csv_reader = csv.reader(csv_file)
     for row in csv_reader:
-        appended = False
-        if len(edition_sections) > 0:
-            appended = edition_sections[-1].append_csv_row(row)
-        if not appended:
-            section = Section.from_csv_row(row)
-            edition_sections.append(section)
-    return edition_sections 
+        if section is not None and section.append_csv_row(row):
+            continue
+        if section is not None:
+            yield section
+        section = Section.from_csv_row(row)
+    if section is not None:
+        yield section
+
+def load_indexed(csv_file):
+    "Load all sections from a file stream."
+    return list(iter_indexed(csv_file))
+
+def load_sections(path):
+    "Load all sections from the given path, of a csv file or a binary corpus."
+    if is_binary_corpus(path):
+        return load_binary_corpus(path)
+    with open(path) as csv_file:
+        return load_indexed(csv_file)
 
 def load_document_sections(csv_path, print_titles=False):
-    "Load only document sections from the given path."
-    with open(csv_path) as csv_file:
-        edition_sections = load_indexed(csv_file)
+    "Load only document sections from the given path (of a csv file or a binary corpus)."
+    edition_sections = load_sections(csv_path)
     document_sections = []
     for section in edition_sections:
         if section.section_type == 'document':
@@ -38,58 +46,143 @@ def load_document_sections(csv_path, print_titles=False):
                 print(pertinence_sign + section.title())
     return document_sections
 
-def load_edition(config_file_path, manual_decisions_file=False, output_stream=sys.stdout):
+class SectionWindow():
+    """
+    The latest sections of an edition being loaded, used by load_edition as the list of sections
+    (by join_to_list and the merging functions). The earlier sections, which cannot be changed
+    anymore, are released from it, but its length still counts them, so the sections get their
+    inbook ids as if the whole list was kept.
+    """
+    def __init__(self):
+        self.sections = []
+        self.released_count = 0
+
+    def __len__(self):
+        return self.released_count + len(self.sections)
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __reversed__(self):
+        return reversed(self.sections)
+
+    def append(self, section):
+        self.sections.append(section)
+
+    def release(self, preceding_keys=set(), everything=False):
+        """
+        Remove and return the sections that no merge can change anymore. These are the ones before
+        the latest document section and before the first document section where one of the merge
+        decisions that may still be applied could insert paragraphs, matching its preceding
+        fragment (preceding_keys are these fragments, normalized with normalized_key). The merges
+        search only the document sections from the end of the list, passing over the ones that
+        don't match, so the released sections would be never reached.
+        """
+        if everything:
+            kept_n = len(self.sections)
+        else:
+            doc_ns = [sec_n for (sec_n, section) in enumerate(self.sections)
+                    if section.section_type == 'document']
+            kept_n = doc_ns[-1] if doc_ns else len(self.sections)
+            for sec_n in doc_ns[:-1]:
+                if [paragraph for (page, paragraph) in self.sections[sec_n].pages_paragraphs
+                        if normalized_key(paragraph[-80:]) in preceding_keys]:
+                    kept_n = sec_n
+                    break
+        released = self.sections[:kept_n]
+        self.sections = self.sections[kept_n:]
+        self.released_count += len(released)
+        return released
+
+def edition_page_paths(config):
+    "Return the paths of the page files of the edition, in their order."
+    page_paths = []
+    for dirname, dirnames, filenames in os.walk(config['path']):
+        filenames = sorted(filenames)
+        for filename in filenames:
+            if re.match('^'+config['prefix'], filename):
+                page_paths.append(dirname + filename)
+    return page_paths
+
+def iter_page_texts(page_paths):
+    "Yield the texts of the page files one by one, reading each of them only when it's needed."
+    for page_path in page_paths:
+        with open(page_path) as text_file:
+            yield text_file.read()
+
+def merged_short_documents(sections):
+    """
+    Join the very short document sections from the sections iterable with the next ones, which are
+    usually the same sections in the editions that we split unnecessarily. The sections are
+    yielded as soon as nothing can be joined to them anymore, so only the latest document section
+    (and the meta sections after it) are held at a time. The inbook ids are not changed.
+    """
+    held_sections = []
+    merge_next = False
+    for section in sections:
+        if section.section_type == 'document' and merge_next:
+            # The held document section is the target also for the cascading merges.
+            held_sections[0].pages_paragraphs += section.pages_paragraphs
+            merge_next = False
+        elif section.section_type == 'document':
+            yield from held_sections
+            held_sections = [section]
+        else:
+            held_sections.append(section)
+        if (section.section_type == 'document'
+                and (len(section.pages_paragraphs) == 1 or len(section.collapsed_text()) < 250)):
+            merge_next = True
+    yield from held_sections
+
+def iter_edition(config_file_path, manual_decisions_file=False, heuristics=None):
     """
-    Load the edition, using config_file_path, as a list of Section objects.
+    Load the edition, using config_file_path, yielding Section objects in their order. The page
+    files are read one by one and each section is yielded when no merge can change it anymore, so
+    only the sections that can be still merged to are kept in memory.
+
+    The heuristics for meta fragments and headings are computed for the edition config, unless
+    another ParagraphHeuristics object is given (such as one with precomputed scores).
     """
     # Load the config
     config = read_config_file(config_file_path)
+    if heuristics is None:
+        heuristics = ParagraphHeuristics(config)
 
     # Load the manual decisions.
-    manual_decisions = defaultdict(list)
+    manual_decisions = DecisionIndex()
     if manual_decisions_file:
         manual_decisions = read_manual_decisions(manual_decisions_file)
+    # (page, normalized preceding fragment) pairs for the merge decisions, which can make us keep
+    # earlier sections. The decisions without a preceding fragment can never match.
+    merge_decisions = sorted([(page, manual_decisions.key(decision, 'preceding_fragm'))
+        for page in manual_decisions for decision in manual_decisions[page]
+        if decision.decision_type == 'merge_sections'
+        and manual_decisions.key(decision, 'preceding_fragm') is not None], key=lambda x: x[0])
 
-    # Load all the files.
-    pages = [] # as lists of lines
-    page_filenames = dict()
-    file_n = 0
-    for dirname, dirnames, filenames in os.walk(config['path']):
-        filenames = sorted(filenames)
-        for filename in filenames:
-            if re.match('^'+config['prefix'], filename):
-                page_filenames[file_n] = filename
-                file_n += 1
-                with open(dirname + filename) as text_file:
-                    pages.append(text_file.read())
+    sections = iter_loaded_sections(config, manual_decisions, merge_decisions, heuristics)
+    # If there are no manual decisions, join the very short document sections with the next ones.
+    if not manual_decisions_file:
+        sections = merged_short_documents(sections)
+    yield from sections
 
-    # Process content lines for files sequentially.
-    # We accumulate lines here until a heading or short line:
-    current_document_paragraphs = [] # pairs (pagenum, paragraph)
-    # NOTE New sections should be added only with their join_to_list method.
-    sections = []
-    # Meta sections found after a title are added after the whole document, so
-    # they can be merged if needed.
-    meta_sections_buffer = []
-    current_document_id = 0
-    # We need to keep track of section index of the latest document section,
-    # because we may want to merge subsequent sections to it.
-    latest_doc_section_n = False
-    # We keep the score to use it with beginning paragraph detection.
-    previous_heading_score = 0
-    possible_heading = False
-    possible_heading_page = False
-    for page_n, page in enumerate(pages):
+def iter_edition_paragraphs(config, page_paths, heuristics=None):
+    """
+    Yield the (page number, paragraph) pairs of the edition, as split, corrected (with the
+    heuristics, by default the ones for the config) and stripped by the loader (also the empty
+    paragraphs, which are skipped by it). The ignored pages are left out.
+    """
+    if heuristics is None:
+        heuristics = ParagraphHeuristics(config)
+    for page_n, page in enumerate(iter_page_texts(page_paths)):
         ignored_page = False
         if 'ignore_page_ranges' in config:
-            true_n = int(page_filenames[page_n].split('-')[1].split('.')[0])
+            true_n = int(os.path.basename(page_paths[page_n]).split('-')[1].split('.')[0])
             for page_range in config['ignore_page_ranges']:
                 if true_n >= page_range[0] and true_n < page_range[1]:
                     ignored_page = True
         if ignored_page:
             continue
         paragraphs = page.split('\n\n')
-        page_decisions = manual_decisions[page_n]
         split_paragraphs = []
         if 'min_inparagraph_line_len' in config:
             for pi, paragraph in enumerate(paragraphs):
@@ -102,104 +195,121 @@ def load_edition(config_file_path, manual_decisions_file=False, output_stream=sy
                 if last_split != len(lines):
                     split_paragraphs.append('\n'.join(lines[last_split:]))
             paragraphs = split_paragraphs
-        paragraphs = [ocr_corrected(p) for p in paragraphs]
+        paragraphs = [heuristics.ocr_corrected(p) for p in paragraphs]
         for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if len(paragraph) == 0:
-                continue
-            commit_previous = False # we need to do that if we've encountered a heading
-            new_title = False # we will store it here to set after commiting the previous one
-            meta = False # depends on detection and possibly a manual decision
-            if is_meta_fragment(paragraph, config):
-                meta = True
-                section = Section.new(config, 'meta', [(page_n, paragraph)])
-                # A meta section is one paragraph long and cannot be split, but it
-                # can be merged.
-                for decision in page_decisions:
-                    # Section type decisions.
-                    if (decision.decision_type == 'type'
-                            and decision.section_type == 'document'
-                            and fuzzy_match(decision.from_title, paragraph)):
-                        # This will send the paragraph to document paragraphs handling.
-                        meta = False
-                        break
-                    # Title form decisions.
-                    if (decision.decision_type == 'title_form' 
-                            and fuzzy_match(decision.from_title, paragraph)):
-                        section.pages_paragraphs[0] = (section.pages_paragraphs[0][0], decision.to_title)
-                if meta:
-                    meta_sections_buffer.append(section)
-            if not meta:
-                # If it's not meta, handle the case where there might have been a heading previosly.
-                # Note that all document paragraphs pass through here
-                if possible_heading:
-                    if (previous_heading_score
-                            + max(0, doc_beginning_score(paragraph, config))) > 0:
-                        commit_previous = True
-                        new_title = ocr_corrected(possible_heading)
-                        # The new title will be added to the next document's paragraphs
-                        # when we commit the current one.
-                    # If there's no chance for a heading, add it to the current
-                    # document section.
-                    else:
-                        # Since the section wasn't yet created, we don't need to go
-                        # through the .add_text Section method, it will be called later
-                        current_document_paragraphs.append((possible_heading_page, possible_heading))
-                    possible_heading = False
-                # Commit the previous document, without what we decided to be a heading.
-                if commit_previous:
-                    commit_previous = False
-                    if len(current_document_paragraphs) > 0:
-                        current_document_id, latest_doc_section_n = commit_doc_with_decisions(
-                                config, sections, current_document_paragraphs, manual_decisions,
-                                meta_sections_buffer, current_document_id, latest_doc_section_n)
-                    current_document_paragraphs = [(possible_heading_page, ocr_corrected(new_title))]
-                if "heading_length_discount" in config:
-                    heading_score_estimation = heading_score(paragraph, config,
-                            length_discount=config["heading_length_discount"])
+            yield page_n, paragraph.strip()
+
+def iter_loaded_sections(config, manual_decisions, merge_decisions, heuristics):
+    """
+    Yield the sections of the edition as indexed from its page files, applying the decisions and
+    using the heuristics (a ParagraphHeuristics object) to recognize the meta fragments and headings.
+    """
+    page_paths = edition_page_paths(config)
+
+    # Process content lines for files sequentially.
+    # We accumulate lines here until a heading or short line:
+    current_document_paragraphs = [] # pairs (pagenum, paragraph)
+    # NOTE New sections should be added only with their join_to_list method.
+    sections = SectionWindow()
+    # Meta sections found after a title are added after the whole document, so
+    # they can be merged if needed.
+    meta_sections_buffer = []
+    current_document_id = 0
+    # We need to keep track of section index of the latest document section,
+    # because we may want to merge subsequent sections to it.
+    latest_doc_section_n = False
+    # We keep the score to use it with beginning paragraph detection.
+    previous_heading_score = 0
+    possible_heading = False
+    possible_heading_page = False
+    for page_n, paragraph in iter_edition_paragraphs(config, page_paths, heuristics):
+        if len(paragraph) == 0:
+            continue
+        commit_previous = False # we need to do that if we've encountered a heading
+        new_title = False # we will store it here to set after commiting the previous one
+        meta = False # depends on detection and possibly a manual decision
+        if heuristics.is_meta_fragment(paragraph):
+            meta = True
+            section = Section.new(config, 'meta', [(page_n, paragraph)])
+            # A meta section is one paragraph long and cannot be split, but it
+            # can be merged.
+            for decision in manual_decisions.matching([page_n], ['type', 'title_form'], paragraph):
+                # Section type decisions.
+                if (decision.decision_type == 'type'
+                        and decision.section_type == 'document'):
+                    # This will send the paragraph to document paragraphs handling.
+                    meta = False
+                    break
+                # Title form decisions.
+                if decision.decision_type == 'title_form':
+                    section.pages_paragraphs[0] = (section.pages_paragraphs[0][0], decision.to_title)
+            if meta:
+                meta_sections_buffer.append(section)
+        if not meta:
+            # If it's not meta, handle the case where there might have been a heading previosly.
+            # Note that all document paragraphs pass through here
+            if possible_heading:
+                if (previous_heading_score
+                        + max(0, heuristics.doc_beginning_score(paragraph))) > 0:
+                    commit_previous = True
+                    new_title = heuristics.ocr_corrected(possible_heading)
+                    # The new title will be added to the next document's paragraphs
+                    # when we commit the current one.
+                # If there's no chance for a heading, add it to the current
+                # document section.
                 else:
-                    heading_score_estimation = heading_score(paragraph, config)
-                previous_heading_score = heading_score_estimation
-                possible_heading = paragraph
-                possible_heading_page = page_n
+                    # Since the section wasn't yet created, we don't need to go
+                    # through the .add_text Section method, it will be called later
+                    current_document_paragraphs.append((possible_heading_page, possible_heading))
+                possible_heading = False
+            # Commit the previous document, without what we decided to be a heading.
+            if commit_previous:
+                commit_previous = False
+                if len(current_document_paragraphs) > 0:
+                    current_document_id, latest_doc_section_n = commit_doc_with_decisions(
+                            config, sections, current_document_paragraphs, manual_decisions,
+                            meta_sections_buffer, current_document_id, latest_doc_section_n,
+                            heuristics=heuristics)
+                current_document_paragraphs = [(possible_heading_page,
+                    heuristics.ocr_corrected(new_title))]
+                # The merge decisions may still apply to the paragraphs that are not yet
+                # committed.
+                first_open_page = min([possible_heading_page]
+                        + [meta_section.pages_paragraphs[0][0]
+                            for meta_section in meta_sections_buffer])
+                yield from sections.release(set([preceding_key
+                    for (page, preceding_key) in merge_decisions if page >= first_open_page]))
+            previous_heading_score = heuristics.heading_score(paragraph)
+            possible_heading = paragraph
+            possible_heading_page = page_n
     # If something remains in the document buffer, commit it.
     if possible_heading:
         if config['ignore_page_ranges']:
             last_page = config['ignore_page_ranges'][-1][0]
         else:
-            last_page = len(pages) - 1
+            last_page = len(page_paths) - 1
         current_document_paragraphs.append((last_page, paragraph))
     # Commit the last document, if we do have some paragraphs for it.
     if len(current_document_paragraphs) > 0:
         current_document_id, latest_doc_section_n = commit_doc_with_decisions(
                 config, sections, current_document_paragraphs, manual_decisions,
-                meta_sections_buffer, current_document_id, latest_doc_section_n)
+                meta_sections_buffer, current_document_id, latest_doc_section_n,
+                heuristics=heuristics)
+    yield from sections.release(everything=True)
 
-    # If there are no manual decisions, join the very short document sections with the next ones,
-    # which are usually the same sections in the editions that we split unnecessarily.
-    if not manual_decisions_file:
-        merge_next = False
-        deletions = []
-        for sec_n, section in enumerate(sections):
-            if section.section_type == 'document' and merge_next:
-                deletions.append(sec_n)
-                merging_n = sec_n
-                # Since the target section might be already marked for deletion, we sometimes
-                # need to cascade the merges.
-                while merging_n in deletions:
-                    # Use the first char of section type as little hack to use str rindex.
-                    merging_n = ''.join([sec.section_type[0] for sec in sections[:merging_n]]).rindex('d')
-                sections[merging_n].pages_paragraphs += section.pages_paragraphs
-                merge_next = False
-
-            if (section.section_type == 'document'
-                    and (len(section.pages_paragraphs) == 1 or len(section.collapsed_text()) < 250)):
-                merge_next = sec_n + 1 # avoid zero
-        sections = [section for (sec_n, section) in enumerate(sections) if not sec_n in deletions]
-
-    # Print collected sections as csv rows.
-    for section in sections:
+def load_edition(config_file_path, manual_decisions_file=False, output_stream=sys.stdout,
+        keep_sections=True, heuristics=None):
+    """
+    Load the edition, using config_file_path, writing the sections as csv rows to the
+    output_stream as soon as they are ready. Return the list of Section objects, or None if
+    keep_sections is False (then the whole edition is not held in memory). The heuristics are
+    passed to iter_edition.
+    """
+    kept_sections = []
+    for section in iter_edition(config_file_path, manual_decisions_file, heuristics=heuristics):
+        # Print collected sections as csv rows.
         for row in section.row_strings():
             output_stream.write(row+'\n')
-
-    return sections
+        if keep_sections:
+            kept_sections.append(section)
+    return kept_sections if keep_sections else None
@@ -3,51 +3,118 @@ import json
 import re
 import yaml
 from copy import copy
-from itertools import chain
 
 from popbot_src.section import Section, tuple_to_datetime, transfer_pause_data
-from popbot_src.load_helpers import fuzzy_match, is_pertinent
+from popbot_src.load_helpers import is_pertinent, normalized_key
 from popbot_src.parsed_token import ParsedToken
 
 def read_config_file(config_file_path):
     with open(config_file_path) as config_file:
         return json.load(config_file)
 
+# The fields of decisions that are compared to the texts of paragraphs.
+DECISION_KEY_FIELDS = ['from_title', 'following_fragm', 'preceding_fragm']
+
+class DecisionIndex(defaultdict):
+    """
+    Manual decisions by page number, as lists (like a defaultdict(list)). The decisions are also
+    indexed by their type and their fields matched with fuzzy_match (DECISION_KEY_FIELDS),
+    normalized once when they are added, so the decisions matching a text can be found without
+    comparing it to each of the decisions on a page.
+    """
+    def __init__(self, decisions=[]):
+        super().__init__(list)
+        # (page, decision type, field, normalized value) -> (position on the page, decision) pairs
+        self.keyed_decisions = defaultdict(list)
+        self.decision_keys = dict() # (decision id, field) -> the normalized value
+        for decision in decisions:
+            self.add(decision)
+
+    def add(self, decision):
+        page_decisions = self[decision.pagenum]
+        for field in DECISION_KEY_FIELDS:
+            value = getattr(decision, field, None)
+            if isinstance(value, str):
+                self.decision_keys[(id(decision), field)] = normalized_key(value)
+                self.keyed_decisions[(decision.pagenum, decision.decision_type, field,
+                    normalized_key(value))].append((len(page_decisions), decision))
+        page_decisions.append(decision)
+
+    def key(self, decision, field):
+        "Return the normalized value of the decision field, or None if it has no string there."
+        return self.decision_keys.get((id(decision), field))
+
+    def ranked_matching(self, pages, decision_types, text, field):
+        """
+        Return the decisions of the types on the pages with the field matching the text, as pairs
+        (rank, decision) in the order of the pages and of the decisions on each page.
+        """
+        text_key = normalized_key(text)
+        ranked_decisions = []
+        for page_rank, page in enumerate(pages):
+            ranked_decisions += sorted([((page_rank, position), decision)
+                for decision_type in decision_types
+                for (position, decision)
+                in self.keyed_decisions.get((page, decision_type, field, text_key), [])],
+                key=lambda x: x[0])
+        return ranked_decisions
+
+    def matching(self, pages, decision_types, text, field='from_title'):
+        """
+        Return the decisions of the types on the pages (in the order of the pages and of the
+        decisions on a page) with the field matching the text.
+        """
+        return [decision for (rank, decision)
+                in self.ranked_matching(pages, decision_types, text, field)]
+
+    def title_decisions(self, pages, decision_types, pages_paragraphs):
+        """
+        Yield the decisions of the types on the pages, in order, with from_title matching the
+        first paragraph (the title) from pages_paragraphs. The title is checked again after each
+        decision, since title form decisions may change it.
+        """
+        title = pages_paragraphs[0][1]
+        ranked_decisions = self.ranked_matching(pages, decision_types, title, 'from_title')
+        while ranked_decisions:
+            rank, decision = ranked_decisions.pop(0)
+            yield decision
+            if pages_paragraphs[0][1] != title:
+                title = pages_paragraphs[0][1]
+                ranked_decisions = [(next_rank, next_decision) for (next_rank, next_decision)
+                        in self.ranked_matching(pages, decision_types, title, 'from_title')
+                        if next_rank > rank]
+
 def read_manual_decisions(manual_decisions_file):
-    manual_decisions = defaultdict(list) # page number -> a list of decisions
     with open(manual_decisions_file) as decisions_file:
         all_decisions = yaml.load(decisions_file, Loader=yaml.Loader)
-        for decision in all_decisions:
-            manual_decisions[decision.pagenum].append(decision)
-    return manual_decisions
+    return DecisionIndex(all_decisions) # page number -> a list of decisions
 
 def apply_decisions1(sections, manual_decisions, config):
     "Apply some types of decisions to already read sections."
     meta_inserts = [] # tuples (index, list of meta sections)
     for section_n, section in enumerate(sections):
         pages_paragraphs = section.pages_paragraphs
-        # Get page decisions for all the pages of the document.
-        page_decisions = chain.from_iterable([manual_decisions[pn]
-            for pn in range(pages_paragraphs[0][0], pages_paragraphs[-1][0]+1)])
+        # Get page decisions for all the pages of the document that match its title.
+        page_decisions = manual_decisions.title_decisions(
+            range(pages_paragraphs[0][0], pages_paragraphs[-1][0]+1),
+            ['title_form', 'type', 'date', 'pertinence'], pages_paragraphs)
         for decision in page_decisions:
             # Title form decisions.
-            if (decision.decision_type == 'title_form'
-                    and fuzzy_match(decision.from_title, pages_paragraphs[0][1])):
+            if decision.decision_type == 'title_form':
                 pages_paragraphs[0] = (pages_paragraphs[0][0],
                         decision.to_title)
             # Section type decisions.
             if (decision.decision_type == 'type'
-                    and decision.section_type == 'meta'
-                    and fuzzy_match(decision.from_title, pages_paragraphs[0][1])):
+                    and decision.section_type == 'meta'):
                 meta_inserts.append([section_n, []])
                 for (page, paragraph) in pages_paragraphs[1:]:
                     meta_inserts[-1][1].append(Section.new(config, 'meta', [(page, paragraph)]))
                 meta_inserts[-1] = tuple(meta_inserts[-1])
             # Date decisions.
-            if decision.decision_type == 'date' and fuzzy_match(decision.from_title, pages_paragraphs[0][1]):
+            if decision.decision_type == 'date':
                 section.date = tuple_to_datetime(decision.date)
             # Pertinence decisions.
-            if decision.decision_type == 'pertinence' and fuzzy_match(decision.from_title, pages_paragraphs[0][1]):
+            if decision.decision_type == 'pertinence':
                 section.pertinence = decision.pertinence_status
             # Merge, split decisions. TODO
     # Add the splitted meta sections.
@@ -71,9 +138,7 @@ def apply_decisions1(sections, manual_decisions, config):
 
 def merge_possible(manual_decisions, page_paragraph):
     return (
-        len([d for d in manual_decisions[page_paragraph[0]]
-        if (d.decision_type=='merge_sections'
-        and fuzzy_match(page_paragraph[1], d.from_title))])
+        len(manual_decisions.matching([page_paragraph[0]], ['merge_sections'], page_paragraph[1]))
         > 0)
 
 def find_doc_and_merge(sections, pages_paragraphs, manual_decisions, meta_sections_buffer,
@@ -99,10 +164,11 @@ def find_doc_and_merge(sections, pages_paragraphs, manual_decisions, meta_sectio
     return additional_sections
 
 def commit_doc_with_decisions(config, sections, pages_paragraphs, manual_decisions,
-    meta_sections_buffer, current_document_id, latest_doc_section_n):
+    meta_sections_buffer, current_document_id, latest_doc_section_n, heuristics=None):
     """
     Add the pages and paragraphs to the sections list. This applies the manual decisions (if
-    applicable), creates a document section and guesses metadata.
+    applicable), creates a document section and guesses metadata (with the heuristics of the
+    loader, if given).
     """
     # See if we need merging, based on manual decisions and the previous document where we might
     # merge.
@@ -125,30 +191,29 @@ def commit_doc_with_decisions(config, sections, pages_paragraphs, manual_decisio
         corrected_date = False
         corrected_pertinence = False
         meta = False
-        # Get page decisions for all the pages of the document.
-        page_decisions = chain.from_iterable([manual_decisions[pn]
-            for pn in range(pages_paragraphs[0][0], pages_paragraphs[-1][0]+1)])
+        # Get page decisions for all the pages of the document that match its title.
+        page_decisions = manual_decisions.title_decisions(
+            range(pages_paragraphs[0][0], pages_paragraphs[-1][0]+1),
+            ['title_form', 'type', 'date', 'pertinence'], pages_paragraphs)
         for decision in page_decisions:
             # Title form decisions.
-            if (decision.decision_type == 'title_form'
-                    and fuzzy_match(decision.from_title, pages_paragraphs[0][1])):
+            if decision.decision_type == 'title_form':
                 pages_paragraphs[0] = (pages_paragraphs[0][0],
                         decision.to_title)
             # Section type decisions.
             if (decision.decision_type == 'type'
-                    and decision.section_type == 'meta'
-                    and fuzzy_match(decision.from_title, pages_paragraphs[0][1])):
+                    and decision.section_type == 'meta'):
                 for (page, paragraph) in pages_paragraphs:
                     section = Section.new(config, 'meta', [(page, paragraph)])
                     meta_sections_buffer.append(section)
                 meta = True
                 break
             # Date decisions.
-            if decision.decision_type == 'date' and fuzzy_match(decision.from_title, pages_paragraphs[0][1]):
+            if decision.decision_type == 'date':
                 section.date = tuple_to_datetime(decision.date)
                 corrected_date = True
             # Pertinence decisions.
-            if decision.decision_type == 'pertinence' and fuzzy_match(decision.from_title, pages_paragraphs[0][1]):
+            if decision.decision_type == 'pertinence':
                 section.pertinence = decision.pertinence_status
                 corrected_pertinence = True
         # After applying decisions, if they do not include
@@ -162,7 +227,7 @@ def commit_doc_with_decisions(config, sections, pages_paragraphs, manual_decisio
                     # main section that we will add
                     current_document_id+1)
             if not corrected_date:
-                section.guess_date()
+                section.guess_date(heuristics)
             if not corrected_pertinence:
                 section.pertinence = is_pertinent(section, config)
             section.join_to_list(sections)
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+
+# The kinds of values in a lexicon, also the names of its lists and files.
+KINDS = ['forms', 'lemmas', 'tags']
+
+class Lexicon():
+    """
+    Integer ids of forms, lemmas and tags (interp strings). The ids are given in the order in which
+    the values are first added and never change, so arrays of them can be saved and compared
+    between editions. On disk, a lexicon is a directory with a text file for each kind, holding
+    one value per line (the values come from whitespace-separated tokens, so they have no newlines).
+    """
+    def __init__(self, path=False):
+        self.path = path
+        self.forms, self.lemmas, self.tags = [], [], []
+        self.value_ids = dict([(kind, dict()) for kind in KINDS])
+        # kind -> how many of the values are already in the file
+        self.saved_counts = dict([(kind, 0) for kind in KINDS])
+        if path and os.path.isdir(path):
+            for kind in KINDS:
+                with open(os.path.join(path, kind + '.txt'), encoding='utf-8') as values_file:
+                    for value in values_file.read().split('\n')[:-1]:
+                        self.id(kind, value)
+                self.saved_counts[kind] = len(getattr(self, kind))
+
+    def __len__(self):
+        return sum([len(getattr(self, kind)) for kind in KINDS])
+
+    def id(self, kind, value):
+        "Return the id of the value of the kind ('forms', 'lemmas' or 'tags'), adding it if needed."
+        value_ids = self.value_ids[kind]
+        if not value in value_ids:
+            values = getattr(self, kind)
+            value_ids[value] = len(values)
+            values.append(value)
+        return value_ids[value]
+
+    def find(self, kind, value):
+        "Return the id of the value of the kind, or -1 if it isn't in the lexicon."
+        return self.value_ids[kind].get(value, -1)
+
+    def ids(self, kind, values):
+        "Return the ids of the values of the kind as an array, adding the new ones."
+        value_ids = self.value_ids[kind]
+        return np.array([value_ids[value] if value in value_ids else self.id(kind, value)
+            for value in values], dtype=np.int32)
+
+    def strings(self, kind, ids):
+        "Return the values of the kind for the array of ids, as a list."
+        return np.array(getattr(self, kind), dtype=object)[ids].tolist()
+
+    def save(self, path=False):
+        """
+        Save the lexicon to the path (by default, the one it was loaded from). When saving to its
+        own path, only the values added since the last save are appended to the files.
+        """
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        appending = path == self.path
+        for kind in KINDS:
+            first_value = self.saved_counts[kind] if appending else 0
+            with open(os.path.join(path, kind + '.txt'), 'a' if appending else 'w',
+                    encoding='utf-8') as values_file:
+                values_file.write(''.join([value + '\n'
+                    for value in getattr(self, kind)[first_value:]]))
+            if appending:
+                self.saved_counts[kind] = len(getattr(self, kind))
+
+# path -> the lexicon loaded from it, False standing for the in-memory one shared by the process
+lexicons = dict()
+
+def open_lexicon(path=False):
+    """
+    Get the lexicon of the process for the path, loading it on the first use. Without a path, it's
+    the in-memory lexicon that the token stores use by default.
+    """
+    key = os.path.abspath(path) if path else False
+    if not key in lexicons:
+        lexicons[key] = Lexicon(path)
+    return lexicons[key]
@@ -55,6 +55,87 @@ heading_antisigns = ([
     # other out of place vocabulary
     [re.compile(s, flags=re.IGNORECASE) for s in ['\\smy\\s', 'ichm', 'jmp', 'jkr', '\\smość', '\\smci', '\\span(a|u|(em))?\\s', 'Dr\\.?\\s', '\\sby[lł]', 'działo', 'brak', 'miasto', '\\saby\\s', '\\siż\\s', '\\sże\\s', 'początk', 'pamięci', 'panow', '\\stu(taj)?\\s', 'tzn', 'tj', 'według', 'wedle', 'obacz', '\\sakta\\s', 'mowa tu\\s', 'p[\\.,] \\d', 'obtulit', 'feria', 'festum', 'decretor', 'poborca', 'naprzód', 'dokumentacja', 'literatura', 'wierzytelna', ' s\\. ', 'nieprawy', 'działo s']])
 
+def uncaptured_pattern(pattern):
+    """
+    Return the regex pattern string with its capturing groups turned into non-capturing ones. The
+    re module can't use its fast scanning for the possible first characters of alternations with
+    capturing groups, and we only search for the signs, never reading their groups.
+    """
+    converted = []
+    char_n = 0
+    in_class = False
+    while char_n < len(pattern):
+        char = pattern[char_n]
+        if char == '\\':
+            converted.append(pattern[char_n:char_n+2])
+            char_n += 2
+            continue
+        if in_class:
+            # (a bracket right after the opening one is a literal)
+            if char == ']' and not class_start:
+                in_class = False
+            class_start = False
+        elif char == '[':
+            in_class = True
+            class_start = True
+            if pattern[char_n+1:char_n+2] == '^':
+                converted.append('[^')
+                char_n += 2
+                continue
+        elif char == '(' and pattern[char_n+1:char_n+2] != '?':
+            converted.append('(?:')
+            char_n += 1
+            continue
+        converted.append(char)
+        char_n += 1
+    return ''.join(converted)
+
+class SignMatcher():
+    """
+    The sign families compiled once for scanning paragraphs. A hit vector of a family is a list of
+    booleans, one for each of its signs in order, telling whether it is found in the paragraph.
+    The signs shared between families are searched only once per paragraph, and the hits are kept
+    for a few latest paragraphs, since the loader checks each paragraph both for being meta and
+    for being a heading.
+    """
+    def __init__(self, families, kept_paragraphs=4):
+        self.patterns = []
+        pattern_ns = dict() # (pattern string, flags) -> index in patterns
+        self.families = dict() # family -> indices of its signs in patterns
+        for family, signs in families.items():
+            self.families[family] = []
+            for sign in signs:
+                if not (sign.pattern, sign.flags) in pattern_ns:
+                    pattern_ns[(sign.pattern, sign.flags)] = len(self.patterns)
+                    self.patterns.append(re.compile(uncaptured_pattern(sign.pattern), sign.flags))
+                self.families[family].append(pattern_ns[(sign.pattern, sign.flags)])
+        self.kept_paragraphs = kept_paragraphs
+        self.paragraph_hits = dict() # paragraph -> pattern index -> whether it was found
+
+    def hits(self, paragraph, family):
+        "Return the hit vector of the sign family for the paragraph."
+        if not paragraph in self.paragraph_hits:
+            if len(self.paragraph_hits) >= self.kept_paragraphs:
+                del self.paragraph_hits[next(iter(self.paragraph_hits))]
+            self.paragraph_hits[paragraph] = dict()
+        found = self.paragraph_hits[paragraph]
+        hit_vector = []
+        for pattern_n in self.families[family]:
+            if not pattern_n in found:
+                found[pattern_n] = self.patterns[pattern_n].search(paragraph) is not None
+            hit_vector.append(found[pattern_n])
+        return hit_vector
+
+sign_matcher = SignMatcher({
+    'meta': meta_signs,
+    # the titles that make a fragment less likely to be meta
+    'titles': (resolution_titles + other_titles
+        + [re.compile('[kK]ról [pP]ols'), re.compile('^We? ')]),
+    'heading_1ord': heading_signs_1ord,
+    'heading_2ord': heading_signs_2ord,
+    'heading_antisigns': heading_antisigns
+    })
+
 ocr_corrections = {
         'lnstru': 'Instru',
         'rn ': 'm ',
@@ -86,8 +167,8 @@ def is_meta_fragment(fragment, config, verbose=False):
             print('There is a line that is too long in fragment {}'.format(fragment))
         return True
     if len(fragment) < 800:
-        for sign in meta_signs:
-            if sign.search(fragment):
+        for sign, hit in zip(meta_signs, sign_matcher.hits(fragment, 'meta')):
+            if hit:
                 if verbose:
                     print('Found {} in {}'.format(sign, fragment))
                 return True
@@ -110,9 +191,7 @@ def is_meta_fragment(fragment, config, verbose=False):
                     print('Fully capitalized {} in {}'.format(t, fragment))
                 return True
     # If the majority of words are capitalized or numbers, or non-alphanumeric.
-    titles_presence = any([True
-        for s in resolution_titles+other_titles+[re.compile('[kK]ról [pP]ols'), re.compile('^We? ')]
-        if s.search(fragment)])
+    titles_presence = any(sign_matcher.hits(fragment, 'titles'))
     if not titles_presence and len(tokens) >= 3:
         capit_or_num_count = (
                 len([t for t in tokens if (t[0] != t[0].lower()) or (re.search('[\\W0-9]', t))])
@@ -123,7 +202,7 @@ def is_meta_fragment(fragment, config, verbose=False):
             return True
         if capit_or_num_count > 0.65 * len(tokens):
             # Be more liberal if may be a section.
-            signs_1ord = [s.search(fragment) for s in heading_signs_1ord]
+            signs_1ord = sign_matcher.hits(fragment, 'heading_1ord')
             if len(signs_1ord) <= 1:
                 if verbose:
                     print('Majority capitalized or numbers in {}'.format(fragment))
@@ -162,11 +241,11 @@ def heading_score(paragraph, config, length_discount=70, verbose=False):
     # Do some possible cleanup.
     paragraph = paragraph.replace('-', '')
 
-    signs_1ord = [s.search(paragraph) for s in heading_signs_1ord]
+    signs_1ord = sign_matcher.hits(paragraph, 'heading_1ord')
     signs_1ord_count = len([s for s in signs_1ord if s])
     if verbose:
         print('+{:.1f} from first-order signs'.format(signs_1ord_count))
-    signs_2ord = [s.search(paragraph) for s in heading_signs_2ord]
+    signs_2ord = sign_matcher.hits(paragraph, 'heading_2ord')
     signs_2ord_count = len([s for s in signs_2ord if s])
     if verbose:
         print('+{:.1f} from second-order signs'.format(signs_2ord_count))
@@ -174,16 +253,17 @@ def heading_score(paragraph, config, length_discount=70, verbose=False):
         signs_2ord_count -= 1.5
         if verbose:
             print('-1.5 from no first-order signs')
-    elif not len([s.search(paragraph) for s in heading_signs_1ord[:25]]):
+    elif not len(signs_1ord[:25]):
         signs_2ord_count -= 1.0
         if verbose:
             print('-1.0 from no first-order signs in the first 25 characters')
     signs_count = signs_1ord_count + signs_2ord_count
 
-    antisigns = [s.search(paragraph) for s in heading_antisigns]
+    antisigns = sign_matcher.hits(paragraph, 'heading_antisigns')
     antisigns_count = len([s for s in antisigns if s]) * 0.6
     if verbose:
-        print('-{:.1f} from anti-signs {}'.format(antisigns_count, [s.group(0) for s in antisigns if s]))
+        print('-{:.1f} from anti-signs {}'.format(antisigns_count,
+            [s.search(paragraph).group(0) for (s, hit) in zip(heading_antisigns, antisigns) if hit]))
 
     # If the first letter is not uppercase, it's a strong signal against.
     try:
@@ -212,11 +292,39 @@ def doc_beginning_score(paragraph, config):
     signs_2ord = ['dygnitarze', 'urzędnic', 'rycerstw', 'obywatel', 'panow', 'wszyst', 'wszytk', 'koronn', 'świec', 'duchown', 'ziem']
     if sign_1ord is not None or (len(paragraph) > 0 and paragraph[0].lower() != paragraph[0]):
         signs_count += 0.3
+        lowercased = paragraph.lower()
         for sign in signs_2ord:
-            if paragraph.lower().find(sign):
+            if lowercased.find(sign):
                 signs_count += 0.3 / len(signs_2ord)
     return signs_count
 
+class ParagraphHeuristics():
+    """
+    The heuristics used by the loader for the edition config: OCR corrections, meta fragment,
+    heading and document beginning detection and date extraction. Other implementations (e.g.
+    with scores computed in advance) can be given to the loader instead.
+    """
+    def __init__(self, config):
+        self.config = config
+
+    def ocr_corrected(self, paragraph):
+        return ocr_corrected(paragraph)
+
+    def is_meta_fragment(self, paragraph):
+        return is_meta_fragment(paragraph, self.config)
+
+    def heading_score(self, paragraph):
+        if "heading_length_discount" in self.config:
+            return heading_score(paragraph, self.config,
+                    length_discount=self.config["heading_length_discount"])
+        return heading_score(paragraph, self.config)
+
+    def doc_beginning_score(self, paragraph):
+        return doc_beginning_score(paragraph, self.config)
+
+    def extract_dates(self, string):
+        return extract_dates(string)
+
 month_words_to_numbers = [
         # NOTE conventionally replace all i with j, convert to lowercase for this matching
         ('stycz', 1),
@@ -405,10 +513,14 @@ def extract_dates(string, verbose=False):
 
     return dates
 
+def normalized_key(string):
+    "Normalize the string for comparing with fuzzy_match (this can be done once for many matches)."
+    return re.sub('\\s|(\\\\n)', '', string)
+
 def fuzzy_match(str1, str2):
     """For now, fuzzy match is actually exact."""
     # TODO make it fuzzy.
-    return re.sub('\\s|(\\\\n)', '', str1) == re.sub('\\s|(\\\\n)', '', str2)
+    return normalized_key(str1) == normalized_key(str2)
 
 def join_linebreaks(text, clean_end_shades=True):
     """
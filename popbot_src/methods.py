@@ -1,11 +1,11 @@
 from collections import Counter
-import re
 import csv
 from os import makedirs
+import numpy as np
 from nltk.probability import FreqDist
 from nltk.collocations import BigramCollocationFinder, BigramAssocMeasures, TrigramCollocationFinder, TrigramAssocMeasures
 from popbot_src.rule import rules_from_freqs
-from popbot_src.parsed_token import ParsedToken, NoneTokenError
+from popbot_src.token_store import CORRECTED, LATIN, PROPER_NAME, UNKNOWN_FORM, sections_store
 from collections import defaultdict
 
 def zero():
@@ -13,28 +13,23 @@ def zero():
 
 def basic_stats(sections, method_options):
     "Returns sorted tuples reflecting the frequency of word forms."
-    full_tokens = []
-    for section in sections:
-        for pg, par in section.pages_paragraphs:
-            tokens = list(re.split('\\s', par))
-            for t_str in tokens:
-                try: # can fail if something isn't a readable token
-                    full_tokens.append(ParsedToken.from_str(t_str))
-                except NoneTokenError:
-                    pass
+    store, section_ns = sections_store(sections)
+    token_ns = store.token_indices(section_ns)
+    token_flags = store.flags[token_ns]
     # Collect statistics of token types.
     stats = defaultdict(zero)
     stats['all_docs'] = len(sections)
-    stats['all_tokens'] = len(full_tokens)
-    for token in full_tokens:
-        if token.corrected:
-            stats['corrected_tokens'] += 1
-        if token.unknown_form:
-            stats['unknown_form_tokens'] += 1
-        if token.proper_name:
-            stats['proper_name_tokens'] += 1
-        if token.latin:
-            stats['latin_tokens'] += 1
+    stats['all_tokens'] = len(token_ns)
+    # The counts are added in the order of the first tokens that have them.
+    flag_stats = []
+    for flag_n, (flag, stat_name) in enumerate([(CORRECTED, 'corrected_tokens'),
+            (UNKNOWN_FORM, 'unknown_form_tokens'), (PROPER_NAME, 'proper_name_tokens'),
+            (LATIN, 'latin_tokens')]):
+        flagged = (token_flags & flag) != 0
+        if flagged.any():
+            flag_stats.append((np.argmax(flagged), flag_n, stat_name, int(flagged.sum())))
+    for first_token_n, flag_n, stat_name, count in sorted(flag_stats):
+        stats[stat_name] += count
     return list(stats.items())
 
 #
@@ -42,40 +37,38 @@ def basic_stats(sections, method_options):
 #
 
 def prepare_form_corpus(sections):
-    "Return all tokens in one list, in form form%lemma%interp"
-    full_tokens = []
-    for section in sections:
-        for pg, par in section.pages_paragraphs[1:]: # skip the title
-            tokens = list(re.split('\\s', par))
-            for t_str in tokens:
-                try: # can fail if something isn't a readable token
-                    token = ParsedToken.from_str(t_str)
-                    full_tokens.append('{}%{}%{}'.format(token.form, token.lemma, token.interp_str()))
-                except NoneTokenError:
-                    pass
-    return full_tokens
+    """Return all tokens in one list, as (form id, lemma id, tag id) tuples, and the lexicon of
+    these ids."""
+    store, section_ns = sections_store(sections)
+    token_ns = store.token_indices(section_ns, skip_title=True)
+    return (list(zip(store.form_ids[token_ns].tolist(), store.lemma_ids[token_ns].tolist(),
+        store.tag_ids[token_ns].tolist())), store.lexicon)
 
-def unpack_ngram_forms(ngram_tuple):
+def unpack_ngram_forms(ngram_tuple, lexicon):
     """Take a tuple of n forms coded with lemmas and interpretations and unpack it into a n*3 tuple
     with these elements separated."""
     result = []
-    for form_record in ngram_tuple:
-        result += form_record.split('%')
+    for form_id, lemma_id, tag_id in ngram_tuple:
+        result += [lexicon.forms[form_id], lexicon.lemmas[lemma_id], lexicon.tags[tag_id]]
     return result
 
-def find_form_collocations(full_tokens, finder, metrics_obj, needed_words=[]):
+def find_form_collocations(full_tokens, lexicon, finder, metrics_obj, needed_words=[]):
     coll_finder = finder.from_words(full_tokens)
     coll_finder.apply_freq_filter(2)
-    coll_finder.apply_word_filter(lambda w: len(w.split('%')[0]) < 2)
+    coll_finder.apply_word_filter(lambda w: len(lexicon.forms[w[0]]) < 2)
     if needed_words:
         # Reject all ngrams that don't have one of required words as their lemmas.
-        coll_finder.apply_ngram_filter(lambda *args: not any([(a.split('%')[1] in needed_words)
+        needed_ids = set([lexicon.find('lemmas', word) for word in needed_words])
+        coll_finder.apply_ngram_filter(lambda *args: not any([(a[1] in needed_ids)
                                                               for a in args]))
     result = coll_finder.score_ngrams(metrics_obj.raw_freq)
+    # Order the ties by the words' strings, not by their ids.
+    result.sort(key=lambda row: (-row[1], ['%'.join(unpack_ngram_forms([token], lexicon))
+                                           for token in row[0]]))
     # Format the result as a list of tuples.
     for row_n, row in enumerate(result):
         # join the word entries of the phrase into the outer tuple:
-        result[row_n] = (unpack_ngram_forms(row[0])
+        result[row_n] = (unpack_ngram_forms(row[0], lexicon)
                          # the retrieved frequency will be an integer, but sometimes with a minor
                          # float corruption
                          + [round(row[1] * len(full_tokens)),
@@ -89,22 +82,25 @@ def find_form_collocations(full_tokens, finder, metrics_obj, needed_words=[]):
 
 def form_frequency(sections, method_options):
     "Returns sorted tuples reflecting the frequency of word forms."
-    fd = FreqDist(prepare_form_corpus(sections))
+    full_tokens, lexicon = prepare_form_corpus(sections)
+    fd = FreqDist(full_tokens)
     # This contains (token, freq) tuples.
     result = list(fd.most_common(fd.B()))
     for row_n, row in enumerate(result):
-        # re-splitted token info, frequency, frequency as a ratio
-        result[row_n] = tuple(row[0].split('%')) + (row[1], row[1]/fd.N())
+        # token info, frequency, frequency as a ratio
+        result[row_n] = tuple(unpack_ngram_forms([row[0]], lexicon)) + (row[1], row[1]/fd.N())
     return result
 
 def form_bigrams(sections, method_options):
-    full_tokens = prepare_form_corpus(sections)
-    result = find_form_collocations(full_tokens, BigramCollocationFinder, BigramAssocMeasures())
+    full_tokens, lexicon = prepare_form_corpus(sections)
+    result = find_form_collocations(full_tokens, lexicon, BigramCollocationFinder,
+                                    BigramAssocMeasures())
     return result
 
 def form_trigrams(sections, method_options):
-    full_tokens = prepare_form_corpus(sections)
-    result = find_form_collocations(full_tokens, TrigramCollocationFinder, TrigramAssocMeasures())
+    full_tokens, lexicon = prepare_form_corpus(sections)
+    result = find_form_collocations(full_tokens, lexicon, TrigramCollocationFinder,
+                                    TrigramAssocMeasures())
     return result
 
 #
@@ -112,18 +108,11 @@ def form_trigrams(sections, method_options):
 #
 def prepare_lemma_corpus(sections, omit_suspicious_interps):
     "Return all tokens in one list"
-    full_tokens = []
-    for section in sections:
-        for pg, par in section.pages_paragraphs[1:]: # skip the title
-            tokens = list(re.split('\\s', par))
-            for t_str in tokens:
-                try: # can fail if something isn't a readable token
-                    token = ParsedToken.from_str(t_str)
-                    if not omit_suspicious_interps or not 'brev' in token.interp:
-                        full_tokens.append(token.lemma)
-                except NoneTokenError:
-                    pass
-    return full_tokens
+    store, section_ns = sections_store(sections)
+    token_ns = store.token_indices(section_ns, skip_title=True)
+    if omit_suspicious_interps:
+        token_ns = token_ns[~store.tags_with('brev')[store.tag_ids[token_ns]]]
+    return store.lexicon.strings('lemmas', store.lemma_ids[token_ns])
 
 def find_lemma_collocations(full_tokens, finder, metrics_obj, needed_words=[]):
     coll_finder = finder.from_words(full_tokens)
@@ -174,18 +163,47 @@ def group_placeholder(group):
     """Give the group marker a mock form/lemma formed from its constituents."""
     return '__' + '-'.join(group[:3]+(['...'] if len(group) > 3 else []))
 
+class PlaceholderLexicon():
+    """The forms, lemmas and tags of the lexicon with the group placeholders added as forms and
+    lemmas, under ids following the ones of the lexicon. The placeholders are never added to the
+    lexicon itself, which may be shared and saved."""
+    def __init__(self, lexicon, placeholders):
+        self.lexicon = lexicon
+        self.forms = lexicon.forms + placeholders
+        self.lemmas = lexicon.lemmas + placeholders
+        self.tags = lexicon.tags
+        self.placeholder_ids = dict([(kind, dict([(placeholder, len(getattr(lexicon, kind)) + n)
+            for (n, placeholder) in enumerate(placeholders)])) for kind in ['forms', 'lemmas']])
+
+    def find(self, kind, value):
+        "Return the id of the value of the kind, or -1 if it isn't a placeholder or in the lexicon."
+        if value in self.placeholder_ids.get(kind, dict()):
+            return self.placeholder_ids[kind][value]
+        return self.lexicon.find(kind, value)
+
+def group_placeholder_ids(category, lexicon):
+    """Return a dictionary mapping the lemma ids of the category to the (form id, lemma id) of
+    the placeholder of their (first) group, and the PlaceholderLexicon giving these ids."""
+    placeholder_lexicon = PlaceholderLexicon(lexicon,
+            list(dict.fromkeys([group_placeholder(group) for group in category])))
+    placeholder_ids = dict()
+    for group in category:
+        placeholder = group_placeholder(group)
+        group_ids = (placeholder_lexicon.find('forms', placeholder),
+                placeholder_lexicon.find('lemmas', placeholder))
+        for lemma in group:
+            lemma_id = lexicon.find('lemmas', lemma)
+            if lemma_id != -1 and not lemma_id in placeholder_ids:
+                placeholder_ids[lemma_id] = group_ids
+    return placeholder_ids, placeholder_lexicon
+
 def keywords_bigrams(sections, method_options):
     category = method_options['keyword_category']
-    full_tokens = prepare_form_corpus(sections)
-    for token_n, form_token in enumerate(full_tokens):
-        fields = form_token.split('%')
-        for group_n, group in enumerate(category):
-            if fields[1] in group:
-                fields[0] = group_placeholder(group)
-                fields[1] = group_placeholder(group)
-                break
-        full_tokens[token_n] = '%'.join(fields)
-    result = find_form_collocations(full_tokens, BigramCollocationFinder,
+    full_tokens, lexicon = prepare_form_corpus(sections)
+    placeholder_ids, lexicon = group_placeholder_ids(category, lexicon)
+    full_tokens = [(placeholder_ids[token[1]] + token[2:] if token[1] in placeholder_ids else token)
+                   for token in full_tokens]
+    result = find_form_collocations(full_tokens, lexicon, BigramCollocationFinder,
                                     BigramAssocMeasures(),
                                     needed_words=[group_placeholder(group) for group in category])
     return result
@@ -205,16 +223,11 @@ def keywords_lemma_bigrams(sections, method_options):
 
 def keywords_trigrams(sections, method_options):
     category = method_options['keyword_category']
-    full_tokens = prepare_form_corpus(sections)
-    for token_n, form_token in enumerate(full_tokens):
-        fields = form_token.split('%')
-        for group_n, group in enumerate(category):
-            if fields[1] in group:
-                fields[0] = group_placeholder(group)
-                fields[1] = group_placeholder(group)
-                break
-        full_tokens[token_n] = '%'.join(fields)
-    result = find_form_collocations(full_tokens, TrigramCollocationFinder,
+    full_tokens, lexicon = prepare_form_corpus(sections)
+    placeholder_ids, lexicon = group_placeholder_ids(category, lexicon)
+    full_tokens = [(placeholder_ids[token[1]] + token[2:] if token[1] in placeholder_ids else token)
+                   for token in full_tokens]
+    result = find_form_collocations(full_tokens, lexicon, TrigramCollocationFinder,
                                     TrigramAssocMeasures(),
                                     needed_words=[group_placeholder(group) for group in category])
     return result
@@ -241,35 +254,40 @@ def rule_lifetime_tables(sections, method_options):
     year_freqs = dict() # year -> lemma frequency counter
     year_freq_numbers = dict() # year -> the number of tokens found for it
     group_year_freqs = dict() # keyword group's first lemma -> list of years where it appears
-    lemma_groups = dict() # lemma -> the list of keyword groups, can be empty
-    for section in sections:
+    lemma_groups = dict() # lemma id -> the list of keyword groups, can be empty
+    store, section_ns = sections_store(sections)
+    if method_options['omit_suspicious_interps']:
+        suspicious_tags = store.tags_with('brev')
+    for section, section_n in zip(sections, section_ns):
         if not section.pertinence:
             continue
         if not section.date:
             continue
         year = section.date.year
         local_counter = Counter()
-        for pg, par in section.pages_paragraphs[1:]: # skip the title
-            tokens = list(re.split('\\s', par))
-            for t_str in tokens:
-                try: # can fail if something isn't a readable token
-                    token = ParsedToken.from_str(t_str)
-                    if not method_options['omit_suspicious_interps'] or not 'brev' in token.interp:
-                        if not token.lemma in lemma_groups:
-                            lemma_groups[token.lemma] = []
-                            for category in method_options['keyword_categories']:
-                                for group in method_options['keyword_categories'][category]:
-                                    for lemma in group:
-                                        if token.lemma == lemma:
-                                            lemma_groups[token.lemma].append(f"{category}_{group[0]}")
-                        # Add an occurence for each of the keyword groups associated with the lemma.
-                        for group in lemma_groups[token.lemma]:
-                            local_counter.update([group])
-                        if not year in year_freq_numbers:
-                            year_freq_numbers[year] = 0
-                        year_freq_numbers[year] += 1
-                except NoneTokenError:
-                    pass
+        token_ns = np.arange(*store.section_range(section_n, skip_title=True))
+        if method_options['omit_suspicious_interps']:
+            token_ns = token_ns[~suspicious_tags[store.tag_ids[token_ns]]]
+        if len(token_ns) > 0:
+            # Count the lemmas, taking them in the order of their first occurence.
+            lemma_ids, first_indices, lemma_counts = np.unique(store.lemma_ids[token_ns],
+                    return_index=True, return_counts=True)
+            for lemma_n in np.argsort(first_indices, kind='stable'):
+                lemma_id = int(lemma_ids[lemma_n])
+                if not lemma_id in lemma_groups:
+                    token_lemma = store.lemmas[lemma_id]
+                    lemma_groups[lemma_id] = []
+                    for category in method_options['keyword_categories']:
+                        for group in method_options['keyword_categories'][category]:
+                            for lemma in group:
+                                if token_lemma == lemma:
+                                    lemma_groups[lemma_id].append(f"{category}_{group[0]}")
+                # Add the occurences for each of the keyword groups associated with the lemma.
+                for group in lemma_groups[lemma_id]:
+                    local_counter[group] += int(lemma_counts[lemma_n])
+            if not year in year_freq_numbers:
+                year_freq_numbers[year] = 0
+            year_freq_numbers[year] += len(token_ns)
         if not year in year_freqs:
             year_freqs[year] = Counter()
         year_freqs[year].update(local_counter)
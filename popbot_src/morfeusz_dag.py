@@ -0,0 +1,178 @@
+from array import array
+from collections import OrderedDict
+import csv
+import io
+import sys
+
+def stringify_value(value):
+    if value != 0 and not value:
+        return ''
+    return str(value)
+
+class MorfeuszDAG():
+    """
+    The Morfeusz analysis of a text as a compact graph. The positions (start-end pairs of nodes,
+    sorted) are kept in integer arrays, and the variants (interpretations) in columns of interned
+    strings; the variants of position n are those from variant_offsets[n] to variant_offsets[n+1].
+    """
+    def __init__(self):
+        self.starts = array('l')
+        self.ends = array('l')
+        self.variant_offsets = array('l', [0])
+        self.forms, self.lemmas, self.tags, self.names, self.labels = [], [], [], [], []
+
+    @classmethod
+    def from_morfeusz(cls, morfeusz_output):
+        "Build the graph from the output of the Morfeusz analyse method."
+        dag = cls()
+        positions = dict() # (start, end) -> interps
+        for (start, end, interp) in morfeusz_output:
+            if not (start, end) in positions:
+                positions[(start, end)] = []
+            positions[(start, end)].append(interp)
+        for (start, end) in sorted(positions):
+            dag.starts.append(start)
+            dag.ends.append(end)
+            for interp in positions[(start, end)]:
+                form, lemma, tag, names, labels = [sys.intern(stringify_value(value))
+                        for value in interp]
+                dag.forms.append(form)
+                dag.lemmas.append(lemma)
+                dag.tags.append(tag)
+                dag.names.append(names)
+                dag.labels.append(labels)
+            dag.variant_offsets.append(len(dag.forms))
+        return dag
+
+    def __len__(self):
+        return len(self.starts)
+
+    def nodes_count(self):
+        return max(self.ends, default=0)
+
+    def extend(self, other, node_offset=0):
+        "Append the positions of the other graph, with node numbers moved by node_offset."
+        self.starts.extend([start + node_offset for start in other.starts])
+        self.ends.extend([end + node_offset for end in other.ends])
+        variant_offset = len(self.forms)
+        self.variant_offsets.extend([offset + variant_offset
+            for offset in other.variant_offsets[1:]])
+        self.forms += other.forms
+        self.lemmas += other.lemmas
+        self.tags += other.tags
+        self.names += other.names
+        self.labels += other.labels
+
+    def positions(self, first=0, end=None):
+        """Return the positions from first to end as lists of variants, each of them a list of the
+        start and end nodes (as strings) and the form, lemma, tag, names and labels."""
+        if end is None:
+            end = len(self)
+        return [[[str(self.starts[pos_n]), str(self.ends[pos_n]), self.forms[var_n],
+            self.lemmas[var_n], self.tags[var_n], self.names[var_n], self.labels[var_n]]
+            for var_n in range(self.variant_offsets[pos_n], self.variant_offsets[pos_n+1])]
+            for pos_n in range(first, end)]
+
+    def sentence_bounds(self):
+        """Return the sentences as (first position, end position) ranges, split after the dots
+        that don't follow abbreviations (brev)."""
+        sent_boundaries = [0]
+        previous_brev = False
+        for pos_n in range(len(self)):
+            current_brev = False
+            for var_n in range(self.variant_offsets[pos_n], self.variant_offsets[pos_n+1]):
+                if 'brev' in self.tags[var_n]:
+                    previous_brev = True
+                    current_brev = True
+                if self.forms[var_n] == '.' and not previous_brev:
+                    sent_boundaries.append(pos_n+1)
+            if not current_brev:
+                previous_brev = False
+        sent_boundaries.append(len(self))
+        return [(first, end) for (first, end) in zip(sent_boundaries, sent_boundaries[1:])
+                if end > first]
+
+    def write_rows(self, out, first, end, node_offset=0):
+        """Write the rows of the sentence from first to end position in the Concraft format to the
+        out stream, with node numbers moved by node_offset."""
+        writer = csv.writer(out, dialect='excel', delimiter='\t')
+        for pos_n in range(first, end):
+            var_start, var_end = self.variant_offsets[pos_n], self.variant_offsets[pos_n+1]
+            start_str = str(self.starts[pos_n] + node_offset)
+            end_str = str(self.ends[pos_n] + node_offset)
+            weight = str(1/(var_end-var_start))
+            eos = 'eos' if pos_n == end - 1 else '' # end of sentence tag
+            writer.writerows([(start_str, end_str, self.forms[var_n], self.lemmas[var_n],
+                self.tags[var_n], self.names[var_n], self.labels[var_n], weight, '', eos, '')
+                for var_n in range(var_start, var_end)])
+        print('', file=out) # newline
+
+    def dag_string(self, sentence_bounds, node_offset=0):
+        """Return the sentences given as position ranges as a DAG string, which can be passed to
+        Concraft."""
+        out = io.StringIO()
+        for first, end in sentence_bounds:
+            self.write_rows(out, first, end, node_offset=node_offset)
+        return out.getvalue()
+
+class FormCachedAnalyzer():
+    """
+    A wrapper of a Morfeusz analyzer, which remembers the analyses of whitespace-delimited tokens
+    (up to max_forms of them, dropping the least recently used). Morfeusz does not make segments
+    across whitespace, so the analysis of a text can be put together from the analyses of its
+    tokens, with their node numbers moved to the token's place in the text.
+    """
+    def __init__(self, analyzer, max_forms=100000):
+        self.analyzer = analyzer
+        self.max_forms = max_forms
+        # token -> (raw Morfeusz output, MorfeuszDAG, number of nodes), with node numbers counted
+        # from 0 in the token.
+        self.fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fragment(self, token):
+        if token in self.fragments:
+            self.hits += 1
+            self.fragments.move_to_end(token)
+            return self.fragments[token]
+        self.misses += 1
+        morfeusz_output = self.analyzer.analyse(token)
+        dag = MorfeuszDAG.from_morfeusz(morfeusz_output)
+        self.fragments[token] = (morfeusz_output, dag, dag.nodes_count())
+        if len(self.fragments) > self.max_forms:
+            self.fragments.popitem(last=False)
+        return self.fragments[token]
+
+    def analyse(self, text):
+        "Return the analysis of the text like the Morfeusz analyse method."
+        morfeusz_output = []
+        node_offset = 0
+        for token in text.split():
+            token_output, dag, nodes_count = self.fragment(token)
+            morfeusz_output += [(start+node_offset, end+node_offset, interp)
+                    for (start, end, interp) in token_output]
+            node_offset += nodes_count
+        return morfeusz_output
+
+    def analyse_dag(self, text):
+        "Return the analysis of the text as a MorfeuszDAG."
+        text_dag = MorfeuszDAG()
+        node_offset = 0
+        for token in text.split():
+            token_output, dag, nodes_count = self.fragment(token)
+            text_dag.extend(dag, node_offset=node_offset)
+            node_offset += nodes_count
+        return text_dag
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return 'Form cache: {} hits, {} misses ({:.1f}% hit rate), {} forms stored.'.format(
+                self.hits, self.misses, (100 * self.hits / lookups) if lookups else 0.0,
+                len(self.fragments))
+
+def analysed_dag(analyzer, text):
+    "Return the Morfeusz analysis of the text as a MorfeuszDAG."
+    if isinstance(analyzer, FormCachedAnalyzer):
+        return analyzer.analyse_dag(text)
+    return MorfeuszDAG.from_morfeusz(analyzer.analyse(text))
@@ -0,0 +1,184 @@
+from collections import deque
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+def model_identifier(model_path):
+    "Identify the model by its path and, if it is found on disk, its size and modification time."
+    try:
+        model_stat = os.stat(model_path)
+        return '{}:{}:{}'.format(model_path, model_stat.st_size, int(model_stat.st_mtime))
+    except OSError:
+        return str(model_path)
+
+class ParseCache():
+    """
+    An on-disk (SQLite) cache of parsing results, keyed by the hash of the exact paragraph (the
+    chunking and the token positions depend on its whitespace), the parsing function, the models
+    from base_config and the chunking settings (chunk_size can be any value identifying them). The
+    new entries are committed every commit_every entries or commit_interval seconds, so they are
+    kept also when the run is interrupted. At these points and when the cache is closed, the
+    least recently used entries are evicted to keep the cache below max_size bytes.
+    """
+    def __init__(self, path, base_config, chunk_size, max_size=2*1024**3, commit_every=1000,
+            commit_interval=10.0):
+        self.path = path
+        self.max_size = max_size
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.last_commit = time.time()
+        self.settings_key = '|'.join([
+            model_identifier(os.path.join(base_config['morfeusz_model_dir'],
+                base_config['morfeusz_model'])),
+            model_identifier(base_config['concraft_model']),
+            str(chunk_size)])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The connection may be used also by the thread feeding the paragraphs to a worker pool.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY,'
+                ' value BLOB, size INTEGER, last_used REAL)')
+
+    def key(self, paragraph, function_name):
+        key_str = '|'.join([function_name, self.settings_key, paragraph])
+        return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM entries WHERE key = ?',
+                    (key,)).fetchone() is not None
+
+    def get(self, key):
+        "Return the cached result or None, counting hits."
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM entries WHERE key = ?',
+                    (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                    (time.time(), key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, result):
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                    (key, value, len(value), time.time()))
+            self.uncommitted += 1
+
+    def size(self):
+        with self.lock:
+            return self.connection.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self, kept_keys=()):
+        """
+        Remove the least recently used entries until the cache fits in max_size, except for the
+        kept_keys (still to be read).
+        """
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        evicted_keys = []
+        with self.lock:
+            for key, size in self.connection.execute(
+                    'SELECT key, size FROM entries ORDER BY last_used, rowid'):
+                if excess <= 0:
+                    break
+                if key in kept_keys:
+                    continue
+                evicted_keys.append((key,))
+                excess -= size
+        with self.lock:
+            self.connection.executemany('DELETE FROM entries WHERE key = ?', evicted_keys)
+        self.evictions += len(evicted_keys)
+
+    def commit(self, kept_keys=()):
+        "Evict the entries above max_size (except for the kept_keys) and commit the changes."
+        self.evict(kept_keys)
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+        self.last_commit = time.time()
+
+    def close(self):
+        self.commit()
+        with self.lock:
+            self.connection.close()
+
+    def parse_through(self, paragraphs, function_name, parse_misses):
+        """
+        Yield the results for the paragraphs in their order, taking them from the cache where
+        possible. Parse_misses should take an iterable of the paragraphs not found in the cache
+        and yield their results, in order; these results are stored in the cache. The paragraphs
+        are read lazily, so they can come from a stream.
+        """
+        # (key, whether it is in the cache) for the paragraphs that were read, but not yet
+        # handed over. This is filled when parse_misses reads the missed paragraphs, possibly
+        # in another thread.
+        read_keys = deque()
+        # The keys of the missed paragraphs that are not stored yet. Repeated paragraphs are
+        # parsed only once, and then found in the cache.
+        missed_keys = set()
+        # The keys of the paragraphs to be taken from the cache (with their counts), which cannot
+        # be evicted before they are read.
+        pending_keys = dict()
+        def missed_paragraphs():
+            for paragraph in paragraphs:
+                key = self.key(paragraph, function_name)
+                with self.lock:
+                    cached = key in missed_keys or self.connection.execute(
+                            'SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone() is not None
+                    if cached:
+                        pending_keys[key] = pending_keys.get(key, 0) + 1
+                    else:
+                        missed_keys.add(key)
+                read_keys.append((key, cached))
+                if not cached:
+                    yield paragraph
+        missed_results = iter(parse_misses(missed_paragraphs()))
+        waiting_results = deque()
+        while True:
+            if len(read_keys) == 0:
+                # Make parse_misses read more of the paragraphs.
+                try:
+                    waiting_results.append(next(missed_results))
+                except StopIteration:
+                    if len(read_keys) == 0:
+                        break
+                continue
+            key, cached = read_keys.popleft()
+            if cached:
+                result = self.get(key)
+                with self.lock:
+                    pending_keys[key] -= 1
+                    if pending_keys[key] == 0:
+                        del pending_keys[key]
+                yield result
+            else:
+                if len(waiting_results) == 0:
+                    waiting_results.append(next(missed_results))
+                result = waiting_results.popleft()
+                self.misses += 1
+                self.put(key, result)
+                with self.lock:
+                    missed_keys.discard(key)
+                if (self.uncommitted >= self.commit_every
+                        or time.time() - self.last_commit >= self.commit_interval):
+                    self.commit(kept_keys=pending_keys)
+                yield result
+        self.commit(kept_keys=pending_keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return ('Parse cache: {} hits, {} misses ({:.1f}% hit rate), {} evicted, {:.1f} MB'
+                ' stored.'.format(self.hits, self.misses,
+                    (100 * self.hits / lookups) if lookups else 0.0, self.evictions,
+                    self.size() / 1024**2))
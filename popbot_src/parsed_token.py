@@ -1,18 +1,33 @@
+import sys
+
 class NoneTokenError(Exception):
     pass
 
+# The interps are shared between tokens as tuples: tag string -> tuple of tags.
+interned_interps = dict()
+
+def interned_interp(interp):
+    "Return the shared tuple of tags for the interp, given as a list of tags or a string."
+    interp_str = interp if isinstance(interp, str) else ':'.join(interp)
+    if not interp_str in interned_interps:
+        interned_interps[interp_str] = tuple(interp_str.split(':'))
+    return interned_interps[interp_str]
+
 class ParsedToken():
     """
-    The class for saving parsed tokens obtained by morpho.py.
+    The class for saving parsed tokens obtained by morpho.py. The forms and lemmas are interned
+    strings and the interps shared tuples of tags, so the many tokens of a corpus take less memory.
     """
+    __slots__ = ['form', 'lemma', 'interp', 'proper_name', 'unknown_form', 'latin', 'corrected',
+            'position', 'pause', 'corresp_index', 'chosen', 'following_tokens',
+            'sentence_starting']
+
     def __init__(self, form, lemma, interp, position=False,
             proper_name=False, unknown_form=False, latin=False, corrected=False,
             pause='', corresp_index=False, chosen=True, sentence_starting=False):
-        self.form = form
-        self.lemma = lemma
-        if not isinstance(interp, list):
-            interp = interp.split(':')
-        self.interp = interp
+        self.form = sys.intern(form)
+        self.lemma = sys.intern(lemma)
+        self.interp = interned_interp(interp)
         self.proper_name = proper_name
         self.unknown_form = unknown_form
         self.latin = latin
@@ -23,9 +38,20 @@ class ParsedToken():
         # The index in the original paragraph where the token starts.
         self.corresp_index = corresp_index
         self.chosen = chosen # whether the token was chosen during disambiguation
-        self.forward_paths = [] # all possible tokens after this one in the sentence DAG
+        # All possible tokens after this one in the sentence DAG, as a list made only when needed.
+        self.following_tokens = None
         self.sentence_starting = sentence_starting
 
+    @property
+    def forward_paths(self):
+        if self.following_tokens is None:
+            self.following_tokens = []
+        return self.following_tokens
+
+    @forward_paths.setter
+    def forward_paths(self, tokens):
+        self.following_tokens = tokens
+
     @classmethod
     def from_str(cls, token_str):
         if token_str.strip() == '':
@@ -37,9 +63,6 @@ class ParsedToken():
         self.unknown_form = '??' in semantic_fields
         self.latin = 'LA' in semantic_fields
         self.corrected = '!!' in semantic_fields
-        self.form = morpho_fields[0]
-        self.lemma = morpho_fields[1]
-        self.interp = morpho_fields[2:]
         return self
 
     def __repr__(self):
@@ -56,3 +79,143 @@ class ParsedToken():
 
     def interp_str(self):
         return ':'.join(self.interp)
+
+class SentenceDAG():
+    """
+    The tokens of a sentence, linked into a directed acyclic graph by their forward_paths, with
+    the sentence_starting ones beginning the paths. The paths can be walked, counted and scored
+    without listing all of them, since their number grows exponentially with ambiguous positions.
+    """
+    def __init__(self, tokens=None):
+        self.tokens = tokens if tokens is not None else []
+
+    def starting_tokens(self):
+        return [token for token in self.tokens if token.sentence_starting]
+
+    def topological_order(self):
+        "Return the tokens reachable from the sentence start, each before the tokens following it."
+        # Depth-first search with an explicit stack, to not hit the recursion limit.
+        visited = set()
+        finished = []
+        for start_token in self.starting_tokens():
+            if id(start_token) in visited:
+                continue
+            visited.add(id(start_token))
+            stack = [(start_token, iter(start_token.forward_paths))]
+            while stack:
+                token, next_tokens = stack[-1]
+                for next_token in next_tokens:
+                    if not id(next_token) in visited:
+                        visited.add(id(next_token))
+                        stack.append((next_token, iter(next_token.forward_paths)))
+                        break
+                else:
+                    stack.pop()
+                    finished.append(token)
+        return list(reversed(finished))
+
+    def iter_paths(self, first_tokens=None, end_token=None):
+        """
+        Yield the paths through the sentence one by one, as lists of tokens. The paths can start
+        at the first_tokens instead of the sentence start, and end before the end_token (skipping
+        the ones not reaching it) instead of at the sentence end.
+        """
+        for first_token in (first_tokens if first_tokens is not None
+                else self.starting_tokens()):
+            if first_token is end_token:
+                yield []
+                continue
+            path = [first_token]
+            stack = [iter(first_token.forward_paths)]
+            while stack:
+                next_token = next(stack[-1], None)
+                if next_token is None:
+                    if end_token is None and not path[-1].forward_paths:
+                        yield list(path)
+                    path.pop()
+                    stack.pop()
+                elif next_token is end_token:
+                    yield list(path)
+                else:
+                    path.append(next_token)
+                    stack.append(iter(next_token.forward_paths))
+
+    def all_paths(self):
+        return list(self.iter_paths())
+
+    def path_counts(self):
+        """Return two dictionaries of token ids: to the number of paths leading to the token from
+        the sentence start (including it) and to the number of paths from the token to the end."""
+        order = self.topological_order()
+        counts_to = dict([(id(token), 1 if token.sentence_starting else 0) for token in order])
+        for token in order:
+            for next_token in token.forward_paths:
+                counts_to[id(next_token)] += counts_to[id(token)]
+        counts_from = dict()
+        for token in reversed(order):
+            counts_from[id(token)] = (sum([counts_from[id(next_token)]
+                for next_token in token.forward_paths]) if token.forward_paths else 1)
+        return counts_to, counts_from
+
+    def count_paths(self):
+        "Return the number of paths through the sentence, without walking them."
+        counts_to, counts_from = self.path_counts()
+        return sum([counts_from[id(token)] for token in self.starting_tokens()])
+
+    def best_path(self, token_score, transition_score=None):
+        """
+        Return the path with the highest sum of token_score(token) for its tokens and (if given)
+        transition_score(token, next_token) for its consecutive pairs, and this score. Returns
+        (None, None) if there are no paths.
+        """
+        # token id -> (the best score from the token to the end, the best next token)
+        best_continuations = dict()
+        for token in reversed(self.topological_order()):
+            best_score, best_next_token = None, None
+            for next_token in token.forward_paths:
+                score = best_continuations[id(next_token)][0]
+                if transition_score is not None:
+                    score += transition_score(token, next_token)
+                if best_score is None or score > best_score:
+                    best_score, best_next_token = score, next_token
+            best_continuations[id(token)] = (token_score(token) + (best_score or 0),
+                    best_next_token)
+        best_start_token = None
+        for start_token in self.starting_tokens():
+            if (best_start_token is None or best_continuations[id(start_token)][0]
+                    > best_continuations[id(best_start_token)][0]):
+                best_start_token = start_token
+        if best_start_token is None:
+            return None, None
+        path = [best_start_token]
+        while best_continuations[id(path[-1])][1] is not None:
+            path.append(best_continuations[id(path[-1])][1])
+        return path, best_continuations[id(best_start_token)][0]
+
+    def token_positions(self):
+        """
+        Return the positions of the sentence: the tokens that are on all the paths, and between
+        them, the lists of alternatives (a token, or a list of tokens if there are more in the
+        alternative). Only the paths between the consecutive common tokens are walked.
+        """
+        counts_to, counts_from = self.path_counts()
+        paths_count = sum([counts_from[id(token)] for token in self.starting_tokens()])
+        positions = []
+        # The alternatives before the first common token are walked from the starting tokens.
+        segment_starts = self.starting_tokens()
+        for token in self.topological_order():
+            if counts_to[id(token)] * counts_from[id(token)] != paths_count:
+                continue
+            if segment_starts != [token]:
+                positions.append(self.alternatives(segment_starts, token))
+            positions.append(token)
+            segment_starts = token.forward_paths
+        if segment_starts:
+            positions.append(self.alternatives(segment_starts, None))
+        return positions
+
+    def alternatives(self, first_tokens, end_token):
+        """Return the alternative paths from the first_tokens up to the end_token (or the end of
+        the sentence), as tokens or lists of tokens if they are longer."""
+        return [alternative[0] if len(alternative) == 1 else alternative
+                for alternative in self.iter_paths(first_tokens, end_token)]
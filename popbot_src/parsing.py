@@ -1,162 +1,211 @@
-import time
-import csv
+import bisect
+from collections import OrderedDict
 import copy
+import io
 from logging import info
+import multiprocessing
+import multiprocessing.util
 import os
-import pexpect
-import re
+import subprocess
+import sys
+import tempfile
+import threading
 import yaml
 
 from morfeusz2 import Morfeusz
 
-from popbot_src.parsed_token import ParsedToken
+from popbot_src.concraft import ConcraftServer, concraft_sentences, parse_concraft_output
+from popbot_src.fast_tagger import FastTagger, read_interp_table
+from popbot_src.morfeusz_dag import FormCachedAnalyzer, analysed_dag
+from popbot_src.perceptron import PerceptronTagger
+from popbot_src.pipeline import pipelined, timings_stats
 from popbot_src.MAGIC import Analyse
 
-MORFEUSZ_CONCRAFT_TEMP = f'MORFEUSZ_CONCRAFT_TEMP{time.time()}'
+# The maximum length of text passed to the analyzers at once.
+CHUNK_SIZE = 2500#200*115
+# The default size (in characters of DAG) of Concraft requests in parse_sentences_batch.
+TAGGER_BATCH_CHARS = 200000
+# How many tagged sentences parse_sentences_batch keeps for reuse.
+SENTENCE_MEMO_SIZE = 100000
 
-def stringify_value(value):
-    if value != 0 and not value:
-        return ''
-    return str(value)
+# Loaded configurations and analyzers, kept for the whole process so the dictionaries are read
+# only once. Analyzers are keyed by (morfeusz_model_dir, morfeusz_model).
+base_configs = dict() # config path -> configuration dictionary
+morfeusz_analyzers = dict()
+path_analyzers = dict()
+concraft_servers = dict() # concraft model path -> ConcraftServer
+# concraft model path -> FastTagger or PerceptronTagger used instead of the model
+fast_taggers = dict()
+# The sentences tagged by parse_sentences_batch, so repeated sentences are tagged once: DAG of the
+# sentence (with nodes from 0) -> its tagged sentences, with positions counted from 0.
+tagged_sentences = OrderedDict()
+sentence_counts = { 'sentences': 0, 'tagged': 0, 'dag_chars': 0, 'tagged_dag_chars': 0 }
+# Seconds spent and items done in the stages of parsing: stage name -> [seconds, items].
+stage_timings = dict()
 
-def merge_morfeusz_variants(morfeusz_output, stringify_values=True):
+def read_base_config(config_path='config.yml'):
+    "Load the configuration with model paths, reusing the one already read from config_path."
+    if not config_path in base_configs:
+        with open(config_path) as base_config_file:
+            base_configs[config_path] = yaml.load(base_config_file, Loader=yaml.Loader)
+    return base_configs[config_path]
+
+def analyzer_key(base_config):
+    return (base_config['morfeusz_model_dir'], base_config['morfeusz_model'])
+
+def morfeusz_analyzer(base_config):
+    "Get the Morfeusz analyzer for the models in base_config, loading it on the first use."
+    key = analyzer_key(base_config)
+    if not key in morfeusz_analyzers:
+        info('Loading the Morfeusz model {} from {}.'.format(key[1], key[0]))
+        morfeusz_analyzers[key] = Morfeusz(dict_path=base_config['morfeusz_model_dir'],
+                dict_name=base_config['morfeusz_model'],
+                generate=False, expand_tags=True)
+    return morfeusz_analyzers[key]
+
+def path_analyzer(base_config):
+    "Get the DAG path analyzer for the models in base_config, loading it on the first use."
+    key = analyzer_key(base_config)
+    if not key in path_analyzers:
+        path_analyzers[key] = Analyse(base_config['morfeusz_model_dir'],
+                base_config['morfeusz_model'])
+    return path_analyzers[key]
+
+def init_analyzers(base_config=False, with_paths=False, with_concraft_server=False,
+        form_cache_size=0, fast_tagger_table=False, perceptron_model=False):
     """
-    With output from the Morfeusz Python binding, transform the tuples of (start_node, end_node, (interp...))
-    into lists of nodes of [(start_node, end_node, interp...), ...], merging variants of the same
-    start-end position into one list each.
+    Load the analyzers up front, so the parsing functions can reuse them. Scripts should call this
+    before parsing and release_analyzers() when they are done. With_paths also loads the path
+    analyzer used by tokens_paths. With_concraft_server starts a Concraft server (on the
+    concraft_port from the config, 3000 by default) that parse_sentences will use instead of
+    running Concraft separately for each chunk. With form_cache_size, the Morfeusz analyses of
+    up to this many word forms are remembered, so repeated forms are analysed only once. With
+    fast_tagger_table (a dictionary file made by extract_dictionary.py), parse_sentences uses a
+    FastTagger with this table instead of Concraft, and with perceptron_model (trained with
+    train_tagger.py) a PerceptronTagger.
     """
-    positions_lists = dict() # start_end -> ready lists
-    for node_n, node in enumerate(morfeusz_output):
-        key = '{}_{}'.format(node[0], node[1])
-        if not key in positions_lists:
-            positions_lists[key] = []
-        variant_list = list((node[0], node[1]) + node[2]) # form one list
-        if stringify_values:
-            variant_list = [stringify_value(val) for val in variant_list]
-        positions_lists[key].append(variant_list)
-
-    def position_sorter(key):
-        start, end = tuple(key.split('_'))
-        return int(start)*1000 + int(end)
-    return [item[1] for item in sorted(positions_lists.items(), key=lambda item: position_sorter(item[0]))]
-
-def split_morfeusz_sents(morfeusz_nodes, verbose=False):
-    """Given an output from parse_morfeusz_output, return it as a list of sentences."""
-    sent_boundaries = [0]
-    previous_brev = False
-    for (node_n, node) in enumerate(morfeusz_nodes):
-        current_brev = False
-        for variant in node:
-            if 'brev' in variant[4]:
-                previous_brev = True
-                current_brev = True
-            if variant[2] == '.' and not previous_brev:
-                sent_boundaries.append(node_n+1)
-        if not current_brev:
-            previous_brev = False
-    sent_boundaries.append(len(morfeusz_nodes))
-    if verbose:
-        print('sentence boundaries', sent_boundaries)
-    sents = []
-    for (bnd_n, bnd) in enumerate(sent_boundaries[1:]):
-        sents.append(morfeusz_nodes[sent_boundaries[bnd_n]:bnd]) # bnd_n is effectively bnd_n-1, because of skipping first element
-    sents = [s for s in sents if len(s) > 0]
-    return sents
+    if not base_config:
+        base_config = read_base_config()
+    analyzer = morfeusz_analyzer(base_config)
+    if form_cache_size and not isinstance(analyzer, FormCachedAnalyzer):
+        morfeusz_analyzers[analyzer_key(base_config)] = FormCachedAnalyzer(analyzer,
+                max_forms=form_cache_size)
+    if with_paths:
+        path_analyzer(base_config)
+    if with_concraft_server and not base_config['concraft_model'] in concraft_servers:
+        info('Starting the Concraft server with {}.'.format(base_config['concraft_model']))
+        server = ConcraftServer(base_config['concraft_model'],
+                port=base_config.get('concraft_port', 3000))
+        concraft_servers[base_config['concraft_model']] = server.start()
+    if fast_tagger_table:
+        fast_taggers[base_config['concraft_model']] = FastTagger(
+                read_interp_table(fast_tagger_table))
+    if perceptron_model:
+        fast_taggers[base_config['concraft_model']] = PerceptronTagger.load(perceptron_model)
+    return base_config
+
+def form_cache_stats():
+    "Return the statistics of the form caches of the loaded Morfeusz analyzers."
+    return [analyzer.stats() for analyzer in morfeusz_analyzers.values()
+            if isinstance(analyzer, FormCachedAnalyzer)]
+
+def stage_stats():
+    "Return the statistics of the parsing stages in this process."
+    return timings_stats(stage_timings)
+
+def release_analyzers():
+    "Drop all the loaded analyzers and configurations, so their memory can be freed."
+    for server in concraft_servers.values():
+        server.stop()
+    concraft_servers.clear()
+    fast_taggers.clear()
+    tagged_sentences.clear()
+    morfeusz_analyzers.clear()
+    path_analyzers.clear()
+    base_configs.clear()
+
+def spill_dag(dag_spill_path, dag_str):
+    "Append the DAG to the file at dag_spill_path, to be inspected when debugging."
+    with open(dag_spill_path, 'a', encoding='utf-8') as spill_file:
+        spill_file.write(dag_str)
+
+def tagging_stages(base_config):
+    """
+    Return the stages (for pipelined) taking DAG strings to the sentences as lists of ParsedToken
+    objects. With the Concraft server for the model in base_config, its response is read in a
+    separate stage, so it can overlap with the next request. Otherwise Concraft is run separately
+    and its output is read while it is produced.
+    """
+    if base_config['concraft_model'] in concraft_servers:
+        return [('tagging', concraft_servers[base_config['concraft_model']].tag),
+                ('reading', parse_concraft_output)]
+    return [('tagging', lambda dag_str: parse_with_concraft(base_config['concraft_model'],
+        dag_str))]
 
-def write_dag_from_morfeusz(path, morfeusz_nodes, append_sentence=False):
-    """Write the Morfeusz output graph (DAG) to a file, where it can be read from by Concraft"""
-    open_settings = 'a' if append_sentence else 'w+'
-    with open(path, open_settings, encoding='utf-8') as out:
-        writer = csv.writer(out, dialect='excel', delimiter='\t')
-        for (node_n, node) in enumerate(morfeusz_nodes):
-            for variant in node:
-                if node_n < (len(morfeusz_nodes) - 1):
-                    concraft_columns = [str(1/len(node)), '', '', '']
-                else: # add end of sentence tag
-                    concraft_columns = [str(1/len(node)), '', 'eos', '']
-                writer.writerow(variant + concraft_columns)
-        print('', file=out) # newline
-
-def parse_with_concraft(concraft_model_path, input_path):
-    concraft = pexpect.spawn('concraft-pl tag -i {} {}'.format(input_path, concraft_model_path))
-    concraft.delaybeforesend = None
-    pexp_result = concraft.expect([pexpect.EOF, pexpect.TIMEOUT])
-    if pexp_result != 0:
-        raise RuntimeError('there was a Concraft timeout: {}'.format(concraft.before))
-    concraft_interp = concraft.before.decode()
-    if 'concraft-pl:' in concraft_interp:
-        raise RuntimeError('there was a Concraft error: {}'.format(concraft_interp))
-    sents = []
-    current_sent_tokens = []
-    to_map, from_map = [], dict() # pairs (node/token, to_position), (from values) -> (tokens there)
-    # Store the already disambiguated paths to avoid repetitions in output.
-    decided_paths = []
-    lines = concraft_interp.split('\n')
-    lines_fields = [line.split('\t') for line in lines]
-    sent_start_index = min([int(fields[0]) for fields in lines_fields if len(fields) == 12])
-    for line_n, fields in enumerate(lines_fields):
-
-        if len(lines[line_n].strip()) == 0: # end of sentence
-            for token, to_position in to_map:
-                if to_position in from_map: # isn't true at the end of sentence
-                    token.forward_paths = from_map[to_position]
-            sents.append(current_sent_tokens)
-            current_sent_tokens = []
-            to_map, from_map = [], dict()
-            # Update the start index.
-            if len(lines_fields[line_n+1:]) > 1:
-                sent_start_index = min([int(fields[0]) for fields
-                    in lines_fields[line_n+1:] if len(fields) == 12])
-            continue
-
-        if len(fields) != 12:
-            raise RuntimeError('Incorrect number of columns in Concraft output - {}, not 12:'
-                    ' {}'.format(len(fields), lines[line_n]))
-        if str(fields[0:2]) in decided_paths or not re.search('disamb\\r$', lines[line_n]):
-            continue
-        token = ParsedToken(fields[2], fields[3], fields[4].split(':'), # split the interp into a list of tags
-                position=int(fields[0]))
-        current_sent_tokens.append(token)
-
-        from_index = fields[0]
-        to_index = fields[1]
-        to_map.append((token, to_index))
-        if not from_index in from_map:
-            from_map[from_index] = []
-        from_map[from_index].append(token)
-        if int(from_index) == sent_start_index:
-            token.sentence_starting = True
-
-        decided_paths.append(str(fields[0:2]))
-
-    if len(sents) != 0 and not sents[-1]: # remove the last empty "sentence" if present
-        sents = sents[:-1]
+def tag_dag(base_config, dag_str):
+    "Tag the DAG string and return the sentences as lists of ParsedToken objects."
+    if base_config['concraft_model'] in concraft_servers:
+        return concraft_servers[base_config['concraft_model']].parse(dag_str)
+    return parse_with_concraft(base_config['concraft_model'], dag_str)
+
+def parse_with_concraft(concraft_model_path, dag_str):
+    """Run Concraft on the DAG string and return the sentences as lists of ParsedToken objects,
+    reading them from its output while it is produced."""
+    with tempfile.TemporaryFile() as stderr_file:
+        concraft = subprocess.Popen(['concraft-pl', 'tag', concraft_model_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr_file)
+        # Write the input in another thread, so Concraft never waits for its output to be read.
+        def write_input():
+            try:
+                concraft.stdin.write(dag_str.encode('utf-8'))
+            except BrokenPipeError: # Concraft has failed
+                pass
+            finally:
+                concraft.stdin.close()
+        input_thread = threading.Thread(target=write_input, daemon=True)
+        input_thread.start()
+        error_lines = []
+        def output_lines():
+            for line in io.TextIOWrapper(concraft.stdout, encoding='utf-8', newline=''):
+                if 'concraft-pl:' in line:
+                    error_lines.append(line)
+                    return
+                yield line
+        try:
+            sents = list(concraft_sentences(output_lines()))
+        except RuntimeError:
+            if concraft.wait() == 0:
+                raise
+            # The output was cut by a Concraft failure, reported below.
+        finally:
+            input_thread.join()
+            concraft.wait()
+        if concraft.returncode != 0 or error_lines:
+            stderr_file.seek(0)
+            raise RuntimeError('there was a Concraft error: {}'.format(''.join(error_lines)
+                + stderr_file.read().decode()))
     return sents
 
-def tokens_paths(sents_str, base_config=False):
+def tokens_paths(sents_str, base_config=False, dag_spill_path=False):
     """
     Return sentences as lists of token dictionaries extracted from the Morfeusz analysis. These dictionaries
     should also contain numbers of the tokens' positions in the sentence's direct acyclic graph.
+    The DAGs can be also appended to the file at dag_spill_path for debugging.
     """
     if sents_str.strip() == '':
         return []
         ##raise ValueError('called parse_sentences on empty string')
 
     if not base_config:
-        # Load the configuration.
-        with open('config.yml') as base_config_file:
-            base_config = yaml.load(base_config_file, Loader=yaml.Loader)
-
-    # Prepare the Morfeusz process.
-    morfeusz_analyzer = Morfeusz(dict_path=base_config['morfeusz_model_dir'],
-            dict_name=base_config['morfeusz_model'],
-            generate=False, expand_tags=True)
+        base_config = read_base_config()
 
-    path_analyzer = Analyse(base_config['morfeusz_model_dir'], base_config['morfeusz_model'])
+    # Get the (possibly already loaded) Morfeusz analyzer.
+    analyzer = morfeusz_analyzer(base_config)
+    dag_path_analyzer = path_analyzer(base_config)
     pathed_sentences = []
 
     parsed_boundary = 0 # track where we left the parsing after the previous chunk
-    chunk_size = 2500#200*115
+    chunk_size = CHUNK_SIZE
     while len(sents_str) != parsed_boundary:
         previous_parsed_boundary = parsed_boundary
         parsed_boundary = sents_str[:parsed_boundary+chunk_size].rfind(' ')
@@ -164,17 +213,21 @@ def tokens_paths(sents_str, base_config=False):
             parsed_boundary = len(sents_str)
         str_chunk = sents_str[previous_parsed_boundary:parsed_boundary]
 
-        parsed_nodes = morfeusz_analyzer.analyse(str_chunk)
-        parsed_nodes = merge_morfeusz_variants(parsed_nodes)
-        morfeusz_sentences = split_morfeusz_sents(parsed_nodes)
-        for sent_n, morf_sent in enumerate(morfeusz_sentences):
-            if sent_n == 0:
-                write_dag_from_morfeusz(MORFEUSZ_CONCRAFT_TEMP, morf_sent)
-            else:
-                write_dag_from_morfeusz(MORFEUSZ_CONCRAFT_TEMP, morf_sent, append_sentence=True)
-        # Get a list of token postions with their interps.
-        tokens_interps = path_analyzer.text_analyse(MORFEUSZ_CONCRAFT_TEMP, sents_str,
-                start_offset=previous_parsed_boundary)
+        morfeusz_dag = analysed_dag(analyzer, str_chunk)
+        sentence_bounds = morfeusz_dag.sentence_bounds()
+        dag_str = morfeusz_dag.dag_string(sentence_bounds)
+        if dag_spill_path:
+            spill_dag(dag_spill_path, dag_str)
+        # The path analyzer reads the DAG only from a file, so give it a private temporary one.
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.dag',
+                delete=False) as dag_file:
+            dag_file.write(dag_str)
+        try:
+            # Get a list of token postions with their interps.
+            tokens_interps = dag_path_analyzer.text_analyse(dag_file.name, sents_str,
+                    start_offset=previous_parsed_boundary)
+        finally:
+            os.remove(dag_file.name)
         # Extract sentences from the tokens_interps.
         sent_counter = 0
         sent_start = 0
@@ -182,83 +235,338 @@ def tokens_paths(sents_str, base_config=False):
             real_token = token # extract some real token from the dictionary of alternate interps
             while type(real_token) != dict:
                 real_token = real_token[0]
-            if tok_n == len(tokens_interps) or real_token['end'] == int(morfeusz_sentences[sent_counter][-1][0][1]):
+            if tok_n == len(tokens_interps) or real_token['end'] == morfeusz_dag.ends[sentence_bounds[sent_counter][1]-1]:
                 pathed_sentences.append(tokens_interps[sent_start:tok_n+1])
                 sent_start = tok_n+1
                 sent_counter += 1
-        os.remove(MORFEUSZ_CONCRAFT_TEMP)
 
     return pathed_sentences
 
-def parse_sentences(sents_str, verbose=False, category_sigils=True, base_config=False):
+def parse_sentences(sents_str, verbose=False, category_sigils=True, base_config=False,
+        dag_spill_path=False):
     """
     Use Morfeusz and Concraft to obtain the sentences as lists of ParsedToken objects. The
     base_config option can be used to provide a dictionary with morfeusz_model_dir, morfeusz_model
-    and concraft_models providing appropriate paths for models for these programs.
+    and concraft_models providing appropriate paths for models for these programs. The DAGs
+    passed to Concraft can be also appended to the file at dag_spill_path for debugging.
+    When the text is longer than one chunk, the next chunk is analysed while the previous one is
+    tagged.
     """
     if sents_str.strip() == '':
         raise ValueError('called parse_sentences on empty string')
 
     if not base_config:
-        # Load the configuration.
-        with open('config.yml') as base_config_file:
-            base_config = yaml.load(base_config_file, Loader=yaml.Loader)
+        base_config = read_base_config()
 
-    # Prepare the Morfeusz process.
-    morfeusz_analyzer = Morfeusz(dict_path=base_config['morfeusz_model_dir'],
-            dict_name=base_config['morfeusz_model'],
-            generate=False, expand_tags=True)
+    # Get the (possibly already loaded) Morfeusz analyzer.
+    analyzer = morfeusz_analyzer(base_config)
 
-    parsed_sents = []
-    parsed_boundary = 0 # track where we left the parsing after the previous chunk
-    chunk_size = 2500#200*115
-    while len(sents_str) != parsed_boundary:
-        previous_parsed_boundary = parsed_boundary
-        parsed_boundary = sents_str[:parsed_boundary+chunk_size].rfind(' ')
-        if parsed_boundary == -1 or previous_parsed_boundary+chunk_size >= len(sents_str):
-            parsed_boundary = len(sents_str)
-        str_chunk = sents_str[previous_parsed_boundary:parsed_boundary]
+    def chunk_dags():
+        parsed_boundary = 0 # track where we left the parsing after the previous chunk
+        chunk_size = CHUNK_SIZE
+        while len(sents_str) != parsed_boundary:
+            previous_parsed_boundary = parsed_boundary
+            parsed_boundary = sents_str[:parsed_boundary+chunk_size].rfind(' ')
+            if parsed_boundary == -1 or previous_parsed_boundary+chunk_size >= len(sents_str):
+                parsed_boundary = len(sents_str)
+            str_chunk = sents_str[previous_parsed_boundary:parsed_boundary]
 
-        parsed_nodes = morfeusz_analyzer.analyse(str_chunk)
-        if verbose:
-            print(len(parsed_nodes), 'parsed nodes')
-
-        parsed_nodes = merge_morfeusz_variants(parsed_nodes)
-        morfeusz_sentences = split_morfeusz_sents(parsed_nodes, verbose=verbose)
-        if verbose:
-            print('Morfeusz sentences,', len(morfeusz_sentences), ':', morfeusz_sentences)
-        for sent_n, morf_sent in enumerate(morfeusz_sentences):
-            if sent_n == 0:
-                write_dag_from_morfeusz(MORFEUSZ_CONCRAFT_TEMP, morf_sent)
-            else:
-                write_dag_from_morfeusz(MORFEUSZ_CONCRAFT_TEMP, morf_sent, append_sentence=True)
-        parsed_sents += parse_with_concraft(base_config['concraft_model'], MORFEUSZ_CONCRAFT_TEMP)
-        os.remove(MORFEUSZ_CONCRAFT_TEMP)
+            morfeusz_dag = analysed_dag(analyzer, str_chunk)
+            if verbose:
+                print(len(morfeusz_dag), 'parsed positions')
 
+            sentence_bounds = morfeusz_dag.sentence_bounds()
+            if verbose:
+                print('Morfeusz sentences,', len(sentence_bounds), ':',
+                        [morfeusz_dag.positions(first, end) for (first, end) in sentence_bounds])
+            yield morfeusz_dag, sentence_bounds
+
+    def chunk_dag_strings():
+        for morfeusz_dag, sentence_bounds in chunk_dags():
+            dag_str = morfeusz_dag.dag_string(sentence_bounds)
+            if dag_spill_path:
+                spill_dag(dag_spill_path, dag_str)
+            yield dag_str
+
+    if base_config['concraft_model'] in fast_taggers:
+        fast_tagger = fast_taggers[base_config['concraft_model']]
+        # There is no tagger process to wait for, so nothing to overlap.
+        source = chunk_dags()
+        stages = [('fast tagging', lambda chunk: fast_tagger.tag(*chunk))]
+        threaded = False
+    else:
+        source = chunk_dag_strings()
+        stages = tagging_stages(base_config)
+        threaded = len(sents_str) > CHUNK_SIZE
+    parsed_sents = []
+    for chunk_sents in pipelined(source, stages, source_name='analysis', threaded=threaded,
+            timings=stage_timings):
+        parsed_sents += chunk_sents
     return parsed_sents
 
-def parsed_sections(raw_sections):
-    result_sections = []
-    for sec_n, sec in enumerate(raw_sections):
-        for x in range(10):
-            if (sec_n >= ((len(raw_sections) / 10) * x)
-                    and (sec_n-1) < ((len(raw_sections) / 10) * x)):
-                info('Done {}% of parsing.'.format(x*10))
-        new_sec = copy.deepcopy(sec)
-        for par_n, (page, paragraph) in enumerate(new_sec.pages_paragraphs):
-            new_sec.pages_paragraphs[par_n] = (page, parse_sentences(paragraph))
-        result_sections.append(new_sec)
-    return result_sections
+def parse_sentences_batch(paragraphs, base_config=False, batch_chars=TAGGER_BATCH_CHARS,
+        dag_spill_path=False):
+    """
+    Return the results of parse_sentences for all the paragraphs, but sending them to Concraft
+    together, in requests of about batch_chars characters of DAG. The paragraphs are split only at
+    sentence boundaries. The positions of tokens are counted from the start of their paragraph.
+    The next request is prepared while the previous one is tagged. Sentences repeated in the
+    paragraphs, or tagged before in the process, are tagged only once.
+    """
+    if not base_config:
+        base_config = read_base_config()
+    if base_config['concraft_model'] in fast_taggers:
+        # The in-process taggers gain nothing from batching.
+        return [parse_sentences(paragraph, base_config=base_config, dag_spill_path=dag_spill_path)
+                for paragraph in paragraphs]
+    analyzer = morfeusz_analyzer(base_config)
+
+    for paragraph in paragraphs:
+        if paragraph.strip() == '':
+            raise ValueError('called parse_sentences on empty string')
+
+    # The tagged sentences go to slots, one for each sentence of Morfeusz, in the paragraphs.
+    results_slots = [[] for paragraph in paragraphs]
+    # The sentences seen before, to be filled in after tagging: (paragraph number, slot number,
+    # sentence key, first node of the sentence).
+    repeated_sentences = []
+    tagged_keys = set() # the keys of the sentences sent to Concraft in this call
+
+    def requests():
+        # Yield the requests as DAG strings with the sentences' ranges of nodes, as (first node,
+        # paragraph number, slot number, sentence key, node offset). Node numbers are made unique
+        # in the whole request, so the tagged sentences can be mapped back to their paragraphs.
+        request_dags, request_ranges, request_chars = [], [], 0
+        next_node = 0 # the last node number used in the current request
+        for par_n, paragraph in enumerate(paragraphs):
+            morfeusz_dag = analysed_dag(analyzer, paragraph)
+            node_offset = next_node
+            for first, end in morfeusz_dag.sentence_bounds():
+                slot_n = len(results_slots[par_n])
+                results_slots[par_n].append([])
+                # The sentence with nodes counted from 0 identifies it (for Concraft, which tags
+                # each sentence separately, too).
+                sentence_key = morfeusz_dag.dag_string([(first, end)],
+                        node_offset=-morfeusz_dag.starts[first])
+                sentence_counts['sentences'] += 1
+                sentence_counts['dag_chars'] += len(sentence_key)
+                if sentence_key in tagged_keys or sentence_key in tagged_sentences:
+                    repeated_sentences.append((par_n, slot_n, sentence_key,
+                        morfeusz_dag.starts[first]))
+                    continue
+                tagged_keys.add(sentence_key)
+                if request_dags and request_chars >= batch_chars:
+                    yield ''.join(request_dags), request_ranges
+                    # Start the new request from node 0.
+                    node_offset = -morfeusz_dag.starts[first]
+                    request_dags, request_ranges, request_chars = [], [], 0
+                request_ranges.append((morfeusz_dag.starts[first] + node_offset, par_n, slot_n,
+                    sentence_key, node_offset))
+                sent_dag = morfeusz_dag.dag_string([(first, end)], node_offset=node_offset)
+                request_dags.append(sent_dag)
+                request_chars += len(sent_dag)
+                next_node = max(morfeusz_dag.ends[first:end]) + node_offset
+                sentence_counts['tagged'] += 1
+                sentence_counts['tagged_dag_chars'] += len(sentence_key)
+        if request_dags:
+            yield ''.join(request_dags), request_ranges
+
+    def spilled_requests():
+        for dag_str, request_ranges in requests():
+            if dag_spill_path:
+                spill_dag(dag_spill_path, dag_str)
+            yield dag_str, request_ranges
 
-def pathed_sections(raw_sections):
-    result_sections = []
-    for sec_n, sec in enumerate(raw_sections):
+    # The stages take and give the requests' data along with their ranges.
+    stages = [(stage_name, lambda request, function=function:
+        (function(request[0]), request[1]))
+        for (stage_name, function) in tagging_stages(base_config)]
+    new_sentences = dict() # sentence key -> tagged sentences, with positions counted from 0
+    for tagged_sents, request_ranges in pipelined(spilled_requests(), stages,
+            source_name='analysis', timings=stage_timings):
+        range_starts = [first_node for (first_node, par_n, slot_n, sentence_key, node_offset)
+                in request_ranges]
+        for sent in tagged_sents:
+            if len(sent) == 0:
+                continue
+            first_node, par_n, slot_n, sentence_key, node_offset = request_ranges[
+                    bisect.bisect_right(range_starts, sent[0].position) - 1]
+            if not sentence_key in new_sentences:
+                new_sentences[sentence_key] = []
+            new_sentences[sentence_key] += copied_sentences([sent], -first_node)
+            for token in sent:
+                token.position -= node_offset
+            results_slots[par_n][slot_n].append(sent)
+    for par_n, slot_n, sentence_key, first_node in repeated_sentences:
+        if sentence_key in tagged_sentences:
+            tagged_sentences.move_to_end(sentence_key)
+        # (a sentence sent to Concraft may come back without tokens, and then it's left empty)
+        results_slots[par_n][slot_n] = copied_sentences(new_sentences.get(sentence_key,
+            tagged_sentences.get(sentence_key, [])), first_node)
+    for sentence_key, sents in new_sentences.items():
+        tagged_sentences[sentence_key] = sents
+        if len(tagged_sentences) > SENTENCE_MEMO_SIZE:
+            tagged_sentences.popitem(last=False)
+    return [[sent for slot in slots for sent in slot] for slots in results_slots]
+
+def copied_sentences(sents, position_offset):
+    "Return copies of the tagged sentences, with the positions of tokens moved by position_offset."
+    copies = []
+    for sent in sents:
+        token_copies = dict() # id of the original token -> its copy
+        for token in sent:
+            token_copy = copy.copy(token)
+            token_copy.position = token.position + position_offset
+            token_copies[id(token)] = token_copy
+        for token_copy in token_copies.values():
+            if token_copy.following_tokens is not None:
+                token_copy.forward_paths = [token_copies.get(id(next_token), next_token)
+                        for next_token in token_copy.following_tokens]
+        copies.append([token_copies[id(token)] for token in sent])
+    return copies
+
+def sentence_dedup_stats():
+    "Return the statistics of the sentences tagged once for their repetitions."
+    return ('Sentence deduplication: {} of {} sentences tagged ({:.1f}% saved), {} of {} DAG'
+            ' characters.'.format(sentence_counts['tagged'], sentence_counts['sentences'],
+                100 * (1 - sentence_counts['tagged'] / sentence_counts['sentences'])
+                if sentence_counts['sentences'] else 0.0,
+                sentence_counts['tagged_dag_chars'], sentence_counts['dag_chars']))
+
+def release_worker_analyzers():
+    "Report the cache and stage statistics of a worker process and release its analyzers."
+    for stats in form_cache_stats() + [stage_stats(), sentence_dedup_stats()]:
+        print('Worker {}: {}'.format(os.getpid(), stats), file=sys.stderr)
+    release_analyzers()
+
+def init_worker(base_config, with_paths, with_concraft_server, form_cache_size, fast_tagger_table,
+        perceptron_model, worker_counter):
+    "Prepare own analyzers in a worker process of parse_paragraphs."
+    with worker_counter.get_lock():
+        worker_n = worker_counter.value
+        worker_counter.value += 1
+    # Forget the analyzers copied from the parent process, without stopping its Concraft server.
+    morfeusz_analyzers.clear()
+    path_analyzers.clear()
+    concraft_servers.clear()
+    fast_taggers.clear()
+    tagged_sentences.clear()
+    stage_timings.clear()
+    for count_name in sentence_counts:
+        sentence_counts[count_name] = 0
+    if with_concraft_server:
+        # Each worker needs its own port for its Concraft server.
+        base_config = dict(base_config,
+                concraft_port=base_config.get('concraft_port', 3000) + worker_n)
+    init_analyzers(base_config, with_paths=with_paths, with_concraft_server=with_concraft_server,
+            form_cache_size=form_cache_size, fast_tagger_table=fast_tagger_table,
+            perceptron_model=perceptron_model)
+    # Stop the Concraft server when the worker exits.
+    multiprocessing.util.Finalize(None, release_worker_analyzers, exitpriority=10)
+
+def parse_batch(function_and_batch):
+    parse_function, batch, tagger_batch_chars = function_and_batch
+    if tagger_batch_chars:
+        return parse_sentences_batch(batch, batch_chars=tagger_batch_chars)
+    return [parse_function(paragraph) for paragraph in batch]
+
+def paragraph_batches(paragraphs, batch_size, max_chars=False):
+    "Group the paragraphs in batches of batch_size (if set) or max_chars characters (if set)."
+    batch = []
+    batch_chars = 0
+    for paragraph in paragraphs:
+        batch.append(paragraph)
+        batch_chars += len(paragraph)
+        if len(batch) == batch_size or (max_chars and batch_chars >= max_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+    if batch:
+        yield batch
+
+def parse_paragraphs(paragraphs, parse_function=parse_sentences, workers=1, batch_size=16,
+        with_paths=False, with_concraft_server=False, cache=False, tagger_batch_chars=False,
+        form_cache_size=0, fast_tagger_table=False, perceptron_model=False):
+    """
+    Yield the results of parse_function (parse_sentences or tokens_paths) for the paragraphs, in
+    their original order. With more than one worker, the paragraphs are sent in ordered batches to
+    a pool of processes, each of them with its own analyzers (and Concraft server, if
+    with_concraft_server is set). If a ParseCache is given, only the paragraphs not found there
+    are parsed. With tagger_batch_chars, parse_sentences is replaced with parse_sentences_batch
+    on batches of paragraphs of about this size. Form_cache_size sets the size of the Morfeusz
+    form cache, and fast_tagger_table or perceptron_model the tagger used instead of Concraft in the
+    workers (see init_analyzers).
+    """
+    if cache:
+        yield from cache.parse_through(paragraphs, parse_function.__name__,
+                lambda missed: parse_paragraphs(missed, parse_function=parse_function,
+                    workers=workers, batch_size=batch_size, with_paths=with_paths,
+                    with_concraft_server=with_concraft_server,
+                    tagger_batch_chars=tagger_batch_chars, form_cache_size=form_cache_size,
+                    fast_tagger_table=fast_tagger_table, perceptron_model=perceptron_model))
+        return
+    if tagger_batch_chars and parse_function != parse_sentences:
+        raise ValueError('tagger batches can be used only with parse_sentences')
+    if tagger_batch_chars:
+        # Fill the batches by size, so each of them makes about one Concraft request.
+        batches = paragraph_batches(paragraphs, None, max_chars=tagger_batch_chars)
+    else:
+        batches = paragraph_batches(paragraphs, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield from parse_batch((parse_function, batch, tagger_batch_chars))
+        return
+    worker_counter = multiprocessing.Value('i', 0)
+    pool = multiprocessing.Pool(workers, initializer=init_worker,
+            initargs=(read_base_config(), with_paths, with_concraft_server, form_cache_size,
+                fast_tagger_table, perceptron_model, worker_counter))
+    # The pool reads the input in its own thread, as fast as it can; limit how many batches can
+    # wait for being parsed and handed over, so the memory use doesn't grow with the input.
+    max_pending_batches = workers * 4
+    pending_batches = threading.Semaphore(max_pending_batches)
+    def throttled_batches():
+        for batch in batches:
+            pending_batches.acquire()
+            yield (parse_function, batch, tagger_batch_chars)
+    try:
+        # imap returns the results in the order of the batches.
+        batch_results = pool.imap(parse_batch, throttled_batches())
+        current_batch = next(batch_results, None)
+        while current_batch is not None:
+            pending_batches.release()
+            next_batch = next(batch_results, None)
+            if next_batch is None:
+                # Let the workers exit normally (so they stop their Concraft servers) before
+                # the last results are handed over.
+                pool.close()
+                pool.join()
+            yield from current_batch
+            current_batch = next_batch
+    except BaseException:
+        # Unblock the input thread, so the pool can stop it.
+        pending_batches.release(max_pending_batches + 1)
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def sections_with_parses(raw_sections, parse_function, workers, with_paths=False, cache=False):
+    "Return copies of the sections with paragraphs replaced by the results of parse_function."
+    result_sections = [copy.deepcopy(sec) for sec in raw_sections]
+    parses = parse_paragraphs((paragraph for sec in raw_sections
+        for (page, paragraph) in sec.pages_paragraphs),
+        parse_function=parse_function, workers=workers, with_paths=with_paths, cache=cache)
+    for sec_n, new_sec in enumerate(result_sections):
         for x in range(10):
             if (sec_n >= ((len(raw_sections) / 10) * x)
                     and (sec_n-1) < ((len(raw_sections) / 10) * x)):
                 info('Done {}% of parsing.'.format(x*10))
-        new_sec = copy.deepcopy(sec)
         for par_n, (page, paragraph) in enumerate(new_sec.pages_paragraphs):
-            new_sec.pages_paragraphs[par_n] = (page, tokens_paths(paragraph))
-        result_sections.append(new_sec)
+            new_sec.pages_paragraphs[par_n] = (page, next(parses))
     return result_sections
+
+def parsed_sections(raw_sections, workers=1, cache=False):
+    return sections_with_parses(raw_sections, parse_sentences, workers, cache=cache)
+
+def pathed_sections(raw_sections, workers=1, cache=False):
+    return sections_with_parses(raw_sections, tokens_paths, workers, with_paths=True, cache=cache)
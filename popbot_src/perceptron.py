@@ -0,0 +1,277 @@
+from collections import Counter
+import zlib
+
+import numpy as np
+
+from popbot_src.parsed_token import ParsedToken
+
+# The values of these features are taken from the position of the candidate token in the DAG. Each
+# of them is combined with the full tag of the candidate and with its grammatical class.
+FEATURE_NAMES = ['bias', 'form', 'lemma', 'suffix3', 'suffix2', 'prefix2', 'shape', 'previous',
+        'next']
+# Tag ids reserved for the sentence start and the tags not seen in training.
+START_TAG, UNKNOWN_TAG = '<s>', '<unk>'
+
+def stable_hash(value):
+    "Hash the string in the same way in all processes (unlike the builtin hash)."
+    return zlib.crc32(value.encode('utf-8'))
+
+def model_file_path(path):
+    "Return the path of the model file, which NumPy saves always with the .npz extension."
+    return path if path.endswith('.npz') else path + '.npz'
+
+def form_shape(form):
+    if form.isupper():
+        return 'upper'
+    if form[:1].isupper():
+        return 'title'
+    if any([char.isdigit() for char in form]):
+        return 'digit'
+    return 'lower'
+
+class Candidates():
+    """
+    The candidate tokens (variants) for some sentences of a MorfeuszDAG, in flat lists. The 'ign'
+    variants (of forms unknown to Morfeusz) are replaced by candidates with each of guess_tags.
+    """
+    def __init__(self, morfeusz_dag, sentence_bounds, guess_tags):
+        self.starts, self.ends, self.forms, self.lemmas, self.tags = [], [], [], [], []
+        self.feature_values = [] # the values of FEATURE_NAMES for each candidate
+        self.sentence_ranges = [] # (first candidate, end candidate) for each sentence
+        for first, end in sentence_bounds:
+            sentence_first = len(self.tags)
+            for pos_n in range(first, end):
+                form = morfeusz_dag.forms[morfeusz_dag.variant_offsets[pos_n]]
+                previous_form = (morfeusz_dag.forms[morfeusz_dag.variant_offsets[pos_n-1]]
+                        if pos_n > first else START_TAG)
+                next_form = (morfeusz_dag.forms[morfeusz_dag.variant_offsets[pos_n+1]]
+                        if pos_n < end - 1 else START_TAG)
+                lower_form = form.lower()
+                # (the lemma goes after the form, see FEATURE_NAMES)
+                context_values = [lower_form[-3:], lower_form[-2:], lower_form[:2],
+                        form_shape(form), previous_form.lower(), next_form.lower()]
+                variants = []
+                for var_n in range(morfeusz_dag.variant_offsets[pos_n],
+                        morfeusz_dag.variant_offsets[pos_n+1]):
+                    if morfeusz_dag.tags[var_n] == 'ign' and guess_tags:
+                        variants += [(form, form, tag) for tag in guess_tags]
+                    else:
+                        variants.append((morfeusz_dag.forms[var_n], morfeusz_dag.lemmas[var_n],
+                            morfeusz_dag.tags[var_n]))
+                for variant_form, lemma, tag in variants:
+                    self.starts.append(morfeusz_dag.starts[pos_n])
+                    self.ends.append(morfeusz_dag.ends[pos_n])
+                    self.forms.append(variant_form)
+                    self.lemmas.append(lemma)
+                    self.tags.append(tag)
+                    self.feature_values.append(['', lower_form, lemma] + context_values)
+            self.sentence_ranges.append((sentence_first, len(self.tags)))
+
+    def __len__(self):
+        return len(self.tags)
+
+class PerceptronTagger():
+    """
+    An averaged perceptron choosing paths through Morfeusz DAGs, as an in-process replacement for
+    Concraft. Each candidate token is scored by hashed features of its form and context combined
+    with its tag, and by the transition from the tag of the previous token; the best path is found
+    with the Viterbi algorithm over the DAG nodes.
+    """
+    def __init__(self, tags, guess_tags=[], n_features=2**20):
+        self.tags = [START_TAG, UNKNOWN_TAG] + [tag for tag in tags
+                if not tag in [START_TAG, UNKNOWN_TAG]]
+        self.tag_ids = { tag: tag_id for (tag_id, tag) in enumerate(self.tags) }
+        self.guess_tags = list(guess_tags)
+        self.n_features = n_features
+        self.weights = np.zeros(n_features)
+        self.transitions = np.zeros((len(self.tags), len(self.tags)))
+        self.value_hashes = dict() # feature value -> its hash, reused between calls
+
+    def hashed(self, value):
+        if not value in self.value_hashes:
+            self.value_hashes[value] = stable_hash(value)
+        return self.value_hashes[value]
+
+    def feature_indices(self, candidates):
+        "Return the matrix of weight indices of the features of each candidate."
+        value_hashes = np.array([[self.hashed(value) for value in values]
+            for values in candidates.feature_values], dtype=np.uint64).reshape(
+                    len(candidates), len(FEATURE_NAMES))
+        tag_hashes = np.array([self.hashed(tag) for tag in candidates.tags], dtype=np.uint64)
+        class_hashes = np.array([self.hashed(tag.split(':')[0]) for tag in candidates.tags],
+                dtype=np.uint64)
+        feature_numbers = np.arange(len(FEATURE_NAMES), dtype=np.uint64)
+        # The combinations may overflow, which only mixes the bits more.
+        with np.errstate(over='ignore'):
+            with_tags = (value_hashes * np.uint64(1000003) + tag_hashes[:, None] * np.uint64(7919)
+                    + feature_numbers)
+            with_classes = (value_hashes * np.uint64(999983) + class_hashes[:, None]
+                    * np.uint64(7927) + feature_numbers)
+        return (np.concatenate([with_tags, with_classes], axis=1)
+                % np.uint64(self.n_features)).astype(np.int64)
+
+    def candidate_tag_ids(self, candidates):
+        return np.array([self.tag_ids.get(tag, 1) for tag in candidates.tags], dtype=np.int64)
+
+    def best_path(self, candidates, first, end, emissions, tag_ids):
+        "Return the indices of candidates on the best path through the sentence."
+        if first == end:
+            return []
+        start_node = min(candidates.starts[first:end])
+        scores = np.zeros(end - first)
+        back_pointers = np.full(end - first, -1)
+        ending_at = dict() # node -> the (local) indices of candidates ending there
+        cand_n = first
+        while cand_n < end:
+            # Score the candidates of one position (start-end pair) together.
+            position_end = cand_n + 1
+            while (position_end < end
+                    and candidates.starts[position_end] == candidates.starts[cand_n]
+                    and candidates.ends[position_end] == candidates.ends[cand_n]):
+                position_end += 1
+            local = np.arange(cand_n - first, position_end - first)
+            previous = ending_at.get(candidates.starts[cand_n])
+            if previous is None or candidates.starts[cand_n] == start_node:
+                scores[local] = (emissions[cand_n:position_end]
+                        + self.transitions[0, tag_ids[cand_n:position_end]])
+            else:
+                path_scores = (scores[previous][:, None] + self.transitions[
+                    tag_ids[first + previous][:, None], tag_ids[cand_n:position_end][None, :]])
+                best_previous = np.argmax(path_scores, axis=0)
+                scores[local] = (emissions[cand_n:position_end]
+                        + path_scores[best_previous, np.arange(len(local))])
+                back_pointers[local] = previous[best_previous]
+            end_node = candidates.ends[cand_n]
+            if end_node in ending_at:
+                ending_at[end_node] = np.concatenate([ending_at[end_node], local])
+            else:
+                ending_at[end_node] = local
+            cand_n = position_end
+        final = ending_at[max(ending_at)]
+        path = [final[np.argmax(scores[final])]]
+        while back_pointers[path[-1]] != -1:
+            path.append(back_pointers[path[-1]])
+        return [first + cand_n for cand_n in reversed(path)]
+
+    def best_paths(self, candidates):
+        "Return the best paths for all the sentences of the candidates."
+        features = self.feature_indices(candidates)
+        emissions = self.weights[features].sum(axis=1)
+        tag_ids = self.candidate_tag_ids(candidates)
+        return [self.best_path(candidates, first, end, emissions, tag_ids)
+                for (first, end) in candidates.sentence_ranges]
+
+    def tag(self, morfeusz_dag, sentence_bounds):
+        """Return the sentences, given as position ranges of the MorfeuszDAG, as lists of
+        ParsedToken objects (like parse_concraft_output). All the sentences are scored at once."""
+        candidates = Candidates(morfeusz_dag, sentence_bounds, self.guess_tags)
+        sents = []
+        for path in self.best_paths(candidates):
+            tokens = [ParsedToken(candidates.forms[cand_n], candidates.lemmas[cand_n],
+                candidates.tags[cand_n], position=candidates.starts[cand_n])
+                for cand_n in path]
+            for token, next_token in zip(tokens, tokens[1:]):
+                token.forward_paths = [next_token]
+            if tokens:
+                tokens[0].sentence_starting = True
+            sents.append(tokens)
+        return sents
+
+    @classmethod
+    def train(cls, training_sentences, epochs=5, n_features=2**20, guess_tags_count=30,
+            verbose=False):
+        """
+        Train the tagger on (morfeusz_dag, gold tokens) pairs, where the gold tokens are
+        (form, lemma, tag) triples of the whole DAG. Sentences where the gold tokens cannot be
+        found on a path through the DAG are skipped.
+        """
+        # Guess the forms unknown to Morfeusz with the tags most common for them in training.
+        guess_tag_counts = Counter()
+        all_tags = set()
+        for morfeusz_dag, gold_tokens in training_sentences:
+            ign_forms = set([form for (form, tag) in zip(morfeusz_dag.forms, morfeusz_dag.tags)
+                if tag == 'ign'])
+            guess_tag_counts.update([tag for (form, lemma, tag) in gold_tokens
+                if form in ign_forms])
+            all_tags.update(morfeusz_dag.tags)
+            all_tags.update([tag for (form, lemma, tag) in gold_tokens])
+        guess_tags = [tag for (tag, count) in guess_tag_counts.most_common(guess_tags_count)]
+        tagger = cls(sorted(all_tags), guess_tags=guess_tags, n_features=n_features)
+
+        examples = []
+        for morfeusz_dag, gold_tokens in training_sentences:
+            candidates = Candidates(morfeusz_dag, [(0, len(morfeusz_dag))], guess_tags)
+            gold_path = gold_candidates_path(candidates, gold_tokens)
+            if gold_path is not None:
+                examples.append((candidates, gold_path, tagger.feature_indices(candidates),
+                    tagger.candidate_tag_ids(candidates)))
+        if verbose:
+            print('Training on {} of {} sentences.'.format(len(examples),
+                len(training_sentences)))
+
+        # The sums of weights after each example, for averaging, are kept as in Daume's trick:
+        # the averaged weights are weights - weight_updates / updates_count.
+        weight_updates = np.zeros(n_features)
+        transition_updates = np.zeros(tagger.transitions.shape)
+        updates_count = 1
+        for epoch in range(epochs):
+            errors = 0
+            for candidates, gold_path, features, tag_ids in examples:
+                emissions = tagger.weights[features].sum(axis=1)
+                predicted_path = tagger.best_path(candidates, 0, len(candidates), emissions,
+                        tag_ids)
+                if predicted_path != gold_path:
+                    errors += 1
+                    for path, sign in [(gold_path, 1.0), (predicted_path, -1.0)]:
+                        path_features = features[path].ravel()
+                        np.add.at(tagger.weights, path_features, sign)
+                        np.add.at(weight_updates, path_features, sign * updates_count)
+                        previous_tags = np.concatenate([[0], tag_ids[path][:-1]])
+                        np.add.at(tagger.transitions, (previous_tags, tag_ids[path]), sign)
+                        np.add.at(transition_updates, (previous_tags, tag_ids[path]),
+                                sign * updates_count)
+                updates_count += 1
+            if verbose:
+                print('Epoch {}: {} sentences wrong.'.format(epoch+1, errors))
+        tagger.weights -= weight_updates / updates_count
+        tagger.transitions -= transition_updates / updates_count
+        return tagger
+
+    def save(self, path):
+        np.savez_compressed(model_file_path(path), weights=self.weights, transitions=self.transitions,
+                tags=np.array(self.tags), guess_tags=np.array(self.guess_tags, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        model = np.load(model_file_path(path))
+        tagger = cls(list(model['tags']), guess_tags=list(model['guess_tags']),
+                n_features=len(model['weights']))
+        tagger.weights = model['weights']
+        tagger.transitions = model['transitions']
+        return tagger
+
+def gold_candidates_path(candidates, gold_tokens):
+    """Return the indices of candidates matching the gold (form, lemma, tag) tokens on a path
+    through the whole DAG, or None if there is no such path."""
+    # For each node, the candidates starting there.
+    starting_at = dict()
+    for cand_n in range(len(candidates)):
+        if not candidates.starts[cand_n] in starting_at:
+            starting_at[candidates.starts[cand_n]] = []
+        starting_at[candidates.starts[cand_n]].append(cand_n)
+    if len(candidates) == 0:
+        return None
+    node = min(candidates.starts)
+    path = []
+    for form, lemma, tag in gold_tokens:
+        matching = [cand_n for cand_n in starting_at.get(node, [])
+                if candidates.forms[cand_n] == form and candidates.tags[cand_n] == tag]
+        if not matching:
+            return None
+        # Prefer the candidate with the same lemma.
+        matching.sort(key=lambda cand_n: candidates.lemmas[cand_n] != lemma)
+        path.append(matching[0])
+        node = candidates.ends[matching[0]]
+    if node != max(candidates.ends):
+        return None
+    return path
@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+
+def add_timing(timings, stage_name, seconds):
+    if timings is None:
+        return
+    if not stage_name in timings:
+        timings[stage_name] = [0.0, 0]
+    timings[stage_name][0] += seconds
+    timings[stage_name][1] += 1
+
+def timed_items(source, stage_name, timings):
+    "Yield the items of source, adding the time spent on getting each one to timings."
+    source = iter(source)
+    while True:
+        start_time = time.perf_counter()
+        try:
+            item = next(source)
+        except StopIteration:
+            return
+        add_timing(timings, stage_name, time.perf_counter() - start_time)
+        yield item
+
+def timed_stage(items, stage_name, function, timings):
+    for item in items:
+        start_time = time.perf_counter()
+        result = function(item)
+        add_timing(timings, stage_name, time.perf_counter() - start_time)
+        yield result
+
+def pipelined(source, stages, source_name='source', max_queued=2, threaded=True, timings=None):
+    """
+    Yield the items of source passed through the stages, given as (name, function) pairs, in
+    order. Reading the source and each of the stages run in their own threads, connected by
+    queues of at most max_queued items, so one stage can work on the next item while the
+    following one is busy with the previous item. Without threaded, everything runs in the calling
+    thread. If timings (a dictionary) is given, the seconds spent in each stage and the numbers of
+    items are added to it, as [seconds, items] under the names of the stages and source_name.
+    """
+    if not threaded:
+        items = timed_items(source, source_name, timings)
+        for stage_name, function in stages:
+            items = timed_stage(items, stage_name, function, timings)
+        yield from items
+        return
+
+    stopped = threading.Event()
+    def put(output_queue, message):
+        # Give up waiting when the consumer is gone.
+        while not stopped.is_set():
+            try:
+                output_queue.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(items, output_queue):
+        # Messages are ('item', item), ('error', exception) or ('end', None).
+        try:
+            for item in items:
+                if not put(output_queue, ('item', item)):
+                    return
+        except Exception as err:
+            put(output_queue, ('error', err))
+            return
+        put(output_queue, ('end', None))
+
+    def received(input_queue):
+        while not stopped.is_set():
+            try:
+                kind, value = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == 'error':
+                raise value
+            if kind == 'end':
+                return
+            yield value
+
+    threads = []
+    output_queue = queue.Queue(maxsize=max_queued)
+    threads.append(threading.Thread(target=run, daemon=True,
+        args=(timed_items(source, source_name, timings), output_queue)))
+    for stage_name, function in stages:
+        input_queue, output_queue = output_queue, queue.Queue(maxsize=max_queued)
+        threads.append(threading.Thread(target=run, daemon=True,
+            args=(timed_stage(received(input_queue), stage_name, function, timings),
+                output_queue)))
+    for thread in threads:
+        thread.start()
+    try:
+        yield from received(output_queue)
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+def timings_stats(timings):
+    if not timings:
+        return 'Pipeline stages: none run.'
+    return 'Pipeline stages: {}.'.format(', '.join(['{} {:.2f} s ({} items)'.format(
+        stage_name, seconds, items_count)
+        for stage_name, (seconds, items_count) in timings.items()]))
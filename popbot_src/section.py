@@ -2,7 +2,7 @@ import csv
 import datetime
 import io
 
-from popbot_src.load_helpers import extract_dates, fuzzy_match, heading_score, join_linebreaks
+from popbot_src.load_helpers import extract_dates, heading_score, join_linebreaks, normalized_key
 from popbot_src.parsed_token import ParsedToken
 
 def tuple_to_datetime(date_tuple):
@@ -152,12 +152,9 @@ class Section():
         merged to.
         """
         additional_sections = []
-        split_decisions = []
-        for page_n in set([page_n for (page_n, par) in new_pages_paragraphs]):
-            if manual_decisions:
-                for decision in manual_decisions[page_n]:
-                    if decision.decision_type=='split_sections':
-                        split_decisions.append(decision)
+        # The pages where split decisions are looked for.
+        split_pages = (list(set([page_n for (page_n, par) in new_pages_paragraphs]))
+                if manual_decisions else [])
         # Add own last paragraph for context checking.
         pages_paragraphs = (self.pages_paragraphs[-1:]
                 if len(self.pages_paragraphs) > 0 else [(0, '')]) + new_pages_paragraphs
@@ -170,36 +167,36 @@ class Section():
             # We need the first paragraph only for checking the end of existing text.
             if parag_n == 0:
                 continue
-            for decision in split_decisions:
-                if fuzzy_match(decision.following_fragm, paragraph[:80]):
-                    new_doc = False
-                    if decision.new_section_type == 'document':
-                        new_section = Section.new(config, 'document',
-                                [(scan_page, paragraph)],
-                                document_id=current_document_n)
-                        current_document_n += 1
-                        recipient_document_n = len(additional_sections)
-                        split = True
-                        new_doc = True
-                    elif decision.new_section_type == 'meta':
-                        new_section = Section.new(config, 'meta',
-                                [(scan_page, paragraph)])
-                    else:
-                        raise NotImplementedError('requested section split with unknown section'
-                                ' type {}'.format(decision.new_section_type))
-                    # Check if there is a title form decision for this new section.
-                    for page_decision in manual_decisions[new_section.pages_paragraphs[0][0]]:
-                        if (page_decision.decision_type == 'title_form'
-                                and fuzzy_match(new_section.pages_paragraphs[0][1], page_decision.from_title)):
-                            new_section.pages_paragraphs[0] = (new_section.pages_paragraphs[0][0],
-                                    page_decision.to_title)
-                    if new_doc:
-                        additional_sections.append(new_section)
-                        additional_sections += meta_sections_buffer
-                        meta_sections_buffer = []
-                    else:
-                        meta_sections_buffer.append(new_section)
-                    break
+            for decision in manual_decisions.matching(split_pages, ['split_sections'],
+                    paragraph[:80], field='following_fragm'):
+                new_doc = False
+                if decision.new_section_type == 'document':
+                    new_section = Section.new(config, 'document',
+                            [(scan_page, paragraph)],
+                            document_id=current_document_n)
+                    current_document_n += 1
+                    recipient_document_n = len(additional_sections)
+                    split = True
+                    new_doc = True
+                elif decision.new_section_type == 'meta':
+                    new_section = Section.new(config, 'meta',
+                            [(scan_page, paragraph)])
+                else:
+                    raise NotImplementedError('requested section split with unknown section'
+                            ' type {}'.format(decision.new_section_type))
+                # Check if there is a title form decision for this new section.
+                for page_decision in manual_decisions.title_decisions(
+                        [new_section.pages_paragraphs[0][0]], ['title_form'],
+                        new_section.pages_paragraphs):
+                    new_section.pages_paragraphs[0] = (new_section.pages_paragraphs[0][0],
+                            page_decision.to_title)
+                if new_doc:
+                    additional_sections.append(new_section)
+                    additional_sections += meta_sections_buffer
+                    meta_sections_buffer = []
+                else:
+                    meta_sections_buffer.append(new_section)
+                break
             # (if we did not break on a split decision)
             else:
                 if split:
@@ -223,14 +220,14 @@ class Section():
         of additional sections (from add_to_text) if some splits happen."""
         if self.section_type != 'document':
             raise RuntimeError('An attempt to merge to a non-document section.')
-        for decision in manual_decisions[merged_paragraphs[0][0]]:
+        following_key = normalized_key(merged_paragraphs[0][1][:80])
+        for decision in manual_decisions.matching([merged_paragraphs[0][0]], ['merge_sections'],
+                merged_paragraphs[0][1]):
             # Merge decisions.
-            if (decision.decision_type == 'merge_sections'
-                    and fuzzy_match(decision.from_title, merged_paragraphs[0][1])
-                    and fuzzy_match(decision.following_fragm, merged_paragraphs[0][1][:80])):
+            if manual_decisions.key(decision, 'following_fragm') == following_key:
+                preceding_key = manual_decisions.key(decision, 'preceding_fragm')
                 after_n = [n for n in range(len(self.pages_paragraphs))
-                        if fuzzy_match(decision.preceding_fragm,
-                            self.pages_paragraphs[n][1][-80:])]
+                        if normalized_key(self.pages_paragraphs[n][1][-80:]) == preceding_key]
                 if len(after_n) > 0:
                     if len(after_n) > 1:
                         raise RuntimeError('Ambiguous merge instructions (multiple paragraphs match as preceding).')
@@ -250,19 +247,21 @@ class Section():
                     raise ValueError('Cannot match the section to be merged with previous document paragraphs.')
         return False
 
-    def guess_date(self):
+    def guess_date(self, heuristics=None):
         """
         Given the own title and document content, try to guess the date on which the document was
         created. Assign it to the section object; return the date that was chosen or False, if none was. 
+        The dates are extracted with the heuristics (such as the loader's), if given.
         """
+        dates_in = heuristics.extract_dates if heuristics is not None else extract_dates
         # First, try to return the earliest (full) date from the title.
-        title_dates = extract_dates(self.pages_paragraphs[0][1])
+        title_dates = dates_in(self.pages_paragraphs[0][1])
         sorted_dates = sorted([(d, m, y) for (d, m, y) in title_dates if y <= 1795], key=lambda x: x[2])
         if len(sorted_dates) > 0:
             self.date = tuple_to_datetime(sorted_dates[0])
             return self.date
         # If the title yields nothing, try the content - the first date that appears in the document.
-        content_dates = extract_dates(self.collapsed_text())
+        content_dates = dates_in(self.collapsed_text())
         sorted_dates = [(d, m, y) for (d, m, y) in content_dates if y <= 1795]
         if len(sorted_dates) > 0:
             self.date = tuple_to_datetime(sorted_dates[0])
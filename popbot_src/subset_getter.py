@@ -1,7 +1,9 @@
 from random import shuffle
+import sys
 
 from popbot_src.indexing_common import load_document_sections
 from popbot_src.indexing_helpers import apply_decisions1, read_config_file, read_manual_decisions
+from popbot_src.token_store import TokenStore
 
 def load_file_list(file_list_path):
     with open(file_list_path) as list_file:
@@ -9,6 +11,9 @@ def load_file_list(file_list_path):
 
     # Load sections.
     all_sections = []
+    # The stores of binary corpora can be joined without decoding the paragraphs again, unless the
+    # decisions changed them.
+    file_stores = []
     for file_row in fnames:
         file_fields = file_row.split()
         filename = file_fields[0]
@@ -17,9 +22,21 @@ def load_file_list(file_list_path):
             manual_decisions = read_manual_decisions(file_fields[1])
             config = read_config_file(file_fields[2])
             sections = apply_decisions1(sections, manual_decisions, config)
+            file_stores.append(None)
+        else:
+            file_stores.append(getattr(sections[0], 'token_store', None) if sections else False)
         # Leave out non-document and non-pertinent sections.
         sections = [s for s in sections if s.section_type == 'document' and s.pertinence]
         all_sections += sections
+    # Decode the tokens once, for all the methods and subsets to read. A malformed token leaves
+    # its paragraph without tokens, instead of failing for all the files.
+    if None in file_stores:
+        store = TokenStore.from_sections(all_sections, skip_undecodable=True)
+    else:
+        store = TokenStore.concatenated([store for store in file_stores if store])
+    if store.undecodable_paragraphs:
+        print('Skipped {} paragraphs with undecodable tokens (listed in the undecodable_paragraphs'
+                ' of the token store).'.format(len(store.undecodable_paragraphs)), file=sys.stderr)
     return all_sections
 
 def section_indices(section, attrnames, date_ranges=[]):
@@ -0,0 +1,280 @@
+from bisect import bisect_right
+import re
+import numpy as np
+
+from popbot_src.lexicon import KINDS, open_lexicon
+from popbot_src.parsed_token import ParsedToken
+
+# The bits of the flags array.
+PROPER_NAME = 1
+UNKNOWN_FORM = 2
+CORRECTED = 4
+LATIN = 8
+
+MARKER_FLAGS = { 'PN': PROPER_NAME, '??': UNKNOWN_FORM, '!!': CORRECTED, 'LA': LATIN }
+
+def token_flags(token):
+    return ((PROPER_NAME if token.proper_name else 0) | (UNKNOWN_FORM if token.unknown_form else 0)
+            | (CORRECTED if token.corrected else 0) | (LATIN if token.latin else 0))
+
+# Matches the tokens: as the markers (PN_, ??_, !!_, LA_), the form, the lemma and the interp, or
+# whole, if they have another shape (such as an underscore in the form) and have to be read with
+# ParsedToken.from_str.
+TOKEN_PATTERN = re.compile('((?:(?:PN|\\?\\?|!!|LA)_)*)([^\\s:_]*):([^\\s:_]*)(?::([^\\s_]*))?(?!\\S)'
+        '|(\\S+)')
+# markers (as matched by TOKEN_PATTERN) -> flags
+prefix_flags = { '': 0 }
+
+def decode_token_table(paragraphs, skip_undecodable=False):
+    """
+    Decode the tokens of the paragraphs (such as a whole column of a csv edition) together. Each
+    distinct token string is decoded once, with one pass of TOKEN_PATTERN over all of them. Return
+    the lists of the forms, lemmas, tags and flags of the distinct tokens, the array of the numbers
+    of the distinct tokens for all the tokens, the offsets of the sentences (lines with tokens) and
+    of the paragraphs, and the list of the paragraphs left without tokens. A token that isn't
+    form:lemma:interp raises an IndexError, as in ParsedToken.from_str, unless skip_undecodable is
+    set: then its paragraph is left without tokens.
+    """
+    token_strs = []
+    sentence_offsets, paragraph_offsets = [0], [0]
+    for paragraph in paragraphs:
+        for line in paragraph.split('\n'):
+            line_token_strs = line.split()
+            if line_token_strs:
+                token_strs += line_token_strs
+                sentence_offsets.append(len(token_strs))
+        paragraph_offsets.append(len(token_strs))
+    # token string -> its number among the distinct ones
+    token_str_ns = dict()
+    token_types = np.array([token_str_ns.setdefault(token_str, len(token_str_ns))
+        for token_str in token_strs], dtype=np.int64)
+    forms, lemmas, tags, flags = [], [], [], []
+    undecodable_types = []
+    for type_n, (token_str, (prefix, form, lemma, interp, other_token)) in enumerate(zip(
+            token_str_ns, TOKEN_PATTERN.findall(' '.join(token_str_ns)))):
+        if other_token:
+            try:
+                token = ParsedToken.from_str(token_str)
+                form, lemma, interp = token.form, token.lemma, token.interp_str()
+                token_flags_value = token_flags(token)
+            except IndexError:
+                if not skip_undecodable:
+                    raise
+                undecodable_types.append(type_n)
+                form, lemma, interp, token_flags_value = '', '', '', 0
+        else:
+            if not prefix in prefix_flags:
+                prefix_flags[prefix] = 0
+                for marker in prefix[:-1].split('_'):
+                    prefix_flags[prefix] |= MARKER_FLAGS[marker]
+            token_flags_value = prefix_flags[prefix]
+        forms.append(form)
+        lemmas.append(lemma)
+        tags.append(interp)
+        flags.append(token_flags_value)
+    undecodable_paragraphs = []
+    if undecodable_types:
+        # Leave out the tokens of the paragraphs having undecodable ones and move the offsets.
+        kept_tokens = np.ones(len(token_types), dtype=bool)
+        for token_n in np.nonzero(np.isin(token_types, undecodable_types))[0].tolist():
+            paragraph_n = bisect_right(paragraph_offsets, token_n) - 1
+            if not paragraph_n in undecodable_paragraphs:
+                undecodable_paragraphs.append(paragraph_n)
+                kept_tokens[paragraph_offsets[paragraph_n]:paragraph_offsets[paragraph_n+1]] = False
+        kept_before = np.concatenate([[0], np.cumsum(kept_tokens)]).tolist()
+        token_types = token_types[kept_tokens]
+        moved_sentence_offsets = [0]
+        for offset in sentence_offsets[1:]:
+            if kept_before[offset] > moved_sentence_offsets[-1]:
+                moved_sentence_offsets.append(kept_before[offset])
+        sentence_offsets = moved_sentence_offsets
+        paragraph_offsets = [kept_before[offset] for offset in paragraph_offsets]
+    return (forms, lemmas, tags, flags, token_types, sentence_offsets, paragraph_offsets,
+            undecodable_paragraphs)
+
+def decode_paragraphs(paragraphs, skip_undecodable=False):
+    """
+    Decode the tokens of the paragraphs as decode_token_table does, but return the lists of the
+    forms, lemmas, tags and flags of all the tokens, followed by the offsets of the sentences and
+    paragraphs and the list of the paragraphs left without tokens.
+    """
+    (forms, lemmas, tags, flags, token_types, sentence_offsets, paragraph_offsets,
+            undecodable_paragraphs) = decode_token_table(paragraphs,
+                    skip_undecodable=skip_undecodable)
+    return tuple([np.array(values, dtype=object)[token_types].tolist()
+        for values in [forms, lemmas, tags, flags]]) + (sentence_offsets, paragraph_offsets,
+                undecodable_paragraphs)
+
+class TokenStore():
+    """
+    The tokens of parsed sections in columns. The forms, lemmas and tags (interp strings) are kept
+    once in the vocabulary lists of the lexicon (by default, the one shared by the process), and
+    each token has their ids in the form_ids, lemma_ids and tag_ids arrays, and its PN/??/!!/LA
+    markers as bits of the flags array. The offset arrays hold the first token of each sentence
+    and paragraph and the first paragraph of each section, with the ends appended at the end.
+    """
+    def __init__(self, lexicon=None):
+        self.sections = []
+        self.lexicon = lexicon if lexicon is not None else open_lexicon()
+        self.forms, self.lemmas, self.tags = (self.lexicon.forms, self.lexicon.lemmas,
+                self.lexicon.tags)
+        self.form_ids = np.zeros(0, dtype=np.int32)
+        self.lemma_ids = np.zeros(0, dtype=np.int32)
+        self.tag_ids = np.zeros(0, dtype=np.int32)
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self.sentence_offsets = np.zeros(1, dtype=np.int64)
+        self.paragraph_offsets = np.zeros(1, dtype=np.int64)
+        self.section_offsets = np.zeros(1, dtype=np.int64)
+        self.paragraph_pages = np.zeros(0, dtype=np.int32)
+        # paragraph number -> the text, where it isn't the one made from the tokens
+        self.paragraph_texts = dict()
+        # the numbers of the paragraphs left without tokens, because some of them were undecodable
+        self.undecodable_paragraphs = []
+
+    @classmethod
+    def from_sections(cls, sections, keep_texts=False, lexicon=None, skip_undecodable=None):
+        """Decode the paragraphs of the parsed sections (with the sentences on separate lines)
+        into a new store. The sections are marked as belonging to it. With keep_texts, the
+        paragraphs that paragraph_text wouldn't give back exactly are kept in paragraph_texts, and
+        the ones that aren't made of tokens (such as meta sections) are left without tokens. With
+        skip_undecodable (by default, the same as keep_texts), the paragraphs with undecodable
+        tokens are left without tokens and listed in undecodable_paragraphs, instead of raising an
+        IndexError."""
+        if skip_undecodable is None:
+            skip_undecodable = keep_texts
+        self = cls(lexicon)
+        paragraphs, paragraph_pages, section_offsets = [], [], [0]
+        for section_n, section in enumerate(sections):
+            for page, paragraph in section.pages_paragraphs:
+                paragraphs.append(paragraph)
+                paragraph_pages.append(page)
+            section_offsets.append(len(paragraphs))
+            section.token_store = self
+            section.store_section_n = section_n
+        (forms, lemmas, tags, flags, token_types, sentence_offsets, paragraph_offsets,
+                undecodable_paragraphs) = decode_token_table(paragraphs,
+                        skip_undecodable=skip_undecodable)
+        self.sections = list(sections)
+        self.undecodable_paragraphs = undecodable_paragraphs
+        self.form_ids = self.lexicon.ids('forms', forms)[token_types]
+        self.lemma_ids = self.lexicon.ids('lemmas', lemmas)[token_types]
+        self.tag_ids = self.lexicon.ids('tags', tags)[token_types]
+        self.flags = np.array(flags, dtype=np.uint8)[token_types]
+        self.sentence_offsets = np.array(sentence_offsets, dtype=np.int64)
+        self.paragraph_offsets = np.array(paragraph_offsets, dtype=np.int64)
+        self.section_offsets = np.array(section_offsets, dtype=np.int64)
+        self.paragraph_pages = np.array(paragraph_pages, dtype=np.int32)
+        if keep_texts:
+            for paragraph_n, paragraph in enumerate(paragraphs):
+                if self.paragraph_text(paragraph_n) != paragraph:
+                    self.paragraph_texts[paragraph_n] = paragraph
+        return self
+
+    @classmethod
+    def concatenated(cls, stores, lexicon=None):
+        """Join the stores into a new one, with their ids translated into the lexicon where it's
+        not the one they use (by default, their common lexicon if they have one). Their sections
+        are marked as belonging to it."""
+        if lexicon is None and len(set([id(store.lexicon) for store in stores])) == 1:
+            lexicon = stores[0].lexicon
+        self = cls(lexicon)
+        columns = [[], [], [], []]
+        sentence_offsets, paragraph_offsets, section_offsets = [[0]], [[0]], [[0]]
+        paragraph_pages = []
+        token_count, paragraph_count = 0, 0
+        for store in stores:
+            for kind, store_ids, column in zip(KINDS,
+                    [store.form_ids, store.lemma_ids, store.tag_ids], columns):
+                if store.lexicon is self.lexicon:
+                    column.append(store_ids)
+                else:
+                    column.append(self.lexicon.ids(kind, getattr(store.lexicon, kind))[store_ids])
+            columns[3].append(store.flags)
+            sentence_offsets.append(store.sentence_offsets[1:] + token_count)
+            paragraph_offsets.append(store.paragraph_offsets[1:] + token_count)
+            section_offsets.append(store.section_offsets[1:] + paragraph_count)
+            paragraph_pages.append(store.paragraph_pages)
+            for paragraph_n, paragraph in store.paragraph_texts.items():
+                self.paragraph_texts[paragraph_count + paragraph_n] = paragraph
+            self.undecodable_paragraphs += [paragraph_count + paragraph_n
+                    for paragraph_n in store.undecodable_paragraphs]
+            for section in store.sections:
+                section.token_store = self
+                section.store_section_n = len(self.sections)
+                self.sections.append(section)
+            token_count += len(store)
+            paragraph_count += len(store.paragraph_pages)
+        self.form_ids = np.concatenate([self.form_ids] + columns[0])
+        self.lemma_ids = np.concatenate([self.lemma_ids] + columns[1])
+        self.tag_ids = np.concatenate([self.tag_ids] + columns[2])
+        self.flags = np.concatenate([self.flags] + columns[3])
+        self.sentence_offsets = np.concatenate(sentence_offsets).astype(np.int64)
+        self.paragraph_offsets = np.concatenate(paragraph_offsets).astype(np.int64)
+        self.section_offsets = np.concatenate(section_offsets).astype(np.int64)
+        self.paragraph_pages = np.concatenate([self.paragraph_pages] + paragraph_pages)
+        return self
+
+    def __len__(self):
+        return len(self.form_ids)
+
+    def section_paragraphs(self, section_n):
+        "Return the range of paragraph numbers of the section."
+        return range(self.section_offsets[section_n], self.section_offsets[section_n+1])
+
+    def section_range(self, section_n, skip_title=False):
+        "Return the first token and the end of the section's tokens."
+        first_paragraph = self.section_offsets[section_n]
+        end_paragraph = self.section_offsets[section_n+1]
+        if skip_title:
+            first_paragraph = min(first_paragraph + 1, end_paragraph)
+        return self.paragraph_offsets[first_paragraph], self.paragraph_offsets[end_paragraph]
+
+    def token_indices(self, section_ns, skip_title=False):
+        "Return the numbers of the tokens of the sections, in their order, as an array."
+        ranges = [np.arange(*self.section_range(section_n, skip_title=skip_title))
+                for section_n in section_ns]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(ranges)
+
+    def token(self, token_n):
+        "Return the token as a ParsedToken."
+        token = ParsedToken(self.forms[self.form_ids[token_n]],
+                self.lemmas[self.lemma_ids[token_n]], self.tags[self.tag_ids[token_n]])
+        flags = self.flags[token_n]
+        token.proper_name = bool(flags & PROPER_NAME)
+        token.unknown_form = bool(flags & UNKNOWN_FORM)
+        token.corrected = bool(flags & CORRECTED)
+        token.latin = bool(flags & LATIN)
+        return token
+
+    def paragraph_tokens(self, paragraph_n):
+        return [self.token(token_n) for token_n in range(self.paragraph_offsets[paragraph_n],
+            self.paragraph_offsets[paragraph_n+1])]
+
+    def paragraph_text(self, paragraph_n):
+        "Return the paragraph string, with the sentences on separate lines as written by morpho.py."
+        if paragraph_n in self.paragraph_texts:
+            return self.paragraph_texts[paragraph_n]
+        first_token, end_token = (self.paragraph_offsets[paragraph_n],
+                self.paragraph_offsets[paragraph_n+1])
+        first_sentence, end_sentence = np.searchsorted(self.sentence_offsets,
+                [first_token, end_token])
+        return ''.join([' '.join([repr(self.token(token_n)) for token_n in
+            range(self.sentence_offsets[sentence_n], self.sentence_offsets[sentence_n+1])]) + '\n'
+            for sentence_n in range(first_sentence, end_sentence)])
+
+    def tags_with(self, tag_part):
+        "Return a boolean array of the tag ids whose interps contain tag_part as one of the tags."
+        return np.array([tag_part in tag.split(':') for tag in self.tags], dtype=bool)
+
+def sections_store(sections):
+    """
+    Return the TokenStore holding the sections and the numbers of the sections in it. If they
+    don't all belong to one store yet, a new one is made for them.
+    """
+    store = getattr(sections[0], 'token_store', None) if sections else None
+    if store is None or any([getattr(section, 'token_store', None) is not store
+            for section in sections]):
+        store = TokenStore.from_sections(sections)
+    return store, [section.store_section_n for section in sections]
@@ -3,19 +3,31 @@ from cmd import Cmd
 from copy import copy, deepcopy
 import yaml
 
+from popbot_src.heuristic_cache import CachedHeuristics, HeuristicCache
 from popbot_src.indexing_common import load_indexed, load_edition
+from popbot_src.indexing_helpers import read_config_file
 from popbot_src.manual_decision import DateDecision, MergeSectionDecision, SplitSectionDecision, PertinenceDecision, TitleFormDecision, TypeDecision
 
 argparser = argparse.ArgumentParser(description='Review and correct source edition indexing performed by the loading script.')
 argparser.add_argument('loading_file_path')
 argparser.add_argument('--preload', '-p', help='Preload a decisions file. If supplied, the main argument should point to a JSON edition config file.')
+argparser.add_argument('--heuristic_cache', help='Path to a cache file with results of the loading heuristics on paragraphs, used when preloading.')
 
 args = argparser.parse_args()
 
 preloaded_decisions = []
 if args.preload:
     loading_stream = io.StringIO()
-    load_edition(args.loading_file_path, manual_decisions_file=args.preload, output_stream=loading_stream)
+    heuristic_cache = False
+    heuristics = None
+    if args.heuristic_cache:
+        heuristic_cache = HeuristicCache(args.heuristic_cache)
+        heuristics = CachedHeuristics(read_config_file(args.loading_file_path), heuristic_cache)
+    load_edition(args.loading_file_path, manual_decisions_file=args.preload, output_stream=loading_stream,
+            keep_sections=False, heuristics=heuristics)
+    if heuristic_cache:
+        print(heuristic_cache.stats())
+        heuristic_cache.close()
     loading_stream.seek(0)
     edition_sections = load_indexed(loading_stream)
     with open(args.preload) as decisions_file:
@@ -1,24 +1,22 @@
 import argparse
 from cmd import Cmd
 import re
+import numpy as np
 from termcolor import colored, cprint
 
 from popbot_src.subset_getter import load_file_list
-from popbot_src.parsed_token import ParsedToken
 from popbot_src.section import tuple_to_datetime
+from popbot_src.token_store import sections_store
 
 argparser = argparse.ArgumentParser(description='Search the corpus for phrases in context.')
 argparser.add_argument('file_list_path')
 args = argparser.parse_args()
 
 all_sections = load_file_list(args.file_list_path)
-parsed_section_pars = []
-# Convert string paragraphs to list of ParsedToken objects.
-for sec in all_sections:
-    parsed_pages_paragraphs = []
-    for pg, par in sec.pages_paragraphs:
-        parsed_pages_paragraphs.append((pg, [ParsedToken.from_str(t) for t in par.strip().split()]))
-    parsed_section_pars.append(parsed_pages_paragraphs)
+store, section_ns = sections_store(all_sections)
+# (the store can also hold other sections of the files)
+searched_tokens = np.zeros(len(store), dtype=bool)
+searched_tokens[store.token_indices(section_ns)] = True
 
 class SearchShell(Cmd):
     prompt = '(search) '
@@ -50,29 +48,31 @@ class SearchShell(Cmd):
             else:
                 patterns[pa_i] = '^{}$'.format(pattern)
         matches_count = 0
-        for sec_n, pages_paragraphs in enumerate(parsed_section_pars):
-            if date_range and (not all_sections[sec_n].date
-                               or all_sections[sec_n].date < date_range[0]
-                               or all_sections[sec_n].date >= date_range[1]):
+        # Mark the tokens where the whole sequence of lemmas matches, within the paragraphs.
+        matching = searched_tokens.copy()
+        for shift, pattern in enumerate(patterns):
+            matching_lemmas = np.array([bool(re.search(pattern, lemma)) for lemma in store.lemmas],
+                    dtype=bool)
+            matching[:len(store)-shift] &= matching_lemmas[store.lemma_ids[shift:]]
+        paragraph_ends = np.repeat(store.paragraph_offsets[1:], np.diff(store.paragraph_offsets))
+        matching &= paragraph_ends - np.arange(len(store)) >= len(patterns)
+        for token_n in np.nonzero(matching)[0]:
+            par_n = np.searchsorted(store.paragraph_offsets, token_n, side='right') - 1
+            sec_n = np.searchsorted(store.section_offsets, par_n, side='right') - 1
+            sec = store.sections[sec_n]
+            if date_range and (not sec.date or sec.date < date_range[0]
+                               or sec.date >= date_range[1]):
                 continue
-            for pg, tokens in pages_paragraphs:
-                for t_i, token in enumerate(tokens):
-                    if re.search(patterns[0], token.lemma):
-                        # Check if the rest of tokens match.
-                        for shift in range(1, len(patterns)):
-                            if (t_i + shift >= len(tokens)
-                               or not re.search(patterns[shift], tokens[t_i + shift].lemma)):
-                                break
-                        else:
-                            forms = [t.form for t in tokens]
-                            sec = all_sections[sec_n]
-                            cprint('{} ({}), {}: file {}'.format(sec.deparsed_title(),
-                                                                 sec.date.year if sec.date else '?',
-                                                                 sec.book_title, pg),
-                                   'blue')
-                            matches_count += 1
-                            print(' '.join(forms[:t_i]), colored(' '.join(forms[t_i:t_i+len(patterns)]), 'red'),
-                                  ' '.join(forms[t_i+len(patterns):]))
+            par_start, par_end = store.paragraph_offsets[par_n], store.paragraph_offsets[par_n+1]
+            forms = store.lexicon.strings('forms', store.form_ids[par_start:par_end])
+            t_i = token_n - par_start
+            cprint('{} ({}), {}: file {}'.format(sec.deparsed_title(),
+                                                 sec.date.year if sec.date else '?',
+                                                 sec.book_title, store.paragraph_pages[par_n]),
+                   'blue')
+            matches_count += 1
+            print(' '.join(forms[:t_i]), colored(' '.join(forms[t_i:t_i+len(patterns)]), 'red'),
+                  ' '.join(forms[t_i+len(patterns):]))
         print('{} matches found.'.format(matches_count))
 
 SearchShell().cmdloop()
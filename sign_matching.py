@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from popbot_src.indexing_common import edition_page_paths, iter_page_texts
+from popbot_src.indexing_helpers import read_config_file
+from popbot_src.load_helpers import (
+        SignMatcher, heading_antisigns, heading_signs_1ord, heading_signs_2ord, meta_signs,
+        ocr_corrected, other_titles, resolution_titles
+        )
+
+argparser = argparse.ArgumentParser(description='Compare the time of finding the meta and heading'
+        ' signs in the paragraphs of an edition with separate regex searches of each sign and with'
+        ' the sign matcher used by the loader.')
+argparser.add_argument('config_file_path', help='The JSON edition config file.')
+argparser.add_argument('--repeats', type=int, default=3, help='Take the best time of this many runs.')
+
+args = argparser.parse_args()
+
+config = read_config_file(args.config_file_path)
+paragraphs = [ocr_corrected(paragraph).strip()
+        for page in iter_page_texts(edition_page_paths(config)) for paragraph in page.split('\n\n')]
+paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+families = { 'meta': meta_signs, 'titles': resolution_titles + other_titles,
+        'heading_1ord': heading_signs_1ord, 'heading_2ord': heading_signs_2ord,
+        'heading_antisigns': heading_antisigns }
+
+def search_separately():
+    return [dict([(family, [sign.search(paragraph) is not None for sign in signs])
+        for (family, signs) in families.items()]) for paragraph in paragraphs]
+
+def search_with_matcher():
+    # (a new matcher, so no hits are kept from the previous runs)
+    matcher = SignMatcher(families)
+    return [dict([(family, matcher.hits(paragraph, family)) for family in families])
+        for paragraph in paragraphs]
+
+for name, search in [('separate searches', search_separately), ('sign matcher', search_with_matcher)]:
+    times = []
+    for repeat_n in range(args.repeats):
+        start_time = time.perf_counter()
+        search()
+        times.append(time.perf_counter() - start_time)
+    print('{}: {:.3f} s'.format(name, min(times)))
+if search_separately() != search_with_matcher():
+    print('The sign hits differ!')
+print('{} paragraphs.'.format(len(paragraphs)))
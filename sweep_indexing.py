@@ -0,0 +1,44 @@
+import argparse, itertools, sys
+
+from popbot_src.heuristic_features import HeuristicFeatures
+from popbot_src.indexing_common import iter_edition
+from popbot_src.indexing_helpers import read_config_file
+from popbot_src.indexing_score import indexing_score
+
+argparser = argparse.ArgumentParser(description='Score the indexing of an edition (as with'
+        ' score_indexing.py) for many values of the heuristics settings in the config. The'
+        ' paragraph features are computed once and the heuristics for all the settings together.')
+argparser.add_argument('config_path')
+argparser.add_argument('--manual_decisions_file', '-m', default=False)
+argparser.add_argument('--max_nonmeta_line_len', type=int, nargs='+')
+argparser.add_argument('--max_heading_len', type=int, nargs='+')
+argparser.add_argument('--heading_length_discount', type=float, nargs='+')
+
+args = argparser.parse_args()
+
+config = read_config_file(args.config_path)
+if not 'dev__true_document_pages' in config:
+    print('No dev__true_document_pages specified, exiting.')
+    sys.exit(0)
+
+# All the combinations of the values given for the swept keys.
+swept_keys = [key for key in ['max_nonmeta_line_len', 'max_heading_len', 'heading_length_discount']
+        if getattr(args, key)]
+settings = [dict(zip(swept_keys, values))
+        for values in itertools.product(*[getattr(args, key) for key in swept_keys])]
+
+features = HeuristicFeatures.from_config(config)
+meta_matrix = features.meta_matrix(settings)
+heading_matrix = features.heading_matrix(settings)
+
+print('Setting / lengths distance / document count difference / total score')
+for setting_n, setting in enumerate(settings):
+    document_sections = [section for section in iter_edition(args.config_path,
+        args.manual_decisions_file,
+        heuristics=features.heuristics(meta_matrix[setting_n], heading_matrix[setting_n]))
+        if section.section_type == 'document']
+    distance, difference, proportion = indexing_score(config['dev__true_document_pages'],
+            document_sections)
+    print('{} {:.3f} {}({:.3f}) {:.3f}'.format(' '.join(['{}={}'.format(key, value)
+        for (key, value) in setting.items()]) or 'config',
+        distance, difference, proportion, distance+difference))
@@ -0,0 +1,57 @@
+import datetime
+import io
+
+from popbot_src.binary_corpus import is_binary_corpus, load_binary_corpus, write_binary_corpus
+from popbot_src.indexing_common import load_indexed
+from popbot_src.section import Section
+from popbot_src.token_store import TokenStore, sections_store
+
+config = { 'book_title': 'book', 'palatinate': 'A', 'default_convent_author': 'someone',
+           'convent_location': 'nowhere' }
+
+def edition_rows():
+    meta_section = Section.new(config, 'meta', [(1, 'Akta sejmiku\nwiszeńskiego')])
+    document1 = Section.new(config, 'document', [(1, 'Tytuł:tytuł:subst:sg:nom:m3\n'),
+        (2, 'PN_Krakowskiego:krakowski:adj:sg:gen:n:pos ??_Xyz:Xyz:ign\nrady:rada:subst:pl:nom:f\n')],
+        document_id=0)
+    document1.date = datetime.date(1572, 10, 4)
+    # (as written by correct.py)
+    document2 = Section.new(config, 'document', [(3, ' !!_rady:rada:subst:pl:nom:f LA_et:et:conj')],
+        document_id=1, pertinence=False)
+    rows = []
+    for section_n, section in enumerate([meta_section, document1, document2]):
+        section.inbook_section_id = section_n
+        rows += section.row_strings()
+    return rows
+
+class TestBinaryCorpus():
+    def test_round_trip(self, tmp_path):
+        sections = load_indexed(io.StringIO('\n'.join(edition_rows()) + '\n'))
+        # (the rows as morpho.py and correct.py write them after reading the csv)
+        rows = sum([section.row_strings() for section in sections], [])
+        corpus_path = str(tmp_path / 'corpus')
+        write_binary_corpus(sections, corpus_path)
+        assert is_binary_corpus(corpus_path) and not is_binary_corpus(str(tmp_path))
+        loaded_sections = load_binary_corpus(corpus_path)
+        assert sum([section.row_strings() for section in loaded_sections], []) == rows
+        store, section_ns = sections_store(loaded_sections[1:])
+        assert section_ns == [1, 2]
+        assert store.lexicon.strings('forms', store.form_ids[store.token_indices(section_ns)]) == [
+                'Tytuł', 'Krakowskiego', 'Xyz', 'rady', 'rady', 'et']
+        # Only the paragraphs that aren't made the same way from the tokens are kept as text.
+        assert sorted(store.paragraph_texts.keys()) == [0, 3]
+
+    def test_concatenated(self, tmp_path):
+        sections = load_indexed(io.StringIO('\n'.join(edition_rows()) + '\n'))
+        for corpus_n in range(2):
+            write_binary_corpus(sections, str(tmp_path / str(corpus_n)))
+        loaded_sections = (load_binary_corpus(str(tmp_path / '0'))
+                + load_binary_corpus(str(tmp_path / '1')))
+        store = TokenStore.concatenated([loaded_sections[0].token_store,
+            loaded_sections[3].token_store])
+        assert sections_store(loaded_sections) == (store, list(range(6)))
+        assert len(store) == 12
+        assert list(store.form_ids[:6]) == list(store.form_ids[6:])
+        assert list(store.section_offsets) == [0, 1, 3, 4, 5, 7, 8]
+        assert store.paragraph_text(5) == store.paragraph_text(1)
+        assert store.paragraph_text(7) == ' !!_rady:rada:subst:pl:nom:f LA_et:et:conj'
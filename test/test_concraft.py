@@ -0,0 +1,105 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import pytest
+import threading
+
+from popbot_src.concraft import ConcraftServer, concraft_sentences, parse_concraft_output
+
+def concraft_line(start, end, form, lemma, tag, disamb=True):
+    return '\t'.join([str(start), str(end), form, lemma, tag, '', '', '0.5', '', '', '',
+        'disamb' if disamb else ''])
+
+# Two sentences; in the first one, "Ichmść" is ambiguous between one and two segments.
+TAGGED_DAG = '\n'.join([
+    concraft_line(0, 1, 'Ichmść', 'ichmość', 'subst:pl:nom:m1'),
+    concraft_line(0, 2, 'Ichmść', 'ichmość', 'subst:sg:nom:m1', disamb=False),
+    concraft_line(1, 2, 'panowie', 'pan', 'subst:pl:nom:m1'),
+    concraft_line(2, 3, '.', '.', 'interp'),
+    '',
+    concraft_line(3, 4, 'Zgoda', 'zgoda', 'subst:sg:nom:f'),
+    concraft_line(4, 5, '.', '.', 'interp'),
+    '',
+    ''])
+
+class StubTaggerHandler(BaseHTTPRequestHandler):
+    "Respond to every DAG with the same tagged output, like concraft-pl server would."
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        assert 'dag' in request
+        self.server.requests_count += 1
+        response = json.dumps({'dag': TAGGED_DAG}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+class TestConcraft():
+    def test_parse_concraft_output(self):
+        sents = parse_concraft_output(TAGGED_DAG)
+        assert [[repr(t) for t in sent] for sent in sents] == [
+                ['Ichmść:ichmość:subst:pl:nom:m1', 'panowie:pan:subst:pl:nom:m1', '.:.:interp'],
+                ['Zgoda:zgoda:subst:sg:nom:f', '.:.:interp']]
+        assert sents[0][0].sentence_starting and not sents[0][1].sentence_starting
+        assert sents[1][0].sentence_starting
+        assert sents[0][0].forward_paths == [sents[0][1]]
+        assert sents[0][1].forward_paths == [sents[0][2]]
+        assert sents[0][2].forward_paths == []
+        # Lines read from a terminal end with \r.
+        sents_cr = parse_concraft_output(TAGGED_DAG.replace('disamb', 'disamb\r'))
+        assert [[repr(t) for t in sent] for sent in sents_cr] == [
+                [repr(t) for t in sent] for sent in sents]
+
+    def test_concraft_sentences(self):
+        read_lines = []
+        def lines():
+            for line in TAGGED_DAG.split('\n'):
+                read_lines.append(line)
+                yield line
+        sents = concraft_sentences(lines())
+        first_sent = next(sents)
+        # The first sentence is given before the second one is read.
+        assert len(read_lines) == 5
+        assert [repr(t) for t in first_sent] == [
+                'Ichmść:ichmość:subst:pl:nom:m1', 'panowie:pan:subst:pl:nom:m1', '.:.:interp']
+        assert len(list(sents)) == 1
+        # Repeated disambiguated paths are skipped, and the last sentence is given also without
+        # the final empty line.
+        repeated_dag = '\n'.join([concraft_line(3, 4, 'Zgoda', 'zgoda', 'subst:sg:nom:f'),
+            concraft_line(3, 4, 'Zgoda', 'zgoda', 'subst:sg:acc:f'),
+            concraft_line(4, 5, '.', '.', 'interp')])
+        assert [[repr(t) for t in sent] for sent in concraft_sentences(repeated_dag.split('\n'))
+                ] == [['Zgoda:zgoda:subst:sg:nom:f', '.:.:interp']]
+
+    def test_server_reuse(self):
+        stub_server = HTTPServer(('localhost', 0), StubTaggerHandler)
+        stub_server.requests_count = 0
+        stub_thread = threading.Thread(target=stub_server.serve_forever, daemon=True)
+        stub_thread.start()
+        try:
+            with ConcraftServer('model.gz', port=stub_server.server_address[1],
+                    spawn=False) as concraft:
+                for attempt in range(3):
+                    sents = concraft.parse('0\t1\tZgoda\tzgoda\tsubst:sg:nom:f\n')
+                    assert len(sents) == 2
+                    assert repr(sents[1][0]) == 'Zgoda:zgoda:subst:sg:nom:f'
+            assert stub_server.requests_count == 3
+        finally:
+            stub_server.shutdown()
+            stub_server.server_close()
+
+    def test_server_failure(self, tmp_path, monkeypatch):
+        # A server that logs more than a pipe buffer holds before failing.
+        fake_concraft = tmp_path / 'concraft-pl'
+        fake_concraft.write_text('#!/bin/sh\nhead -c 200000 /dev/zero | tr "\\\\0" x >&2\n'
+                'echo model not found >&2\nexit 1\n')
+        fake_concraft.chmod(0o755)
+        monkeypatch.setenv('PATH', '{}:{}'.format(tmp_path, os.environ['PATH']))
+        server = ConcraftServer('model.gz', port=1, startup_timeout=30)
+        with pytest.raises(RuntimeError, match='model not found'):
+            server.start()
+        assert server.process is None and server.stderr_file is None
@@ -0,0 +1,33 @@
+from popbot_src.fast_tagger import FastTagger, read_interp_table
+from popbot_src.morfeusz_dag import MorfeuszDAG
+
+# "Ichmść" can be one or two segments, and "panowie" has two interpretations.
+MORFEUSZ_OUTPUT = [
+        (0, 1, ('Ichm', 'ichmość', 'brev:npun', [], [])),
+        (0, 2, ('Ichmść', 'ichmość', 'subst:sg:nom:m1', [], [])),
+        (0, 2, ('Ichmść', 'ichmość', 'subst:pl:nom:m1', [], [])),
+        (1, 2, ('ść', 'ść', 'ign', [], [])),
+        (2, 3, ('panowie', 'pan', 'subst:pl:nom:m1', [], [])),
+        (2, 3, ('panowie', 'pan', 'subst:pl:voc:m1', [], [])),
+        (3, 4, ('.', '.', 'interp', [], [])),
+        ]
+
+class TestFastTagger():
+    def test_fast_tagger(self, tmp_path):
+        dictionary_path = tmp_path / 'dictionary.txt'
+        dictionary_path.write_text("Ichmść : ['subst:pl:nom:m1', 'subst:sg:nom:m1']\n"
+                "panowie : ['pan:subst:pl:voc:m1']\n"
+                ": : ['interp']\n")
+        interp_table = read_interp_table(str(dictionary_path))
+        assert interp_table[':'] == ['interp']
+        morfeusz_dag = MorfeuszDAG.from_morfeusz(MORFEUSZ_OUTPUT)
+        sents = FastTagger(interp_table).tag(morfeusz_dag, morfeusz_dag.sentence_bounds())
+        assert [[repr(t) for t in sent] for sent in sents] == [['Ichmść:ichmość:subst:pl:nom:m1',
+            'panowie:pan:subst:pl:voc:m1', '.:.:interp']]
+        assert [t.position for t in sents[0]] == [0, 2, 3]
+        assert sents[0][0].sentence_starting and sents[0][0].forward_paths == [sents[0][1]]
+        assert sents[0][2].forward_paths == []
+        # Without the table, the first position and variant in the Morfeusz order are taken.
+        sents = FastTagger(dict()).tag(morfeusz_dag, morfeusz_dag.sentence_bounds())
+        assert [[repr(t) for t in sent] for sent in sents] == [['Ichm:ichmość:brev:npun',
+            'ść:ść:ign', 'panowie:pan:subst:pl:nom:m1', '.:.:interp']]
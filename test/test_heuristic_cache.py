@@ -0,0 +1,45 @@
+from popbot_src import heuristic_cache
+from popbot_src.heuristic_cache import CachedHeuristics, HeuristicCache
+from popbot_src.load_helpers import ParagraphHeuristics
+
+config = { 'max_nonmeta_line_len': 1000, 'max_heading_len': 200 }
+
+paragraphs = ['Laudum sejmiku województwa krakowskiego w Proszowicach z dnia 12 maja 1650 r.',
+        'Rp. 1-2', 'Laudum sejmiku województwa krakowskiego w Proszowicach z dnia 12 maja 1650 r.']
+
+def results(heuristics):
+    return [(heuristics.ocr_corrected(paragraph), heuristics.is_meta_fragment(paragraph),
+        heuristics.heading_score(paragraph), heuristics.extract_dates(paragraph))
+        for paragraph in paragraphs]
+
+class TestHeuristicCache():
+    def test_cached_heuristics(self, tmp_path, monkeypatch):
+        cache = HeuristicCache(str(tmp_path / 'cache.sqlite'))
+        assert results(CachedHeuristics(config, cache)) == results(ParagraphHeuristics(config))
+        # The repeated paragraph is found in the cache.
+        assert (cache.hits, cache.misses) == (4, 8)
+        cache.close()
+        # The results persist, but not for other values of the config keys used by a heuristic.
+        cache = HeuristicCache(str(tmp_path / 'cache.sqlite'))
+        assert cache.key('heading_score', paragraphs[0], config) in cache
+        assert not cache.key('heading_score', paragraphs[0],
+                dict(config, heading_length_discount=40)) in cache
+        assert (cache.key('is_meta_fragment', paragraphs[0], config)
+                == cache.key('is_meta_fragment', paragraphs[0], dict(config, max_heading_len=60)))
+        cache.close()
+        # A change in load_helpers invalidates the entries.
+        monkeypatch.setattr(heuristic_cache, 'load_helpers_identifier', lambda: 'changed')
+        cache = HeuristicCache(str(tmp_path / 'cache.sqlite'))
+        assert not cache.key('heading_score', paragraphs[0], config) in cache
+        cache.close()
+
+    def test_periodic_commits(self, tmp_path):
+        cache = HeuristicCache(str(tmp_path / 'cache.sqlite'), commit_every=2)
+        heuristics = CachedHeuristics(config, cache)
+        heuristics.heading_score(paragraphs[0])
+        heuristics.heading_score(paragraphs[1])
+        # The run is interrupted before closing the cache: the entries are already committed.
+        reopened_cache = HeuristicCache(str(tmp_path / 'cache.sqlite'))
+        assert reopened_cache.key('heading_score', paragraphs[1], config) in reopened_cache
+        reopened_cache.close()
+        cache.close()
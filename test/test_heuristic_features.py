@@ -0,0 +1,31 @@
+from popbot_src.heuristic_features import HeuristicFeatures
+from popbot_src.load_helpers import ParagraphHeuristics
+
+config = { 'max_nonmeta_line_len': 1000, 'max_heading_len': 200 }
+
+paragraphs = ['Laudum sejmiku województwa krakowskiego w Proszowicach z dnia 12 maja 1650 r.',
+        'My rady, dygnitarze, urzędnicy i rycerstwo województwa krakowskiego,\nzgromadzeni'
+        ' na sejmiku w Proszowicach, uchwaliliśmy podatek na obronę granic.',
+        'Rp. 1-2', 'Artykuły sejmiku - deputackiego', '12']
+
+class TestHeuristicFeatures():
+    def test_matrices(self):
+        features = HeuristicFeatures(paragraphs, config)
+        assert list(features.max_line_lengths) == [77, 77, 7, 31, 2]
+        settings = [{}, { 'max_nonmeta_line_len': 80, 'heading_length_discount': 40 },
+                { 'max_nonmeta_line_len': 60, 'max_heading_len': 60 }]
+        meta_matrix = features.meta_matrix(settings)
+        heading_matrix = features.heading_matrix(settings)
+        assert meta_matrix.shape == heading_matrix.shape == (3, 5)
+        for setting_n, setting in enumerate(settings):
+            heuristics = ParagraphHeuristics(dict(config, **setting))
+            feature_heuristics = features.heuristics(meta_matrix[setting_n],
+                    heading_matrix[setting_n])
+            for paragraph in paragraphs:
+                assert (feature_heuristics.is_meta_fragment(paragraph)
+                        == heuristics.is_meta_fragment(paragraph))
+                assert feature_heuristics.heading_score(paragraph) == heuristics.heading_score(paragraph)
+                assert (feature_heuristics.doc_beginning_score(paragraph)
+                        == heuristics.doc_beginning_score(paragraph))
+        # The line length limit makes the first paragraph meta in the last setting.
+        assert list(meta_matrix[:, 0]) == [False, False, True]
@@ -0,0 +1,63 @@
+import io
+import json
+
+from popbot_src.indexing_common import SectionWindow, iter_edition, load_edition, merged_short_documents
+from popbot_src.section import Section
+
+config = { 'book_title': 'book', 'palatinate': 'A', 'default_convent_author': 'someone',
+           'convent_location': 'nowhere' }
+
+long_text = ' '.join(['szlachta województwa uchwaliła podatek na obronę granic'] * 6) + '.'
+
+class TestStreamingLoad():
+    def test_section_window(self):
+        window = SectionWindow()
+        document1 = Section.new(config, 'document', [(0, 'Laudum pierwsze'), (0, 'koniec pierwszego')])
+        meta = Section.new(config, 'meta', [(0, '[1]')])
+        document2 = Section.new(config, 'document', [(1, 'Laudum drugie'), (1, 'koniec drugiego')])
+        for section in [document1, meta, document2]:
+            section.join_to_list(window)
+        assert [section.inbook_section_id for section in window] == [0, 1, 2]
+        # A pending merge decision may still add paragraphs to the first document.
+        assert window.release(set(['koniecpierwszego'])) == []
+        assert window.release() == [document1, meta]
+        assert len(window) == 3 and list(window) == [document2]
+        document3 = Section.new(config, 'document', [(2, 'Laudum trzecie')])
+        document3.join_to_list(window)
+        assert document3.inbook_section_id == 3
+        assert window.release(everything=True) == [document2, document3]
+
+    def test_merged_short_documents(self):
+        sections = [Section.new(config, 'meta', [(0, '[1]')]),
+                Section.new(config, 'document', [(0, 'Laudum pierwsze'), (0, long_text)]),
+                Section.new(config, 'document', [(1, 'Laudum krótkie')]),
+                Section.new(config, 'meta', [(1, '[2]')]),
+                Section.new(config, 'document', [(2, 'Laudum też krótkie')]),
+                Section.new(config, 'document', [(2, 'Laudum czwarte'), (2, long_text)])]
+        merged = list(merged_short_documents(iter(sections)))
+        # The short documents are joined in a cascade, with the meta section left in place.
+        assert merged == [sections[0], sections[1], sections[2], sections[3]]
+        assert [paragraph for (page, paragraph) in sections[2].pages_paragraphs] == [
+                'Laudum krótkie', 'Laudum też krótkie', 'Laudum czwarte', long_text]
+
+    def test_iter_edition(self, tmp_path):
+        pages = [ 'Laudum sejmiku województwa krakowskiego w Proszowicach z dnia 12 maja 1650 r.\n\n'
+                + long_text + '\n\n[1]',
+                'Laudum sejmiku województwa krakowskiego w Proszowicach z dnia 3 czerwca 1651 r.\n\n'
+                + long_text ]
+        for page_n, page in enumerate(pages):
+            (tmp_path / 'page-{}.txt'.format(page_n)).write_text(page)
+        edition_config = dict(config, path=str(tmp_path) + '/', prefix='page',
+                max_nonmeta_line_len=1000, max_heading_len=200, ignore_page_ranges=[])
+        config_path = str(tmp_path / 'config.json')
+        with open(config_path, 'w') as config_file:
+            json.dump(edition_config, config_file)
+        output_stream = io.StringIO()
+        sections = load_edition(config_path, output_stream=output_stream)
+        assert [section.section_type for section in sections] == ['document', 'meta', 'document']
+        assert [section.inbook_section_id for section in sections] == [0, 1, 2]
+        assert output_stream.getvalue() == ''.join([row + '\n' for section in sections
+            for row in section.row_strings()])
+        assert ([section.row_strings() for section in iter_edition(config_path)]
+                == [section.row_strings() for section in sections])
+        assert load_edition(config_path, output_stream=io.StringIO(), keep_sections=False) is None
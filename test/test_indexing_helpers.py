@@ -0,0 +1,36 @@
+from popbot_src.indexing_helpers import DecisionIndex
+from popbot_src.manual_decision import (
+        DateDecision, MergeSectionDecision, SplitSectionDecision, TitleFormDecision
+        )
+
+class TestDecisionIndex():
+    def test_matching(self):
+        date = DateDecision((12, 5, 1650), 'Laudum  sejmiku\nw Proszowicach', 3)
+        split = SplitSectionDecision(3, 'Item postanowili', 'document')
+        decisions = DecisionIndex([date, split])
+        assert decisions[3] == [date, split] and decisions[4] == []
+        assert decisions.matching([3], ['date'], 'Laudum sejmiku w Proszowicach') == [date]
+        assert decisions.matching([2, 4], ['date'], 'Laudum sejmiku w Proszowicach') == []
+        assert decisions.matching([3], ['type', 'title_form'], 'Laudum sejmiku w Proszowicach') == []
+        assert decisions.matching([3], ['split_sections'], 'Item  postanowili',
+                field='following_fragm') == [split]
+        assert decisions.key(date, 'from_title') == 'LaudumsejmikuwProszowicach'
+        # The fields without strings are not indexed.
+        merge = MergeSectionDecision('Laudum', 3, None, 'Laudum')
+        decisions.add(merge)
+        assert decisions.key(merge, 'preceding_fragm') is None
+        assert decisions.matching([3], ['merge_sections'], 'Laudum') == [merge]
+
+    def test_title_decisions(self):
+        first_form = TitleFormDecision('Laudum drugie', 'Laudum pierwsze', 0)
+        second_form = TitleFormDecision('Laudum trzecie', 'Laudum drugie', 0)
+        date = DateDecision((12, 5, 1650), 'Laudum trzecie', 1)
+        decisions = DecisionIndex([second_form, first_form, date])
+        pages_paragraphs = [(0, 'Laudum pierwsze'), (1, 'koniec')]
+        applied = []
+        for decision in decisions.title_decisions([0, 1], ['title_form', 'date'], pages_paragraphs):
+            applied.append(decision)
+            if decision.decision_type == 'title_form':
+                pages_paragraphs[0] = (pages_paragraphs[0][0], decision.to_title)
+        # The second title form decision precedes the first one on the page, so it is skipped.
+        assert applied == [first_form]
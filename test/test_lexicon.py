@@ -0,0 +1,42 @@
+import io
+
+from popbot_src.binary_corpus import load_binary_corpus, write_binary_corpus
+from popbot_src.indexing_common import load_indexed
+from popbot_src.lexicon import Lexicon, open_lexicon
+from popbot_src.section import Section
+from popbot_src.token_store import TokenStore
+
+config = { 'book_title': 'book', 'palatinate': 'A', 'default_convent_author': 'someone',
+           'convent_location': 'nowhere' }
+
+class TestLexicon():
+    def test_ids(self, tmp_path):
+        lexicon = Lexicon(str(tmp_path / 'lexicon'))
+        assert lexicon.id('forms', 'rady') == 0 and lexicon.id('lemmas', 'rada') == 0
+        assert list(lexicon.ids('forms', ['sejm', 'rady', ''])) == [1, 0, 2]
+        assert lexicon.find('forms', 'sejmik') == -1 and lexicon.find('tags', 'subst') == -1
+        assert lexicon.strings('forms', [2, 1]) == ['', 'sejm']
+        lexicon.save()
+        lexicon.id('forms', 'sejmik')
+        lexicon.save()
+        # The ids are the same when the lexicon is loaded again.
+        loaded_lexicon = Lexicon(str(tmp_path / 'lexicon'))
+        assert loaded_lexicon.forms == ['rady', 'sejm', '', 'sejmik']
+        assert loaded_lexicon.lemmas == ['rada'] and loaded_lexicon.tags == []
+        assert open_lexicon(str(tmp_path / 'lexicon')) is open_lexicon(str(tmp_path / 'lexicon'))
+
+    def test_shared_by_corpora(self, tmp_path):
+        lexicon_path = str(tmp_path / 'lexicon')
+        for corpus_n, paragraph in enumerate(['rady:rada:subst:pl:nom:f sejm:sejm:subst:sg:nom:m3\n',
+                'sejmik:sejmik:subst:sg:nom:m3 rady:rada:subst:pl:nom:f\n']):
+            section = Section.new(config, 'document', [(1, paragraph)])
+            section.inbook_section_id = 0
+            sections = load_indexed(io.StringIO('\n'.join(section.row_strings()) + '\n'))
+            write_binary_corpus(sections, str(tmp_path / str(corpus_n)), lexicon_path=lexicon_path)
+        stores = [load_binary_corpus(str(tmp_path / str(corpus_n)))[0].token_store
+                for corpus_n in range(2)]
+        assert stores[0].lexicon is stores[1].lexicon is open_lexicon(lexicon_path)
+        assert list(stores[1].form_ids) == [2, 0]
+        store = TokenStore.concatenated(stores)
+        assert store.lexicon is open_lexicon(lexicon_path)
+        assert list(store.form_ids) == [0, 1, 2, 0]
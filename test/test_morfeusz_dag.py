@@ -0,0 +1,94 @@
+from popbot_src.morfeusz_dag import FormCachedAnalyzer, MorfeuszDAG
+
+class StubMorfeusz():
+    """
+    Analyse the text like Morfeusz would, given whitespace-delimited words: the final dot is a
+    separate segment, and "Ichmść" has two interpretations.
+    """
+    def __init__(self):
+        self.analysed_texts = []
+
+    def analyse(self, text):
+        self.analysed_texts.append(text)
+        output = []
+        node = 0
+        for word in text.split():
+            dot = word.endswith('.') and len(word) > 1
+            if dot:
+                word = word[:-1]
+            output.append((node, node+1, (word, word.lower(), 'subst:sg:nom:m1', [], [])))
+            if word == 'Ichmść':
+                output.append((node, node+1, (word, 'ichmość', 'subst:pl:nom:m1', [], [])))
+            node += 1
+            if dot:
+                output.append((node, node+1, ('.', '.', 'interp', [], [])))
+                node += 1
+        return output
+
+def dag_row(start, end, form, lemma, tag, weight, eos=False):
+    return '\t'.join([str(start), str(end), form, lemma, tag, '', '', weight, '',
+        'eos' if eos else '', '']) + '\r\n'
+
+class TestMorfeuszDAG():
+    def test_form_cached_analyzer(self):
+        text = 'Ichmść panowie zgoda. Ichmść\nzgoda. Ichmść panowie.'
+        analyzer = FormCachedAnalyzer(StubMorfeusz())
+        assert analyzer.analyse(text) == StubMorfeusz().analyse(text)
+        positions = analyzer.analyse_dag(text).positions()
+        assert [[variant[:5] for variant in position] for position in positions[:4]] == [
+                [['0', '1', 'Ichmść', 'ichmść', 'subst:sg:nom:m1'],
+                    ['0', '1', 'Ichmść', 'ichmość', 'subst:pl:nom:m1']],
+                [['1', '2', 'panowie', 'panowie', 'subst:sg:nom:m1']],
+                [['2', '3', 'zgoda', 'zgoda', 'subst:sg:nom:m1']],
+                [['3', '4', '.', '.', 'interp']]]
+        assert [position[0][:3] for position in positions[4:]] == [['4', '5', 'Ichmść'],
+                ['5', '6', 'zgoda'], ['6', '7', '.'], ['7', '8', 'Ichmść'],
+                ['8', '9', 'panowie'], ['9', '10', '.']]
+        # Each word form is analysed once, also in the second pass.
+        assert sorted(analyzer.analyzer.analysed_texts) == sorted(
+                ['Ichmść', 'panowie', 'zgoda.', 'panowie.'])
+        assert analyzer.misses == 4
+        assert analyzer.hits == 2 * 7 - 4
+
+    def test_form_cache_limit(self):
+        analyzer = FormCachedAnalyzer(StubMorfeusz(), max_forms=2)
+        analyzer.analyse_dag('a b a c a')
+        assert list(analyzer.fragments) == ['c', 'a']
+        analyzer.analyse_dag('b')
+        assert analyzer.misses == 4
+
+    def test_dag_string(self):
+        # A form that has to be quoted in the DAG.
+        dag = MorfeuszDAG.from_morfeusz(StubMorfeusz().analyse('Ichmść "panowie". Zgoda.'))
+        assert dag.sentence_bounds() == [(0, 3), (3, 5)]
+        assert dag.dag_string(dag.sentence_bounds()) == ''.join([
+            dag_row(0, 1, 'Ichmść', 'ichmść', 'subst:sg:nom:m1', '0.5'),
+            dag_row(0, 1, 'Ichmść', 'ichmość', 'subst:pl:nom:m1', '0.5'),
+            dag_row(1, 2, '"""panowie"""', '"""panowie"""', 'subst:sg:nom:m1', '1.0'),
+            dag_row(2, 3, '.', '.', 'interp', '1.0', eos=True),
+            '\n',
+            dag_row(3, 4, 'Zgoda', 'zgoda', 'subst:sg:nom:m1', '1.0'),
+            dag_row(4, 5, '.', '.', 'interp', '1.0', eos=True),
+            '\n'])
+        assert dag.dag_string([(3, 5)], node_offset=-3) == ''.join([
+            dag_row(0, 1, 'Zgoda', 'zgoda', 'subst:sg:nom:m1', '1.0'),
+            dag_row(1, 2, '.', '.', 'interp', '1.0', eos=True),
+            '\n'])
+
+    def test_sentence_bounds(self):
+        # The dot after an abbreviation doesn't end the sentence.
+        dag = MorfeuszDAG.from_morfeusz([(0, 1, ('woj', 'województwo', 'brev:pun', [], [])),
+            (1, 2, ('.', '.', 'interp', [], [])),
+            (2, 3, ('krakowskie', 'krakowski', 'adj', [], [])),
+            (3, 4, ('.', '.', 'interp', [], [])), (4, 5, ('Zgoda', 'zgoda', 'subst', [], []))])
+        assert dag.sentence_bounds() == [(0, 4), (4, 5)]
+
+    def test_position_order(self):
+        # The positions are sorted by their start and end nodes, also past 1000 nodes.
+        dag = MorfeuszDAG.from_morfeusz([(1, 2, ('b', 'b', 'ign', [], [])),
+            (1000, 1001, ('d', 'd', 'ign', [], [])), (0, 1500, ('a', 'a', 'ign', [], [])),
+            (0, 1, ('a', 'a', 'ign', [], [])), (999, 1000, ('c', 'c', 'ign', [], []))])
+        assert list(zip(dag.starts, dag.ends)) == [(0, 1), (0, 1500), (1, 2), (999, 1000),
+                (1000, 1001)]
+        assert dag.forms == ['a', 'a', 'b', 'c', 'd']
+        assert dag.nodes_count() == 1500
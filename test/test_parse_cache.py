@@ -0,0 +1,69 @@
+from popbot_src.parse_cache import ParseCache
+
+BASE_CONFIG = { 'morfeusz_model_dir': 'korba', 'morfeusz_model': 'korbeusz',
+                'concraft_model': 'korba/model.gz' }
+
+class TestParseCache():
+    def test_parse_through(self, tmp_path):
+        parsed = []
+        def parse_misses(paragraphs):
+            for paragraph in paragraphs:
+                parsed.append(paragraph)
+                yield paragraph.split()
+        cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 2500)
+        paragraphs = ['My rady', 'i rycerstwo', 'My rady', 'województwa']
+        results = list(cache.parse_through(paragraphs, 'parse_sentences', parse_misses))
+        assert results == [['My', 'rady'], ['i', 'rycerstwo'], ['My', 'rady'], ['województwa']]
+        # The repeated paragraph is parsed only once.
+        assert parsed == ['My rady', 'i rycerstwo', 'województwa']
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.close()
+        # The results persist, and only new paragraphs are parsed (the results depend on the
+        # exact whitespace).
+        parsed.clear()
+        cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 2500)
+        results = list(cache.parse_through(['My rady', 'My  rady', 'ziemi'], 'parse_sentences',
+            parse_misses))
+        assert results == [['My', 'rady'], ['My', 'rady'], ['ziemi']]
+        assert parsed == ['My  rady', 'ziemi']
+        # Other chunking settings or parsing functions do not share the entries.
+        other_cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 1000)
+        assert not other_cache.key('My rady', 'parse_sentences') in cache
+        assert not cache.key('My rady', 'tokens_paths') in cache
+        other_cache.close()
+        cache.close()
+
+    def test_periodic_commits(self, tmp_path):
+        cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 2500, commit_every=2)
+        results = cache.parse_through(['a', 'b', 'c'], 'parse_sentences',
+            lambda paragraphs: ([p] for p in paragraphs))
+        next(results), next(results)
+        # The run is interrupted after two results: they are already committed.
+        reopened_cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 2500)
+        assert reopened_cache.key('b', 'parse_sentences') in reopened_cache
+        assert not reopened_cache.key('c', 'parse_sentences') in reopened_cache
+        reopened_cache.close()
+        cache.close()
+
+    def test_eviction(self, tmp_path):
+        # The cache is kept within max_size also during a run, but the entries still to be read
+        # are not evicted.
+        cache = ParseCache(str(tmp_path / 'cache.sqlite'), BASE_CONFIG, 2500, max_size=0,
+                commit_every=1)
+        parsed = []
+        def parse_misses(paragraphs):
+            # Read all the paragraphs before giving the results.
+            parsed.extend(paragraphs)
+            return [[p] for p in parsed]
+        results = list(cache.parse_through(['a', 'b', 'a', 'c'], 'parse_sentences', parse_misses))
+        assert results == [['a'], ['b'], ['a'], ['c']]
+        assert parsed == ['a', 'b', 'c']
+        assert cache.size() == 0 and cache.evictions == 3
+        cache.max_size = 10**6
+        list(cache.parse_through(['a', 'b'], 'parse_sentences',
+            lambda paragraphs: ([p] for p in paragraphs)))
+        cache.max_size = cache.size() // 2
+        cache.evict()
+        assert not cache.key('a', 'parse_sentences') in cache
+        assert cache.key('b', 'parse_sentences') in cache
+        cache.close()
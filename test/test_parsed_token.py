@@ -0,0 +1,30 @@
+import pickle
+
+from popbot_src.parsed_token import ParsedToken
+
+class TestParsedToken():
+    def test_from_str(self):
+        token = ParsedToken.from_str('PN_Krakowskiego:krakowski:adj:sg:gen:n:pos')
+        assert token.proper_name and not token.unknown_form
+        assert (token.form, token.lemma) == ('Krakowskiego', 'krakowski')
+        assert token.interp_str() == 'adj:sg:gen:n:pos'
+        assert repr(token) == 'PN_Krakowskiego:krakowski:adj:sg:gen:n:pos'
+        assert repr(ParsedToken.from_str('??_Xyz:Xyz:ign')) == '??_Xyz:Xyz:ign'
+
+    def test_shared_values(self):
+        token1 = ParsedToken.from_str('rady:rada:subst:pl:nom:f')
+        token2 = ParsedToken('rady', 'rada', ['subst', 'pl', 'nom', 'f'])
+        assert token1.interp is token2.interp
+        assert token1.form is token2.form
+        assert 'nom' in token1.interp
+        assert not hasattr(token1, '__dict__')
+
+    def test_forward_paths(self):
+        token1 = ParsedToken('a', 'a', 'a')
+        token2 = ParsedToken('b', 'b', 'b')
+        assert token1.following_tokens is None
+        assert token1.forward_paths == []
+        token1.forward_paths.append(token2)
+        assert token1.forward_paths == [token2]
+        token1_copy, token2_copy = pickle.loads(pickle.dumps([token1, token2]))
+        assert token1_copy.forward_paths[0] is token2_copy
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+import pytest
+
+pytest.importorskip('morfeusz2')
+
+from popbot_src import parsing
+from popbot_src.concraft import parse_concraft_output
+from test.test_morfeusz_dag import StubMorfeusz
+
+def stub_tagger(dag_str):
+    """Tag the DAG with the first variant of each position, like Concraft would, but give nothing
+    back for the sentences with "Nic"."""
+    tagged_lines = []
+    for sent_dag in dag_str.split('\n\n'):
+        rows = [line.split('\t') for line in sent_dag.split('\n') if line]
+        if any([row[2] == 'Nic' for row in rows]):
+            continue
+        decided_positions = set()
+        for row in rows:
+            disamb = 'disamb' if not (row[0], row[1]) in decided_positions else ''
+            decided_positions.add((row[0], row[1]))
+            tagged_lines.append('\t'.join(row[:5] + ['', '', '0.5', '', '', '', disamb]))
+        tagged_lines.append('')
+    return parse_concraft_output('\n'.join(tagged_lines))
+
+class TestParseSentencesBatch():
+    def test_untagged_repeated_sentence(self, monkeypatch):
+        monkeypatch.setattr(parsing, 'morfeusz_analyzer', lambda base_config: StubMorfeusz())
+        monkeypatch.setattr(parsing, 'tagging_stages',
+                lambda base_config: [('tagging', stub_tagger)])
+        monkeypatch.setattr(parsing, 'tagged_sentences', OrderedDict())
+        # The first "Nic." is sent to the tagger, which returns no tokens for it, and the second
+        # one is left empty too.
+        results = parsing.parse_sentences_batch(['Nic. Zgoda panowie.', 'Nic. Zgoda.'],
+                base_config={ 'concraft_model': 'model.gz' })
+        assert [[[token.form for token in sent] for sent in sents] for sents in results] == [
+                [['Zgoda', 'panowie', '.']], [['Zgoda', '.']]]
+        assert [token.position for token in results[1][0]] == [2, 3]
@@ -0,0 +1,46 @@
+import random
+
+from popbot_src.morfeusz_dag import MorfeuszDAG
+from popbot_src.perceptron import PerceptronTagger
+
+LEXICON = { 'Ala': ['subst:sg:nom:f'], 'kot': ['subst:sg:nom:m2', 'subst:sg:acc:m2'],
+        'ma': ['fin:sg:ter:imperf', 'subst:sg:nom:f'], 'psa': ['subst:sg:gen:m2', 'subst:sg:acc:m2'],
+        '.': ['interp'] }
+
+def example_sentence(rand):
+    "Return a DAG and gold tokens, where the case of the noun depends on its place."
+    words = [rand.choice(['Ala', 'kot']), 'ma', rand.choice(['kot', 'psa']), '.', 'Xyz']
+    gold_tags = [LEXICON[words[0]][0], 'fin:sg:ter:imperf', 'subst:sg:acc:m2', 'interp',
+            'subst:sg:nom:m3']
+    morfeusz_output = [(word_n, word_n+1, (word, word.lower(), tag, [], []))
+            for (word_n, word) in enumerate(words[:-1]) for tag in LEXICON[word]]
+    # A form unknown to Morfeusz.
+    morfeusz_output.append((4, 5, ('Xyz', 'Xyz', 'ign', [], [])))
+    return (MorfeuszDAG.from_morfeusz(morfeusz_output),
+            [(word, word.lower(), tag) for (word, tag) in zip(words, gold_tags)])
+
+class TestPerceptron():
+    def test_train_and_tag(self, tmp_path):
+        rand = random.Random(0)
+        training_sents = [example_sentence(rand) for sent_n in range(50)]
+        tagger = PerceptronTagger.train(training_sents, epochs=3, n_features=2**12)
+        assert tagger.guess_tags == ['subst:sg:nom:m3']
+        # The model can be saved and loaded also without the extension.
+        tagger.save(str(tmp_path / 'model'))
+        assert (tmp_path / 'model.npz').exists()
+        tagger = PerceptronTagger.load(str(tmp_path / 'model'))
+        assert PerceptronTagger.load(str(tmp_path / 'model.npz')).tags == tagger.tags
+        # Tag the held out sentences together, in one DAG.
+        held_out_dag = MorfeuszDAG()
+        sentence_bounds, gold_sents = [], []
+        for sent_n in range(10):
+            morfeusz_dag, gold_tokens = example_sentence(rand)
+            first = len(held_out_dag)
+            held_out_dag.extend(morfeusz_dag, node_offset=held_out_dag.nodes_count())
+            sentence_bounds.append((first, len(held_out_dag)))
+            gold_sents.append(gold_tokens)
+        sents = tagger.tag(held_out_dag, sentence_bounds)
+        assert [[(t.form, t.interp_str()) for t in sent] for sent in sents] == [
+                [(form, tag) for (form, lemma, tag) in gold_tokens] for gold_tokens in gold_sents]
+        assert sents[1][0].position == 5 and sents[1][0].sentence_starting
+        assert sents[1][0].forward_paths == [sents[1][1]]
@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+from popbot_src.pipeline import pipelined
+
+class TestPipeline():
+    def test_pipelined(self):
+        for threaded in [True, False]:
+            timings = dict()
+            results = list(pipelined(range(50), [('double', lambda x: 2*x),
+                ('increment', lambda x: x+1)], threaded=threaded, timings=timings))
+            assert results == [2*x+1 for x in range(50)]
+            assert sorted(timings) == ['double', 'increment', 'source']
+            assert [items_count for (seconds, items_count) in timings.values()] == [50, 50, 50]
+
+    def test_pipelined_errors(self):
+        def failing(x):
+            if x == 5:
+                raise RuntimeError('failed on 5')
+            return x
+        with pytest.raises(RuntimeError):
+            list(pipelined(range(10), [('failing', failing), ('same', lambda x: x)]))
+        # Closing the pipeline early stops its threads, also with an endless source.
+        def endless():
+            while True:
+                yield 1
+        threads_count = threading.active_count()
+        results = pipelined(endless(), [('same', lambda x: x)])
+        assert next(results) == 1
+        results.close()
+        assert threading.active_count() == threads_count
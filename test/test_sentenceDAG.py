@@ -44,3 +44,30 @@ class TestSentenceDAG():
                [token2, token3, token4],
                [token2, token3, token5]]
        assert test_sent3.token_positions() == [[token1, token2], token3, [token4, token5]]
+
+    def test_many_paths(self):
+        # Sixty positions with two alternatives each, joined by common tokens.
+        tokens = [ParsedToken('s', 's', 's', sentence_starting=True)]
+        for position_n in range(60):
+            alternative1 = ParsedToken('a{}'.format(position_n), 'a', 'a')
+            alternative2 = ParsedToken('b{}'.format(position_n), 'b', 'b')
+            common_token = ParsedToken('c{}'.format(position_n), 'c', 'c')
+            tokens[-1].forward_paths = [alternative1, alternative2]
+            alternative1.forward_paths = [common_token]
+            alternative2.forward_paths = [common_token]
+            tokens += [alternative1, alternative2, common_token]
+        sent = SentenceDAG(tokens)
+        assert sent.count_paths() == 2**60
+        paths = sent.iter_paths()
+        assert [t.form for t in next(paths)][:4] == ['s', 'a0', 'c0', 'a1']
+        assert [t.form for t in next(paths)][-3:] == ['c58', 'b59', 'c59']
+        positions = sent.token_positions()
+        assert len(positions) == 121 and positions[1] == [tokens[1], tokens[2]]
+        # Prefer the b alternatives, and the a one after c10.
+        path, score = sent.best_path(lambda token: 1 if token.lemma == 'b' else 0,
+                lambda token, next_token: 5 if (token.form, next_token.form) == ('c10', 'a11')
+                else 0)
+        assert score == 64
+        assert [t.form for t in path][:4] == ['s', 'b0', 'c0', 'b1']
+        assert [t.form for t in path][22:26] == ['c10', 'a11', 'c11', 'b12']
+        assert SentenceDAG().best_path(lambda token: 0) == (None, None)
@@ -0,0 +1,21 @@
+import re
+
+from popbot_src.load_helpers import SignMatcher, heading_signs_2ord, meta_signs, uncaptured_pattern
+
+def test_uncaptured_pattern():
+    assert (uncaptured_pattern('(a)|(?:b)|(?P<c>c)|\\(d\\)|[(]e[^(]|[]()]f')
+            == '(?:a)|(?:b)|(?P<c>c)|\\(d\\)|[(]e[^(]|[]()]f')
+
+def test_sign_matcher():
+    title_signs = [re.compile('Laudu?m?a?'), re.compile('Artyk')]
+    matcher = SignMatcher({ 'meta': meta_signs, 'titles': title_signs,
+        'heading_2ord': heading_signs_2ord, 'more_titles': title_signs[:1] }, kept_paragraphs=2)
+    # The shared signs are compiled once.
+    assert len(matcher.patterns) == len(meta_signs) + 2 + len(set(heading_signs_2ord))
+    paragraphs = ['Laudum sejmiku województwa, str. 5', 'Rp. 1-2', 'Artykuły pierwsze']
+    for paragraph in paragraphs:
+        for family, signs in [('meta', meta_signs), ('titles', title_signs),
+                ('heading_2ord', heading_signs_2ord), ('more_titles', title_signs[:1])]:
+            assert matcher.hits(paragraph, family) == [sign.search(paragraph) is not None
+                    for sign in signs]
+    assert list(matcher.paragraph_hits) == paragraphs[1:]
@@ -0,0 +1,69 @@
+import pytest
+
+from popbot_src.parsed_token import ParsedToken
+from popbot_src.section import Section
+from popbot_src.token_store import (
+        UNKNOWN_FORM, PROPER_NAME, TokenStore, decode_paragraphs, sections_store, token_flags
+        )
+
+config = { 'book_title': 'book', 'palatinate': 'A', 'default_convent_author': 'someone',
+           'convent_location': 'nowhere' }
+
+class TestTokenStore():
+    def test_from_sections(self):
+        section1 = Section.new(config, 'document', [(1, 'Tytuł:tytuł:subst:sg:nom:m3'),
+            (2, 'PN_Krakowskiego:krakowski:adj:sg:gen:n:pos ??_Xyz:Xyz:ign\nrady:rada:subst:pl:nom:f')])
+        section2 = Section.new(config, 'document', [(3, 'rady:rada:subst:pl:nom:f  ')])
+        store = TokenStore.from_sections([section1, section2])
+        assert len(store) == 5
+        assert list(store.section_offsets) == [0, 2, 3]
+        assert list(store.paragraph_offsets) == [0, 1, 4, 5]
+        assert list(store.sentence_offsets) == [0, 1, 3, 4, 5]
+        assert list(store.paragraph_pages) == [1, 2, 3]
+        assert store.form_ids[3] == store.form_ids[4]
+        assert store.flags[1] == PROPER_NAME and store.flags[2] == UNKNOWN_FORM
+        assert repr(store.token(1)) == 'PN_Krakowskiego:krakowski:adj:sg:gen:n:pos'
+        assert store.section_range(0, skip_title=True) == (1, 4)
+        assert list(store.token_indices([1, 0], skip_title=True)) == [1, 2, 3]
+        assert store.lexicon.strings('lemmas', store.lemma_ids[[3, 0]]) == ['rada', 'tytuł']
+        assert list(store.tags_with('sg')[store.tag_ids]) == [True, True, False, False, False]
+        # The sections are found in their store.
+        assert sections_store([section2, section1]) == (store, [1, 0])
+        assert sections_store([section2])[0] is store
+
+    def test_undecodable_paragraphs(self):
+        section1 = Section.new(config, 'document', [(1, 'Tytuł:tytuł:subst:sg:nom:m3'),
+            (1, 'Akta sejmiku')])
+        section2 = Section.new(config, 'document', [(2, 'rady:rada:subst:pl:nom:f')])
+        with pytest.raises(IndexError):
+            TokenStore.from_sections([section1, section2])
+        store = TokenStore.from_sections([section1, section2], skip_undecodable=True)
+        assert store.undecodable_paragraphs == [1]
+        assert list(store.paragraph_offsets) == [0, 1, 1, 2]
+        joined_store = TokenStore.concatenated([store, store])
+        assert joined_store.undecodable_paragraphs == [1, 4]
+
+    def test_decode_paragraphs(self):
+        paragraphs = ['PN_Krakowskiego:krakowski:adj:sg:gen:n:pos ??_Xyz:Xyz:ign\n'
+            'LA_PN_et:et:conj !!_??_a_b:a_b:subst x:y: :y:z:w\n\n',
+            '', ' PN_:a:b a_PN:c:d x:y\x1ez:w:v\n ,:,:interp']
+        forms, lemmas, tags, flags, sentence_offsets, paragraph_offsets, undecodable = \
+            decode_paragraphs(paragraphs)
+        tokens = [ParsedToken.from_str(token_str) for paragraph in paragraphs
+                for token_str in paragraph.split()]
+        assert forms == [token.form for token in tokens]
+        assert lemmas == [token.lemma for token in tokens]
+        assert tags == [token.interp_str() for token in tokens]
+        assert flags == [token_flags(token) for token in tokens]
+        assert sentence_offsets == [0, 2, 6, 10, 11]
+        assert paragraph_offsets == [0, 6, 6, 11]
+        assert undecodable == []
+        # Tokens without lemmas and interps leave their paragraphs empty.
+        with pytest.raises(IndexError):
+            decode_paragraphs(['a:b:c', 'Akta sejmiku'])
+        forms, lemmas, tags, flags, sentence_offsets, paragraph_offsets, undecodable = \
+            decode_paragraphs(['a:b:c\nd:e:f', 'g:h:i Akta\nj:k:l', 'm:n:o'], skip_undecodable=True)
+        assert forms == ['a', 'd', 'm']
+        assert sentence_offsets == [0, 1, 2, 3]
+        assert paragraph_offsets == [0, 2, 2, 3]
+        assert undecodable == [1]
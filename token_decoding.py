@@ -0,0 +1,36 @@
+import argparse
+import time
+
+from popbot_src.indexing_common import load_sections
+from popbot_src.parsed_token import ParsedToken
+from popbot_src.token_store import decode_paragraphs
+
+argparser = argparse.ArgumentParser(description='Compare the time of decoding the tokens of a parsed'
+        ' (with Morfeusz & Concraft) edition one by one with ParsedToken.from_str and with'
+        ' decode_paragraphs.')
+argparser.add_argument('indexed_file_path', help='The csv file or the binary corpus directory.')
+argparser.add_argument('--repeats', type=int, default=3, help='Take the best time of this many runs.')
+
+args = argparser.parse_args()
+
+paragraphs = [par for sec in load_sections(args.indexed_file_path) if sec.section_type == 'document'
+        for (pg, par) in sec.pages_paragraphs]
+
+def decode_one_by_one():
+    return [ParsedToken.from_str(t) for par in paragraphs for t in par.split()]
+
+def decode_together():
+    return decode_paragraphs(paragraphs)
+
+for name, decode in [('from_str', decode_one_by_one), ('decode_paragraphs', decode_together)]:
+    times = []
+    for repeat_n in range(args.repeats):
+        start_time = time.perf_counter()
+        decode()
+        times.append(time.perf_counter() - start_time)
+    print('{}: {:.3f} s'.format(name, min(times)))
+tokens = decode_one_by_one()
+if decode_together()[:3] != ([t.form for t in tokens], [t.lemma for t in tokens],
+        [t.interp_str() for t in tokens]):
+    print('The decoded tokens differ!')
+print('{} tokens in {} paragraphs.'.format(len(tokens), len(paragraphs)))
@@ -0,0 +1,24 @@
+import argparse
+import tracemalloc
+
+from popbot_src.indexing_common import load_indexed
+from popbot_src.parsed_token import ParsedToken
+
+argparser = argparse.ArgumentParser(description='Measure the memory taken by the ParsedToken objects'
+        ' of a parsed (with Morfeusz & Concraft) csv edition file, as search.py makes them.')
+argparser.add_argument('indexed_file_path')
+
+args = argparser.parse_args()
+
+with open(args.indexed_file_path) as indexed_file:
+    paragraphs = [par for sec in load_indexed(indexed_file) if sec.section_type == 'document'
+            for (pg, par) in sec.pages_paragraphs]
+
+tracemalloc.start()
+tokens = [ParsedToken.from_str(t) for par in paragraphs for t in par.strip().split()]
+tokens_memory, peak_memory = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+print('{} tokens take {:.1f} MB, {:.1f} bytes per token (peak {:.1f} MB).'.format(
+    len(tokens), tokens_memory / 1024**2, tokens_memory / max(len(tokens), 1),
+    peak_memory / 1024**2))
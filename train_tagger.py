@@ -0,0 +1,102 @@
+import argparse
+import difflib
+import time
+
+from popbot_src.indexing_common import load_indexed
+from popbot_src.morfeusz_dag import MorfeuszDAG, analysed_dag
+from popbot_src.parsed_token import ParsedToken
+from popbot_src.parsing import (
+        init_analyzers, morfeusz_analyzer, read_base_config, release_analyzers, tag_dag
+        )
+from popbot_src.perceptron import PerceptronTagger
+
+argparser = argparse.ArgumentParser(description='Train the perceptron tagger (used by morpho.py'
+        ' --perceptron_model) on a list of csv edition files, parsed with Morfeusz & Concraft, and'
+        ' compare it with Concraft on the held out sections. The parsed files keep only the'
+        ' segments, not the original text, so the DAGs are made from the gold segments joined with'
+        ' spaces. Tokens glued in the text (such as "1572r." or punctuation after words) are then'
+        ' analysed apart, so the training and the accuracies are on the gold segmentation, not the'
+        ' one that morpho.py gives the tagger, and they do not measure the tagging of real text.')
+argparser.add_argument('file_list_path')
+argparser.add_argument('model_path')
+argparser.add_argument('--epochs', type=int, default=5)
+argparser.add_argument('--feature_bits', type=int, default=20,
+        help='The number of features is 2 to this power.')
+argparser.add_argument('--guess_tags', type=int, default=30,
+        help='How many tags are tried for the forms unknown to Morfeusz.')
+argparser.add_argument('--held_out', type=float, default=0.1,
+        help='The fraction of sections (from the end of each file) left out for evaluation.')
+argparser.add_argument('--compare_concraft', action='store_true',
+        help='Also run Concraft on the held out sentences, to compare the speed and accuracy.')
+
+args = argparser.parse_args()
+
+def section_sentences(section):
+    "Yield the sentences of a tagged section as lists of (form, lemma, interp) triples."
+    for (page, paragraph) in section.pages_paragraphs:
+        for line in paragraph.split('\n'):
+            tokens = [ParsedToken.from_str(token_str) for token_str in line.split(' ')
+                    if token_str.strip() != '']
+            if tokens:
+                yield [(token.form, token.lemma, token.interp_str()) for token in tokens]
+
+def accuracy(gold_sents, tagged_sents):
+    "Return the fraction of the gold tokens found in the tagged sentences, in their order."
+    gold_tokens = ['{}:{}'.format(form, interp) for sent in gold_sents
+            for (form, lemma, interp) in sent]
+    tagged_tokens = ['{}:{}'.format(token.form, token.interp_str()) for sent in tagged_sents
+            for token in sent]
+    matcher = difflib.SequenceMatcher(a=gold_tokens, b=tagged_tokens, autojunk=False)
+    return sum([block.size for block in matcher.get_matching_blocks()]) / len(gold_tokens)
+
+base_config = init_analyzers()
+analyzer = morfeusz_analyzer(base_config)
+
+training_sents, held_out_sents = [], []
+with open(args.file_list_path) as list_file:
+    for file_path in list_file.readlines():
+        file_path = file_path.strip()
+        with open(file_path) as indexed_file:
+            sections = [sec for sec in load_indexed(indexed_file)
+                    if sec.section_type == 'document']
+        held_out_start = len(sections) - int(len(sections) * args.held_out)
+        for section_n, section in enumerate(sections):
+            for gold_tokens in section_sentences(section):
+                # Analyse the tokens separately, so their segments can be found in the DAG. (This
+                # is not the segmentation of the original text: the glued tokens come apart.)
+                morfeusz_dag = analysed_dag(analyzer,
+                        ' '.join([form for (form, lemma, interp) in gold_tokens]))
+                if section_n < held_out_start:
+                    training_sents.append((morfeusz_dag, gold_tokens))
+                else:
+                    held_out_sents.append((morfeusz_dag, gold_tokens))
+
+tagger = PerceptronTagger.train(training_sents, epochs=args.epochs,
+        n_features=2**args.feature_bits, guess_tags_count=args.guess_tags, verbose=True)
+tagger.save(args.model_path)
+
+if held_out_sents:
+    # Put the held out sentences in one DAG, to tag them in one batch.
+    held_out_dag = MorfeuszDAG()
+    sentence_bounds = []
+    for morfeusz_dag, gold_tokens in held_out_sents:
+        first = len(held_out_dag)
+        held_out_dag.extend(morfeusz_dag, node_offset=held_out_dag.nodes_count())
+        sentence_bounds.append((first, len(held_out_dag)))
+    gold_sents = [gold_tokens for (morfeusz_dag, gold_tokens) in held_out_sents]
+    tokens_count = sum([len(gold_tokens) for gold_tokens in gold_sents])
+
+    start_time = time.time()
+    tagged_sents = tagger.tag(held_out_dag, sentence_bounds)
+    seconds = time.time() - start_time
+    print('Perceptron: accuracy {:.4f} (on the gold segmentation), {:.0f} tokens per'
+            ' second.'.format(accuracy(gold_sents, tagged_sents), tokens_count / seconds))
+
+    if args.compare_concraft:
+        start_time = time.time()
+        tagged_sents = tag_dag(base_config, held_out_dag.dag_string(sentence_bounds))
+        seconds = time.time() - start_time
+        print('Concraft: accuracy {:.4f} (on the gold segmentation), {:.0f} tokens per'
+                ' second.'.format(accuracy(gold_sents, tagged_sents), tokens_count / seconds))
+
+release_analyzers()